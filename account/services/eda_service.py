@@ -4,13 +4,10 @@ service: EDAの集計・整形（DBアクセス含む）をするところ
 - views.py は「入力取得 → service呼び出し → render」だけにする
 """
 
-import re
 from typing import Any
 
-from django.db.models import Count, Sum, Q
-from transactions.models import Transaction
-
-from account.utils.date_utils import yyyymm_key
+from transactions.billing_month import month_label
+from transactions.services.month_close_service import MonthRow, month_rows
 
 
 def build_eda_context(*, top_n_categories: int = 8) -> dict[str, Any]:
@@ -18,12 +15,14 @@ def build_eda_context(*, top_n_categories: int = 8) -> dict[str, Any]:
     EDA画面用のcontext一式を返す
     返すキーは views.py の従来と同じ：
       billing_stats, member_cols, member_table, cat_cols, category_table
+    ※ 締めた月はスナップショット、開いている月は月次集計（MonthlyTotal）から読む（month_rows）
     """
-    billing_stats = _build_billing_stats()
+    rows = month_rows()
+    billing_stats = _build_billing_stats(rows)
     months = [x["billing_month"] for x in billing_stats]
 
-    member_cols, member_table = _build_member_table(months)
-    cat_cols, category_table = _build_category_table(months, top_n_categories)
+    member_cols, member_table = _build_member_table(rows, months)
+    cat_cols, category_table = _build_category_table(rows, months, top_n_categories)
 
     return {
         "billing_stats": billing_stats,
@@ -34,36 +33,26 @@ def build_eda_context(*, top_n_categories: int = 8) -> dict[str, Any]:
     }
 
 
-def _build_billing_stats() -> list[dict[str, Any]]:
-    # 請求月（CSVファイル単位）で集計
-    rows = (
-        Transaction.objects
-        .exclude(source_file="")  # 念のため
-        .values("source_file")
-        .annotate(
-            total_count=Count("id"),
-            total_amount=Sum("amount"),
-            unclosed_count=Count("id", filter=Q(is_closed=False)),
-        )
-    )
-
-    rows_sorted = sorted(list(rows), key=lambda r: yyyymm_key(r["source_file"]))
+def _build_billing_stats(rows: list[MonthRow]) -> list[dict[str, Any]]:
+    by_month: dict[str, dict[str, int]] = {}
+    for r in rows:
+        acc = by_month.setdefault(month_label(r.month), {"count": 0, "total": 0, "unclosed": 0})
+        acc["count"] += r.count
+        acc["total"] += r.total
+        if not r.is_closed:
+            acc["unclosed"] += r.count
 
     billing_stats: list[dict[str, Any]] = []
-    for r in rows_sorted:
-        total = int(r["total_count"] or 0)
-        unclosed = int(r["unclosed_count"] or 0)
+    for mo in sorted(by_month):
+        acc = by_month[mo]
+        total = acc["count"]
+        unclosed = acc["unclosed"]
         rate = round((unclosed / total) * 100, 1) if total else 0.0
 
-        sf = r["source_file"] or ""
-        m = re.search(r"(\d{6})", sf)
-        label = m.group(1) if m else sf  # 表示は 202601 に寄せる
-
         billing_stats.append({
-            "billing_month": label,     # "YYYYMM"
-            "source_file": sf,          # 生のファイル名も必要なら使える
+            "billing_month": mo,     # "YYYYMM"
             "count": total,
-            "total": int(r["total_amount"] or 0),
+            "total": acc["total"],
             "unclosed": unclosed,
             "unclosed_rate": rate,
         })
@@ -71,29 +60,19 @@ def _build_billing_stats() -> list[dict[str, Any]]:
     return billing_stats
 
 
-def _build_member_table(months: list[str]) -> tuple[list[str], list[dict[str, Any]]]:
+def _build_member_table(rows: list[MonthRow], months: list[str]) -> tuple[list[str], list[dict[str, Any]]]:
     # ① 請求月 × メンバー 合計（memberがNULLも拾って「未割当」に寄せる）
-    member_rows = (
-        Transaction.objects
-        .exclude(source_file="")
-        .values("source_file", "member__name")
-        .annotate(total=Sum("amount"), count=Count("id"))
-    )
-
     member_order = ["な", "ゆ", "共有", "未割当"]
     member_set = set(member_order)
 
     member_pivot: dict[str, dict[str, int]] = {}
-    for r in member_rows:
-        sf = r["source_file"] or ""
-        m = re.search(r"(\d{6})", sf)
-        month = m.group(1) if m else sf
-
-        name = r["member__name"] or "未割当"
+    for r in rows:
+        month = month_label(r.month)
+        name = r.member or "未割当"
         member_set.add(name)
 
         member_pivot.setdefault(month, {})
-        member_pivot[month][name] = int(r["total"] or 0)
+        member_pivot[month][name] = member_pivot[month].get(name, 0) + r.total
 
     member_cols = member_order + sorted([x for x in member_set if x not in member_order])
 
@@ -111,40 +90,22 @@ def _build_member_table(months: list[str]) -> tuple[list[str], list[dict[str, An
 
 
 def _build_category_table(
+    rows: list[MonthRow],
     months: list[str],
     top_n: int,
 ) -> tuple[list[str], list[dict[str, Any]]]:
     # ② 請求月 × カテゴリ 合計（上位Nカテゴリだけ表示）
-    top_categories = list(
-        Transaction.objects
-        .exclude(source_file="")
-        .exclude(category__isnull=True)
-        .values("category__name")
-        .annotate(total=Sum("amount"))
-        .order_by("-total")[:top_n]
-    )
-    cat_cols = [r["category__name"] for r in top_categories]
-
-    cat_rows = (
-        Transaction.objects
-        .exclude(source_file="")
-        .exclude(category__isnull=True)
-        .values("source_file", "category__name")
-        .annotate(total=Sum("amount"))
-    )
-
     cat_pivot: dict[str, dict[str, int]] = {}
-    for r in cat_rows:
-        sf = r["source_file"] or ""
-        m = re.search(r"(\d{6})", sf)
-        month = m.group(1) if m else sf
-
-        cname = r["category__name"]
-        if cname not in cat_cols:
+    cat_totals: dict[str, int] = {}
+    for r in rows:
+        if r.category is None:
             continue
-
+        month = month_label(r.month)
         cat_pivot.setdefault(month, {})
-        cat_pivot[month][cname] = int(r["total"] or 0)
+        cat_pivot[month][r.category] = cat_pivot[month].get(r.category, 0) + r.total
+        cat_totals[r.category] = cat_totals.get(r.category, 0) + r.total
+
+    cat_cols = sorted(cat_totals, key=lambda c: (-cat_totals[c], c))[:top_n]
 
     category_table: list[dict[str, Any]] = []
     for mo in months:
@@ -14,9 +14,8 @@ Phase1: イベント判定（ルールベース）→ 月タグ付け → 最新
 from __future__ import annotations
 
 from typing import Any
-from django.db.models import Q
-from django.db.models import Max
-from transactions.models import Transaction
+from transactions.billing_month import month_from_label
+from transactions.services.month_close_service import max_single
 
 def _detect_high_single_spike(
     *,
@@ -36,25 +35,8 @@ def _detect_high_single_spike(
     if month_total <= 0:
         return {"is_spike": False, "amount": None, "shop": None}
 
-    exclude_q = Q()
-    for kw in exclude_keywords:
-        exclude_q |= Q(category__name__icontains=kw)
-
-    base_qs = (
-        Transaction.objects
-        .exclude(source_file="")
-        .exclude(category__isnull=True)
-        .exclude(exclude_q)
-        .filter(source_file__startswith=yyyymm)
-    )
-
-    # 単一明細（1件）の最大額（同時にshopも取る）
-    max_row = (
-        base_qs
-        .order_by("-amount")
-        .values("amount", "shop")
-        .first()
-    )
+    # 締めた月はスナップショット、開いている月は明細から
+    max_row = max_single(month_from_label(yyyymm), exclude_keywords=exclude_keywords)
 
     if not max_row:
         return {"is_spike": False, "amount": None, "shop": None}
@@ -1,31 +1,22 @@
 # account/services/home_service.py
+from django.db.models import Max, Min
+
 from transactions.models import Transaction
 
 
 def build_home_context():
-    qs = Transaction.objects.exclude(source_file="")
+    qs = Transaction.objects.filter(import_file__isnull=False)
 
     total_transactions = qs.count()
 
-    source_files = qs.values_list("source_file", flat=True)
-
-    months = []
-    for sf in source_files:
-        sf = (sf or "").strip()
-        yyyymm = sf[:6]
-        if len(yyyymm) == 6 and yyyymm.isdigit():
-            months.append(yyyymm)
-
-    period_start = None
-    period_end = None
+    # 請求月の最初と最後（billing_month のインデックスだけで済む）
+    span = qs.aggregate(start=Min("billing_month"), end=Max("billing_month"))
 
-    if months:
-        months_sorted = sorted(set(months))
-        period_start = f"{months_sorted[0][:4]}-{months_sorted[0][4:6]}"
-        period_end = f"{months_sorted[-1][:4]}-{months_sorted[-1][4:6]}"
+    period_start = f"{span['start']:%Y-%m}" if span["start"] else None
+    period_end = f"{span['end']:%Y-%m}" if span["end"] else None
 
     return {
         "total_transactions": total_transactions,
         "period_start": period_start,
         "period_end": period_end,
-    }
\ No newline at end of file
+    }
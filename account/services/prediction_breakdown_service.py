@@ -1,8 +1,20 @@
 # account\services\prediction_breakdown_service.py
 
 from typing import Any
-from django.db.models import Count, Sum, Q
-from transactions.models import Transaction
+from transactions.billing_month import month_from_label
+from transactions.services.month_close_service import MonthRow, month_rows, shop_totals
+
+
+def _cat_rows(rows: list[MonthRow]) -> list[dict[str, Any]]:
+    """カテゴリ別の合計・件数（合計の大きい順）"""
+    acc: dict[str, list[int]] = {}
+    for r in rows:
+        a = acc.setdefault(r.category, [0, 0])
+        a[0] += r.total
+        a[1] += r.count
+    out = [{"category__name": name, "total": total, "count": n} for name, (total, n) in acc.items()]
+    out.sort(key=lambda x: (-x["total"], x["category__name"]))
+    return out
 
 
 def build_prediction_breakdown_data(
@@ -13,41 +25,21 @@ def build_prediction_breakdown_data(
     month_totals: dict[str, int],
 ) -> dict[str, Any]:
 
-    # 除外Q
-    exclude_q = Q()
-    for kw in exclude_keywords:
-        exclude_q |= Q(category__name__icontains=kw)
-
     if yyyymm not in months_sorted:
         return {"not_found": True}
 
     target_idx = months_sorted.index(yyyymm)
     train_months = months_sorted[:target_idx]
+    target_month = month_from_label(yyyymm)
 
-    # --- 対象月 ---
-    target_qs = (
-        Transaction.objects
-        .exclude(source_file="")
-        .exclude(category__isnull=True)
-        .exclude(exclude_q)
-        .filter(source_file__startswith=yyyymm)
-    )
-
-    total_all = int(target_qs.aggregate(s=Sum("amount"))["s"] or 0)
-
-    cat_rows = (
-        target_qs
-        .values("category__name")
-        .annotate(total=Sum("amount"), count=Count("id"))
-        .order_by("-total")
-    )
+    # 締めた月はスナップショット、開いている月は月次集計 / 明細から（month_close_service）
+    rows = [r for r in month_rows(exclude_keywords=exclude_keywords) if r.category is not None]
 
-    shop_rows = (
-        target_qs
-        .values("shop")
-        .annotate(total=Sum("amount"), count=Count("id"))
-        .order_by("-total")[:8]
-    )
+    # --- 対象月 ---
+    target_rows = [r for r in rows if r.month == target_month]
+    total_all = sum(r.total for r in target_rows)
+    cat_rows = _cat_rows(target_rows)
+    shop_rows = shop_totals(exclude_keywords=exclude_keywords, month=target_month)[:8]
 
     # --- 学習期間 ---
     train_cat_rows = []
@@ -56,33 +48,11 @@ def build_prediction_breakdown_data(
     train_month_totals = []
 
     if train_months:
-        train_q = Q()
-        for mo in train_months:
-            train_q |= Q(source_file__startswith=mo)
-
-        train_qs = (
-            Transaction.objects
-            .exclude(source_file="")
-            .exclude(category__isnull=True)
-            .exclude(exclude_q)
-            .filter(train_q)
-        )
-
-        train_total_all = int(train_qs.aggregate(s=Sum("amount"))["s"] or 0)
-
-        train_cat_rows = (
-            train_qs
-            .values("category__name")
-            .annotate(total=Sum("amount"), count=Count("id"))
-            .order_by("-total")
-        )
-
-        train_shop_rows = (
-            train_qs
-            .values("shop")
-            .annotate(total=Sum("amount"), count=Count("id"))
-            .order_by("-total")[:8]
-        )
+        # 学習期間 = months_sorted（同じ除外条件の系列）で対象月より前の全部
+        train_rows = [r for r in rows if r.month < target_month]
+        train_total_all = sum(r.total for r in train_rows)
+        train_cat_rows = _cat_rows(train_rows)
+        train_shop_rows = shop_totals(exclude_keywords=exclude_keywords, before=target_month)[:8]
 
         for mo in train_months:
             train_month_totals.append({
@@ -5,8 +5,8 @@ service：集計・予測の処理（DBアクセス含む）をするところ
 - 画面(render)やrequestの扱いはしない（viewsの仕事）
 """
 
-from django.db.models import Sum, Q
-from transactions.models import Transaction
+from transactions.billing_month import month_label
+from transactions.services.month_close_service import month_rows
 
 from account.utils.date_utils import yyyymm_add1
 from account.utils.stats_utils import linear_regression
@@ -32,29 +32,14 @@ def build_monthly_series(exclude_keywords: list[str]) -> tuple[list[dict], dict[
       - series: [{"i":0,"billing_month":"202601","total":123}, ...]
       - month_totals: {"202601":123, ...}  （内訳側で使える）
     """
-    exclude_q = Q()
-    for kw in exclude_keywords:
-        exclude_q |= Q(category__name__icontains=kw)
-
-    base = (
-        Transaction.objects
-        .exclude(source_file="")
-        .exclude(category__isnull=True)
-        .exclude(exclude_q)
-    )
-
-    rows = base.values("source_file").annotate(total_amount=Sum("amount"))
-
+    # 請求月ごとの合計（締めた月はスナップショット、開いている月は月次集計から）
     month_totals: dict[str, int] = {}
-    for r in rows:
-        sf = (r["source_file"] or "").strip()
-        # 前提：gold配下CSVは "YYYYMM.csv" 形式（先頭6桁が請求月）
-        mo = sf[:6]  # ★ファイル名先頭がYYYYMM前提
-        if len(mo) != 6 or not mo.isdigit():
-            continue    
-        month_totals[mo] = month_totals.get(mo, 0) + int(r["total_amount"] or 0)
-
-    months_sorted = sorted(month_totals.keys(), key=lambda m: int(m) if (m and m.isdigit()) else -1)
+    for r in month_rows(exclude_keywords=exclude_keywords):
+        if r.category is None:
+            continue
+        mo = month_label(r.month)
+        month_totals[mo] = month_totals.get(mo, 0) + r.total
+    months_sorted = list(month_totals)
 
     series = []
     for i, mo in enumerate(months_sorted):
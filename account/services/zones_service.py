@@ -2,9 +2,8 @@
 
 from typing import Any
 from statistics import median
-from django.db.models import Sum
-from transactions.models import Transaction
-from account.utils.date_utils import yyyymm_label
+from transactions.billing_month import month_label
+from transactions.services.month_close_service import month_rows
 from account.utils.stats_utils import percentile, zone_label
 
 
@@ -16,77 +15,39 @@ def build_zones_context(
     if target_names is None:
         target_names = ["食品・日用品", "外食", "娯楽"]
 
-    # ① source_file一覧
-    sfs = list(
-        Transaction.objects
-        .exclude(source_file="")
-        .values_list("source_file", flat=True)
-        .distinct()
-    )
+    # 締めた月はスナップショット、開いている月は月次集計から
+    rows = month_rows()
 
-    if not sfs:
-        return {"has_data": False}
-
-    # ② YYYYMMで束ねる
-    month_to_sfs: dict[str, list[str]] = {}
-    for sf in sfs:
-        mo = yyyymm_label(sf)
-        if mo:
-            month_to_sfs.setdefault(mo, []).append(sf)
+    # ① 請求月一覧
+    month_dates = sorted({r.month for r in rows})
 
-    months_sorted = sorted(
-        month_to_sfs.keys(),
-        key=lambda m: int(m) if m.isdigit() else -1
-    )
-
-    if not months_sorted:
+    if not month_dates:
         return {"has_data": False}
 
-    # ③ 今月
-    current_month = months_sorted[-1]
-    current_sfs = month_to_sfs[current_month]
-
-    # ④ ベース期間
-    base_months = months_sorted[:-1][-n_base:]
-    base_sfs = []
-    for mo in base_months:
-        base_sfs.extend(month_to_sfs.get(mo, []))
+    # ② 今月
+    current_date = month_dates[-1]
+    current_month = month_label(current_date)
 
-    base_qs = (
-        Transaction.objects
-        .exclude(source_file="")
-        .exclude(category__isnull=True)
-        .filter(category__name__in=target_names)
-    )
-
-    # ⑤ ベースpivot
-    base_rows = (
-        base_qs
-        .filter(source_file__in=base_sfs)
-        .values("source_file", "category__name")
-        .annotate(total=Sum("amount"))
-    )
+    # ③ ベース期間
+    base_dates = month_dates[:-1][-n_base:]
+    base_months = [month_label(d) for d in base_dates]
 
+    # ④ ベースpivot / ⑤ 今月
+    targets = set(target_names)
+    base_set = set(base_dates)
     base_pivot: dict[str, dict[str, int]] = {}
-    for r in base_rows:
-        mo = yyyymm_label(r["source_file"])
-        cat = r["category__name"]
-        base_pivot.setdefault(mo, {})
-        base_pivot[mo][cat] = base_pivot[mo].get(cat, 0) + int(r["total"] or 0)
-
-    # ⑥ 今月
-    cur_rows = (
-        base_qs
-        .filter(source_file__in=current_sfs)
-        .values("category__name")
-        .annotate(total=Sum("amount"))
-    )
-    cur_by_cat = {
-        r["category__name"]: int(r["total"] or 0)
-        for r in cur_rows
-    }
-
-    # ⑦ カード生成
+    cur_by_cat: dict[str, int] = {}
+    for r in rows:
+        if r.category not in targets:
+            continue
+        if r.month == current_date:
+            cur_by_cat[r.category] = cur_by_cat.get(r.category, 0) + r.total
+        elif r.month in base_set:
+            mo = month_label(r.month)
+            base_pivot.setdefault(mo, {})
+            base_pivot[mo][r.category] = base_pivot[mo].get(r.category, 0) + r.total
+
+    # ⑥ カード生成
     cards = []
     for cat in target_names:
         vals = [base_pivot.get(mo, {}).get(cat, 0) for mo in base_months]
@@ -3,6 +3,8 @@ from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
 from django.template.loader import render_to_string
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from account.services.prediction_service import run_prediction
 from account.services.prediction_service import build_monthly_series
 from account.services.eda_service import build_eda_context
@@ -10,6 +12,8 @@ from account.services.zones_service import build_zones_context
 from account.services.prediction_breakdown_service import build_prediction_breakdown_data
 from account.utils.guest_utils import is_guest
 from account.services.home_service import build_home_context
+from transactions.services.import_telemetry import recent_imports
+from transactions.services.version_service import data_etag
 
 def home(request):
     context = build_home_context()
@@ -17,7 +21,7 @@ def home(request):
 
 @login_required
 def csv_import(request):
-    return render(request, "account/csv_import.html")
+    return render(request, "account/csv_import.html", {"recent_imports": recent_imports(10)})
 
 @login_required
 def eda(request):
@@ -95,14 +99,24 @@ def zones(request):
     return render(request, "account/zones.html", context)
 
 
+def _breakdown_excludes(request) -> list[str]:
+    exclude_param = (request.GET.get("exclude") or "").strip()
+    if exclude_param:
+        return [x.strip() for x in exclude_param.split(",") if x.strip()]
+    return ["家具・家電"]
+
+
+def _breakdown_etag(request, yyyymm: str) -> str:
+    # データのバージョン + 月・除外・guest。変わっていなければ 304（集計も描画もしない）
+    return data_etag("breakdown", yyyymm, ",".join(_breakdown_excludes(request)), is_guest(request.user))
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_breakdown_etag)
 def prediction_breakdown(request, yyyymm: str):
 
-    exclude_param = (request.GET.get("exclude") or "").strip()
-    if exclude_param:
-        exclude_keywords = [x.strip() for x in exclude_param.split(",") if x.strip()]
-    else:
-        exclude_keywords = ["家具・家電"]
+    exclude_keywords = _breakdown_excludes(request)
 
     # 月次系列は既存service
     series, month_totals = build_monthly_series(exclude_keywords)
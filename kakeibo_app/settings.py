@@ -87,6 +87,10 @@ DATABASES = {
     "default": dj_database_url.parse(DATABASE_URL, conn_max_age=600),
 }
 
+# SQLite（ローカル）：取込ワーカーが書いている間も画面から読めるように WAL にする
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    DATABASES["default"].setdefault("OPTIONS", {})["init_command"] = "PRAGMA journal_mode=WAL;"
+
 
 
 # Password validation
@@ -152,4 +156,7 @@ if "kakeibo-django.onrender.com" not in ALLOWED_HOSTS:
 if "https://kakeibo-django.onrender.com" not in CSRF_TRUSTED_ORIGINS:
     CSRF_TRUSTED_ORIGINS.append("https://kakeibo-django.onrender.com")
 
-STREAMLIT_URL = os.getenv("STREAMLIT_URL", "http://localhost:8501")
\ No newline at end of file
+STREAMLIT_URL = os.getenv("STREAMLIT_URL", "http://localhost:8501")
+
+# CSVアップロードの一時置き場（run_import_worker が同じマシンから読む）
+IMPORT_STAGING_DIR = Path(os.getenv("IMPORT_STAGING_DIR", BASE_DIR / "_local" / "import_staging"))
@@ -0,0 +1,26 @@
+// static/js/fetch_fragment.js
+// HTML 断片を ETag つきで取る（Table の行 / Prediction の内訳で共通）
+// - 2回目からは If-None-Match を付ける。変わっていなければ 304 → 手元の前回分を返す
+// - ブラウザのHTTPキャッシュは使わない（cache: "no-store"。304 の判定はこっちでやる）
+// - 取れなかったら null
+(function(){
+  const MAX_ENTRIES = 100;
+  const cache = new Map(); // URL → { etag, html }
+
+  window.fetchFragment = async function(url){
+    const hit = cache.get(url);
+    const headers = { "X-Requested-With": "fetch" };
+    if(hit) headers["If-None-Match"] = hit.etag;
+    const res = await fetch(url, { headers, cache: "no-store" });
+    if(res.status === 304 && hit) return hit.html;
+    if(!res.ok) return null;
+    const html = await res.text();
+    const etag = res.headers.get("ETag");
+    if(etag){
+      cache.delete(url);
+      cache.set(url, { etag, html });
+      if(cache.size > MAX_ENTRIES) cache.delete(cache.keys().next().value); // 古いものから捨てる
+    }
+    return html;
+  };
+})();
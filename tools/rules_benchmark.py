@@ -0,0 +1,327 @@
+"""
+rules_benchmark.py
+
+分類ルール（transactions/rules.py）のベンチマーク ＋ ゴールデン比較スクリプト。
+
+目的：
+- ルールエンジンを速くしても「結果が1件も変わっていない」ことを確認する
+- 1k / 100k / 1M 行での処理速度（rows/sec）と1件あたりの遅延（p50/p99）を見る
+
+特徴：
+- 店名は demo_data_generator.py の店名候補 ＋ 初期ルールのキーワードから作る
+- 全角/半角・大文字/小文字・空白の入り方を変えた表記ゆれを混ぜる
+- SEED固定で毎回同じコーパスになる
+- ルールは rules.py の初期値（compile_rules）を使うのでDB不要
+  （golden --db だけは、マイグレーション済みのテストDBを作って seed されたDBルール
+    = compile_rules_from_db() でも比べる）
+
+使い方（プロジェクト直下で）：
+  python tools/rules_benchmark.py bench                 # 1k / 100k / 1M
+  python tools/rules_benchmark.py bench --sizes 1000 --reference
+  python tools/rules_benchmark.py golden                # ゴールデンと比較（違えば exit 1）
+  python tools/rules_benchmark.py golden --db           # DBルール（テストDB）でも比較
+  python tools/rules_benchmark.py golden --update       # ゴールデンを作り直す（参照実装で）
+
+本番コードとは無関係な補助スクリプト。
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+from demo_data_generator import CATEGORIES  # noqa: E402
+from transactions import rules  # noqa: E402
+
+
+# =========================
+# 設定
+# =========================
+SEED = 42
+BENCH_SIZES = [1_000, 100_000, 1_000_000]
+GOLDEN_SIZE = 5_000
+GOLDEN_PATH = Path(__file__).resolve().parent / "golden" / "rules_golden.csv"
+
+START_DATE = date(2025, 4, 1)
+DAYS = 183
+
+
+# =========================
+# コーパス生成
+# =========================
+def _base_shops() -> list[str]:
+    shops: set[str] = set()
+    for c in CATEGORIES:
+        shops.update(c.merchants)
+    for kws in list(rules.SHOP_RULES.values()) + list(rules.MEMBER_RULES.values()):
+        shops.update(kws)
+    shops.update(rules.UNCLASSIFIABLE)
+    shops.update(rules.MEMBER_UNCLASSIFIABLE)
+    shops.update(rules.WEEKEND_SHARED_WEEKDAY_YU)
+    shops.update([rules.DERMA_CLINIC, rules.DERMA_PHARMACY])
+    return sorted(shops)
+
+
+def _to_fullwidth(s: str) -> str:
+    """ASCII → 全角（空白は全角スペース）"""
+    out = []
+    for ch in s:
+        if ch == " ":
+            out.append("　")
+        elif "!" <= ch <= "~":
+            out.append(chr(ord(ch) + 0xFEE0))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _to_halfwidth(s: str) -> str:
+    """全角ASCII → 半角（空白も半角）"""
+    out = []
+    for ch in s:
+        if ch == "　":
+            out.append(" ")
+        elif "！" <= ch <= "～":
+            out.append(chr(ord(ch) - 0xFEE0))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def _variant(shop: str, rnd: random.Random) -> str:
+    """表記ゆれを1つ作る（全角/半角・大小・空白・前後の店舗名）"""
+    r = rnd.random()
+    if r < 0.2:
+        s = _to_fullwidth(_to_halfwidth(shop))
+    elif r < 0.4:
+        s = _to_halfwidth(shop)
+    elif r < 0.5:
+        s = _to_halfwidth(shop).lower()
+    elif r < 0.6:
+        s = shop.replace(" ", "  ").replace("　", " 　")
+    else:
+        s = shop
+
+    r = rnd.random()
+    if r < 0.15:
+        s = f"{s} 亀戸店"
+    elif r < 0.25:
+        s = f"ＳＱ＊{s}"
+    elif r < 0.3:
+        s = f"  {s}\t"
+    return s
+
+
+def generate_corpus(n: int, seed: int = SEED) -> list[tuple[date, str, int]]:
+    rnd = random.Random(seed)
+    base = _base_shops()
+
+    # 実際の明細っぽく「同じ店の繰り返し」が多くなるように、表記ゆれ込みの店名プールから引く
+    pool = [_variant(rnd.choice(base), rnd) for _ in range(max(50, min(n // 20, 2000)))]
+
+    rows = []
+    for _ in range(n):
+        d = START_DATE + timedelta(days=rnd.randrange(DAYS))
+        rows.append((d, rnd.choice(pool), rnd.randint(100, 20000)))
+    return rows
+
+
+# =========================
+# 参照実装（最初の素朴な二重ループ版と同じ判定）
+# =========================
+def reference_category(shop: str) -> str | None:
+    shop_n = rules._norm(shop)
+    for bad in rules.UNCLASSIFIABLE:
+        if rules._norm(bad) in shop_n:
+            return None
+    for category_name, keywords in rules.SHOP_RULES.items():
+        for kw in keywords:
+            if rules._norm(kw) in shop_n:
+                return category_name
+    return None
+
+
+def _reference_contains_any(text: str, keywords: list[str]) -> bool:
+    t = rules._norm(text)
+    return any(rules._norm(k) in t for k in keywords)
+
+
+def reference_member(shop: str, d: date, derma_dates: set[date]) -> str | None:
+    shop = (shop or "").strip()
+    if _reference_contains_any(shop, rules.MEMBER_UNCLASSIFIABLE):
+        return None
+    if rules._norm(rules.DERMA_PHARMACY) in rules._norm(shop):
+        return "ゆ" if d in derma_dates else "な"
+    if _reference_contains_any(shop, rules.WEEKEND_SHARED_WEEKDAY_YU):
+        return "共有" if d.weekday() >= 5 else "ゆ"
+    for member_name, keywords in rules.MEMBER_RULES.items():
+        if _reference_contains_any(shop, keywords):
+            return member_name
+    return None
+
+
+def reference_classify(rows: list[tuple[date, str, int]]) -> list[tuple[str | None, str | None]]:
+    derma_dates = {d for d, shop, _ in rows if rules._norm(rules.DERMA_CLINIC) in rules._norm(shop)}
+    return [(reference_category(shop), reference_member(shop, d, derma_dates)) for d, shop, _ in rows]
+
+
+# =========================
+# ベンチマーク
+# =========================
+def _percentile(sorted_ns: list[int], p: float) -> float:
+    if not sorted_ns:
+        return 0.0
+    k = min(len(sorted_ns) - 1, int(round((len(sorted_ns) - 1) * p)))
+    return sorted_ns[k] / 1000.0  # µs
+
+
+def bench(sizes: list[int], with_reference: bool) -> None:
+    compiled = rules.compile_rules()
+
+    print(f"{'rows':>10} | {'engine':<22} | {'rows/sec':>12} | {'p50 µs':>8} | {'p99 µs':>8}")
+    print("-" * 72)
+    for n in sizes:
+        rows = generate_corpus(n)
+        derma_dates = {d for d, shop, _ in rows if compiled.is_derm_clinic_hits(compiled.hits(shop))}
+
+        # ① 1件ずつ（category_from_hits + member_from_hits）
+        lat: list[int] = []
+        clock = time.perf_counter_ns
+        t0 = clock()
+        for d, shop, _ in rows:
+            s = clock()
+            hits = compiled.hits(shop)
+            compiled.category_from_hits(hits)
+            compiled.member_from_hits(hits, d, derma_dates)
+            lat.append(clock() - s)
+        total = (clock() - t0) / 1e9
+        lat.sort()
+        print(f"{n:>10,} | {'per-call (compiled)':<22} | {n / total:>12,.0f} | "
+              f"{_percentile(lat, 0.5):>8.1f} | {_percentile(lat, 0.99):>8.1f}")
+
+        # ② まとめて（classify_rows）
+        t0 = time.perf_counter()
+        rules.classify_rows(rows, rules=compiled)
+        total = time.perf_counter() - t0
+        print(f"{n:>10,} | {'classify_rows':<22} | {n / total:>12,.0f} | {'-':>8} | {'-':>8}")
+
+        # ③ 参照実装（遅いので小さいサイズだけ推奨）
+        if with_reference:
+            lat = []
+            t0 = clock()
+            for d, shop, _ in rows:
+                s = clock()
+                reference_category(shop)
+                reference_member(shop, d, derma_dates)
+                lat.append(clock() - s)
+            total = (clock() - t0) / 1e9
+            lat.sort()
+            print(f"{n:>10,} | {'per-call (reference)':<22} | {n / total:>12,.0f} | "
+                  f"{_percentile(lat, 0.5):>8.1f} | {_percentile(lat, 0.99):>8.1f}")
+
+
+# =========================
+# ゴールデン
+# =========================
+GOLDEN_FIELDS = ["date", "shop", "amount", "category", "member"]
+
+
+def write_golden(path: Path) -> None:
+    rows = generate_corpus(GOLDEN_SIZE, seed=SEED + 1)
+    expected = reference_classify(rows)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(GOLDEN_FIELDS)
+        for (d, shop, amount), (cat, mem) in zip(rows, expected):
+            writer.writerow([d.isoformat(), shop, amount, cat or "", mem or ""])
+    print(f"Generated: {path} (rows={len(rows)})")
+
+
+def compile_rules_from_test_db() -> rules.CompiledRules:
+    """
+    マイグレーション済みのテストDB（test_ 付きの別DB）を作って、seed されたルールをコンパイルする
+    本番のDBは読まない・書かない。終わったらテストDBは消す
+    """
+    import os
+
+    import django
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "kakeibo_app.settings")
+    django.setup()
+    from django.db import connection
+
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        return rules.compile_rules_from_db()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def check_golden(path: Path, compiled: rules.CompiledRules, label: str) -> int:
+    with path.open(newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        golden = list(reader)
+
+    rows = [(date.fromisoformat(r["date"]), r["shop"], int(r["amount"])) for r in golden]
+    expected = [(r["category"] or None, r["member"] or None) for r in golden]
+
+    got = [(c.category, c.member) for c in rules.classify_rows(rows, rules=compiled)]
+
+    # 1件ずつのAPIも同じ結果になること
+    derma_dates = {d for d, shop, _ in rows if compiled.is_derm_clinic_hits(compiled.hits(shop))}
+    got_single = [
+        (compiled.category_from_hits(compiled.hits(shop)),
+         compiled.member_from_hits(compiled.hits(shop), d, derma_dates))
+        for d, shop, _ in rows
+    ]
+
+    diffs = [
+        (i, rows[i], expected[i], got[i], got_single[i])
+        for i in range(len(rows))
+        if not (expected[i] == got[i] == got_single[i])
+    ]
+    for i, row, exp, batch, single in diffs[:20]:
+        print(f"[{label}] DIFF line={i + 2}: {row!r} expected={exp} classify_rows={batch} per-call={single}")
+
+    if diffs:
+        print(f"[{label}] NG: {len(diffs)} / {len(rows)} 件が一致しない")
+        return 1
+    print(f"[{label}] OK: {len(rows)} 件すべて一致")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_bench = sub.add_parser("bench", help="スループットと遅延を測る")
+    p_bench.add_argument("--sizes", type=int, nargs="+", default=BENCH_SIZES)
+    p_bench.add_argument("--reference", action="store_true", help="参照実装も測る（遅い）")
+
+    p_golden = sub.add_parser("golden", help="ゴールデンと比較する")
+    p_golden.add_argument("--update", action="store_true", help="参照実装でゴールデンを作り直す")
+    p_golden.add_argument("--path", type=Path, default=GOLDEN_PATH)
+    p_golden.add_argument("--db", action="store_true", help="テストDBに seed されたDBルールでも比較する")
+
+    args = parser.parse_args()
+    if args.cmd == "bench":
+        bench(args.sizes, args.reference)
+    elif args.update:
+        write_golden(args.path)
+    else:
+        status = check_golden(args.path, rules.compile_rules(), "compile_rules")
+        if args.db:
+            status |= check_golden(args.path, compile_rules_from_test_db(), "compile_rules_from_db")
+        sys.exit(status)
@@ -1,5 +1,9 @@
-from django.contrib import admin
-from .models import Category, Transaction
+from django.contrib import admin, messages
+from .forms import TransactionAdminForm
+from .models import Category, ClassificationRule, ImportBatch, ImportCheckpoint, ImportFile, ImportJob, MonthlyTotal, MonthSnapshot, ShopAssignment, Transaction
+from .services.monthly_total_service import MonthClosedError, track_monthly_totals
+from .services.reclassify_service import reclassify_open_transactions
+from .services.shop_assignment_service import learn_shop_assignments
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -8,6 +12,108 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ("id", "date", "shop", "amount", "member", "category", "source_file", "is_closed")
-    list_filter = ("member", "category", "is_closed", "source_file")
+    form = TransactionAdminForm
+    list_display = ("id", "date", "shop", "amount", "member", "category", "import_file", "is_closed")
+    list_filter = ("member", "category", "is_closed", "import_file")
+    list_select_related = ("member", "category", "import_file")
     search_fields = ("shop", "memo")
+    actions = ["reclassify_selected"]
+
+    @admin.action(description="選択した未確定の明細にルールをかけ直す")
+    def reclassify_selected(self, request, queryset):
+        result = reclassify_open_transactions(queryset)
+        self.message_user(
+            request,
+            f"再分類：対象 {result.scanned} 件 / 変更 {result.changed} 件",
+            messages.SUCCESS,
+        )
+
+    def _in_closed_month(self, obj) -> bool:
+        return bool(obj and obj.billing_month and MonthSnapshot.objects.filter(month=obj.billing_month).exists())
+
+    def get_readonly_fields(self, request, obj=None):
+        # 締めた月の明細は見るだけ
+        if self._in_closed_month(obj):
+            return [f.name for f in self.model._meta.fields]
+        return super().get_readonly_fields(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        if self._in_closed_month(obj):
+            return False
+        return super().has_delete_permission(request, obj)
+
+    def save_model(self, request, obj, form, change):
+        # 月次集計も一緒に直す（新規なら保存後の pk を足して「増えた分」として数える）
+        # 締めた月にかかる変更は TransactionAdminForm.clean で止めてあるので、ここまで来ない
+        with track_monthly_totals([obj.pk]) as ids:
+            super().save_model(request, obj, form, change)
+            ids.add(obj.pk)
+        # 確定済みにしたら学習テーブルへ反映
+        if obj.is_closed:
+            learn_shop_assignments(Transaction.objects.filter(pk=obj.pk))
+
+    def delete_model(self, request, obj):
+        with track_monthly_totals([obj.pk]):
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        try:
+            with track_monthly_totals(queryset.values_list("pk", flat=True)):
+                super().delete_queryset(request, queryset)
+        except MonthClosedError as e:
+            self.message_user(request, str(e), messages.ERROR)
+
+@admin.register(ShopAssignment)
+class ShopAssignmentAdmin(admin.ModelAdmin):
+    list_display = ("id", "shop_norm", "category", "member", "updated_at")
+    list_filter = ("category", "member")
+    search_fields = ("shop_norm",)
+
+@admin.register(ClassificationRule)
+class ClassificationRuleAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "keyword", "target", "priority", "is_active")
+    list_editable = ("keyword", "target", "priority", "is_active")
+    list_filter = ("kind", "is_active", "target")
+    search_fields = ("keyword", "target")
+
+@admin.register(ImportBatch)
+class ImportBatchAdmin(admin.ModelAdmin):
+    list_display = ("id", "file_name", "row_count", "duplicate_count", "created_at")
+    search_fields = ("file_name", "file_sha256")
+    readonly_fields = ("file_sha256", "created_at")
+
+@admin.register(ImportFile)
+class ImportFileAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "billing_month", "row_count", "imported_at")
+    search_fields = ("name",)
+
+@admin.register(MonthlyTotal)
+class MonthlyTotalAdmin(admin.ModelAdmin):
+    list_display = ("id", "month", "category", "member", "is_closed", "total", "count")
+    list_filter = ("month", "category", "member", "is_closed")
+    list_select_related = ("category", "member")
+
+@admin.register(MonthSnapshot)
+class MonthSnapshotAdmin(admin.ModelAdmin):
+    # 締めは close_month コマンドで。ここでは見るのと、締めを戻す（削除）だけ
+    list_display = ("id", "month", "row_count", "total", "closed_at")
+    exclude = ("totals", "shops", "max_rows", "names")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ("id", "file_name", "last_line", "row_count", "duplicate_count", "updated_at")
+    search_fields = ("file_name", "file_sha256")
+    readonly_fields = ("file_sha256", "updated_at")
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "file_name", "status", "rows_parsed", "rows_inserted", "rows_duplicate", "created_by", "created_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("file_name",)
+    readonly_fields = ("staged_path", "batch", "created_by", "created_at", "started_at", "finished_at")
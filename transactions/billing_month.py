@@ -0,0 +1,39 @@
+# transactions/billing_month.py
+"""
+source_file（"202601.csv" など）から請求月を取り出す小物。
+
+- ファイル名の最初の6桁（YYYYMM）を請求月とみなし、その月の1日（date）にする
+- 取れない / 月がおかしいときは None
+- 取込時に Transaction.billing_month を埋めるのに使う（集計側はもう source_file を見ない）
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import date
+from functools import lru_cache
+
+_YYYYMM_RE = re.compile(r"(\d{6})")
+
+
+@lru_cache(maxsize=256)
+def billing_month_from_source(source_file: str) -> date | None:
+    m = _YYYYMM_RE.search(source_file or "")
+    if not m:
+        return None
+    y, mo = int(m.group(1)[:4]), int(m.group(1)[4:])
+    if not (1 <= mo <= 12) or y < 1:
+        return None
+    return date(y, mo, 1)
+
+
+def month_label(d: date) -> str:
+    """date → 表示・URL用の "YYYYMM" """
+    return f"{d.year:04d}{d.month:02d}"
+
+
+def month_from_label(yyyymm: str) -> date | None:
+    """"YYYYMM" → その月の1日（形式が違えば None）"""
+    if len(yyyymm) != 6 or not yyyymm.isdigit():
+        return None
+    return billing_month_from_source(yyyymm)
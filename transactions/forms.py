@@ -1,5 +1,27 @@
 # transactions/forms.py
 from django import forms
 
+from .models import MonthSnapshot, Transaction
+from .services.monthly_total_service import MonthClosedError
+
 class CSVUploadForm(forms.Form):
-    csv_file = forms.FileField(label="CSVファイル")
\ No newline at end of file
+    csv_file = forms.FileField(label="CSVファイル")
+
+
+class TransactionAdminForm(forms.ModelForm):
+    """admin の明細フォーム：締めた月に入る/締めた月から出る変更はフォームのエラーにする"""
+
+    class Meta:
+        model = Transaction
+        fields = "__all__"
+
+    def clean(self):
+        cleaned = super().clean()
+        months = {cleaned.get("billing_month")}
+        if self.instance.pk:
+            months.add(self.instance.billing_month)
+        months.discard(None)
+        closed = MonthSnapshot.objects.filter(month__in=months).values_list("month", flat=True)
+        if closed:
+            raise forms.ValidationError(str(MonthClosedError(closed)))
+        return cleaned
@@ -0,0 +1,130 @@
+# transactions/management/commands/check_query_plans.py
+from __future__ import annotations
+
+import re
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q, Sum
+
+from transactions.models import ImportFile, Transaction
+from transactions.services.import_file_service import latest_import_file
+from transactions.services.row_page_service import PAGE_SIZE
+from transactions.services.search_service import field_q, text_q
+
+
+def _hot_queries(latest: ImportFile) -> dict[str, object]:
+    """画面ごとの重いクエリ（views / services と同じ形）。名前 → QuerySet"""
+    month = latest.billing_month or date.today().replace(day=1)
+
+    return {
+        # transactions/views.py：transaction_list / transaction_rows（row_page_service の1ページ分）
+        "一覧（最新ファイル）": (
+            Transaction.objects.select_related("category", "member").filter(import_file=latest)
+            .order_by("-date", "-id")[:PAGE_SIZE + 1]
+        ),
+        "一覧（続きのページ）": (
+            Transaction.objects.select_related("category", "member").filter(import_file=latest)
+            .filter(Q(date__lt=month) | Q(date=month, id__lt=2**31 - 1))
+            .order_by("-date", "-id")[:PAGE_SIZE + 1]
+        ),
+        "編集モード（未割当）": (
+            Transaction.objects.select_related("category", "member")
+            .filter(import_file=latest)
+            .filter(Q(category__isnull=True) | Q(member__isnull=True))
+            .order_by("-date", "-id")[:PAGE_SIZE + 1]
+        ),
+        # 検索（店名・メモ）：ファイルで絞らなくても search_text のインデックス（pg_trgm / FTS5）で引けるか
+        "検索（店名・メモ）": (
+            Transaction.objects.filter(text_q("ライフ")).values("id")
+        ),
+        # 検索のフィールド指定（search_service.field_q）：それぞれインデックスで引けるか
+        "検索（amount:1000..5000）": (
+            Transaction.objects.filter(import_file=latest).filter(field_q("amount:1000..5000")).values("id")
+        ),
+        "検索（date:範囲）": (
+            Transaction.objects.filter(import_file=latest)
+            .filter(field_q(f"date:{month:%Y-%m}..{month:%Y-%m}")).values("id")
+        ),
+        "精算サマリ": (
+            Transaction.objects.filter(import_file=latest, is_closed=True)
+            .exclude(member__isnull=True)
+            .values("member__name")
+            .annotate(total=Sum("amount"))
+        ),
+        # transactions/services/month_close_service.py（内訳・高額単発の、まだ締めていない月）
+        # （合計・カテゴリ別は MonthlyTotal / MonthSnapshot を読むので、明細に残るのは店別と単発の最大額だけ）
+        "内訳（店別）": (
+            Transaction.objects.exclude(category__isnull=True)
+            .filter(billing_month=month)
+            .values_list("shop_norm")
+            .annotate(total=Sum("amount"), n=Count("amount"))
+            .order_by()
+        ),
+        "高額単発": (
+            Transaction.objects.exclude(category__isnull=True)
+            .filter(billing_month=month)
+            .order_by("-amount", "id")
+            .values("amount", "shop")[:1]
+        ),
+    }
+
+
+def _full_scans(plan: str, table: str) -> list[str]:
+    """明細テーブルを頭から全部読んでいる行（PostgreSQL: Seq Scan / SQLite: インデックスなしの SCAN）"""
+    found = []
+    for line in plan.splitlines():
+        if re.search(rf"Seq Scan on {table}\b", line):
+            found.append(line.strip())
+        elif re.search(rf"\bSCAN {table}\b", line) and "INDEX" not in line:
+            found.append(line.strip())
+    return found
+
+
+class Command(BaseCommand):
+    help = "一覧・内訳などの重いクエリを EXPLAIN して、明細テーブルの全件スキャンになっていないか確認する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-rows",
+            type=int,
+            default=100_000,
+            help="明細がこれより少ないときは NG を参考表示にして exit 0（小さい表だと全件スキャンの方が速いので planner がそちらを選ぶ。デフォルト: 100000）",
+        )
+        parser.add_argument(
+            "--verbose-plan",
+            action="store_true",
+            help="EXPLAIN の結果をそのまま全部出す",
+        )
+
+    def handle(self, *args, **options):
+        table = Transaction._meta.db_table
+        n_rows = Transaction.objects.count()
+        latest = latest_import_file()
+        if latest is None:
+            raise CommandError("取込済みのファイルが無い（先に import_past_csv などでデータを入れてね）")
+
+        self.stdout.write(f"DB: {connection.vendor} / 明細 {n_rows:,} 件 / 最新ファイル {latest.name}")
+        # 小さい表では planner の選び方が本番と違うので、NG は参考として出すだけ（exit 0）
+        advisory = n_rows < options["min_rows"]
+        if advisory:
+            self.stdout.write(self.style.WARNING(
+                f"明細が {options['min_rows']:,} 件未満なので参考表示だけ（NG でも exit 0。判定は大きい DB で）"
+            ))
+
+        failed = []
+        for name, qs in _hot_queries(latest).items():
+            plan = qs.explain()
+            scans = _full_scans(plan, table)
+            if options["verbose_plan"]:
+                self.stdout.write(f"--- {name}\n{plan}")
+            if scans:
+                failed.append(name)
+                style = self.style.WARNING if advisory else self.style.ERROR
+                self.stdout.write(style(f"NG{'（参考）' if advisory else ''} {name}: {' / '.join(scans)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"OK {name}"))
+
+        if failed and not advisory:
+            raise CommandError(f"全件スキャンになっているクエリがある: {', '.join(failed)}")
@@ -0,0 +1,76 @@
+# transactions/management/commands/close_month.py
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.billing_month import month_from_label, month_label
+from transactions.models import MonthSnapshot
+from transactions.services.month_close_service import (
+    MonthNotReadyError,
+    closable_months,
+    close_month,
+    reopen_month,
+)
+
+
+class Command(BaseCommand):
+    help = "請求月を締める（全部確定済みの月の集計をスナップショットに固めて、以後は変更できなくする）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("months", nargs="*", help="締める請求月（YYYYMM）")
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="全部確定済みで、まだ締めていない月をまとめて締める",
+        )
+        parser.add_argument(
+            "--reopen",
+            action="store_true",
+            help="締めを戻す（スナップショットを消す。明細はそのまま）",
+        )
+        parser.add_argument(
+            "--list",
+            action="store_true",
+            help="締めた月と、締められる月を出すだけ",
+        )
+
+    def handle(self, *args, **options):
+        if options["list"]:
+            for snap in MonthSnapshot.objects.all():
+                self.stdout.write(f"締め済み: {snap}")
+            for m in closable_months():
+                self.stdout.write(f"締められる: {month_label(m)}")
+            return
+
+        months = []
+        for label in options["months"]:
+            m = month_from_label(label)
+            if m is None:
+                raise CommandError(f"請求月は YYYYMM で指定してね: {label!r}")
+            months.append(m)
+        if options["all"]:
+            if options["reopen"]:
+                raise CommandError("--all と --reopen は一緒に使えない")
+            months += [m for m in closable_months() if m not in months]
+        if not months:
+            raise CommandError("請求月（YYYYMM）か --all を指定してね")
+
+        failed = []
+        for m in months:
+            if options["reopen"]:
+                if reopen_month(m):
+                    self.stdout.write(self.style.SUCCESS(f"{month_label(m)}: 締めを戻しました"))
+                else:
+                    self.stdout.write(self.style.WARNING(f"{month_label(m)}: 締めていない"))
+                continue
+
+            try:
+                snap = close_month(m)
+            except MonthNotReadyError as e:
+                failed.append(month_label(m))
+                self.stdout.write(self.style.ERROR(str(e)))
+                continue
+            self.stdout.write(self.style.SUCCESS(f"締めました: {snap}"))
+
+        if failed:
+            raise CommandError(f"締められなかった月がある: {', '.join(failed)}")
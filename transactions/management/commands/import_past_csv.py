@@ -1,180 +1,257 @@
 # transactions/management/commands/import_past_csv.py
 from __future__ import annotations
 
-import csv
-import re
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from datetime import datetime
 
+import django
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction
-
-from transactions.models import Transaction, Category, Member
-
-
-# --- CSVの列名（日本語そのまま） ---
-COL_DATE = "日付"
-COL_SHOP = "店名・サービス名"
-COL_AMOUNT = "金額"
-COL_MEMBER = "メンバー"
-COL_CATEGORY = "カテゴリ"
-COL_SOURCE = "ファイル名"
-COL_CLOSED = "確定済みか"
-
-
-def parse_date(s: str | None):
-    if not s:
-        return None
-    s = str(s).strip()
-    for fmt in ("%Y/%m/%d", "%Y-%m-%d"):
-        try:
-            return datetime.strptime(s, fmt).date()
-        except ValueError:
-            pass
-    raise ValueError(f"日付が解釈できない: {s!r}")
-
-
-def parse_amount(s: str | None) -> int:
-    if s is None:
-        raise ValueError("金額が空")
-    s = str(s).strip()
-    # "¥3,000" "3,000" "3000" "-120" などを許容
-    m = re.search(r"-?\d[\d,]*", s)
-    if not m:
-        raise ValueError(f"金額が解釈できない: {s!r}")
-    return int(m.group().replace(",", ""))
-
-
-def parse_bool(s: str | None) -> bool:
-    if s is None:
-        return False
-    s = str(s).strip().lower()
-    return s in ("true", "1", "t", "yes", "y", "済", "確定")
+from django.db import connections
+
+from transactions.models import Category, Member
+from transactions.services.dedup_service import find_imported_batch
+from transactions.services.monthly_total_service import MonthClosedError
+from transactions.services.past_csv_service import (
+    ParsedFile,
+    StreamResult,
+    parse_past_csv,
+    scan_past_csv,
+    stream_past_csv,
+    write_parsed_file,
+)
+
+
+def _collect_paths(specs: list[str]) -> list[Path]:
+    """ファイル / ディレクトリ（直下の *.csv）/ glob を、重複なし・名前順のファイル一覧にする"""
+    paths: dict[Path, None] = {}
+    for spec in specs:
+        p = Path(spec)
+        if p.is_dir():
+            found = sorted(p.glob("*.csv"))
+        elif p.exists():
+            found = [p]
+        else:
+            found = sorted(Path(x) for x in glob.glob(spec) if Path(x).is_file())
+        if not found:
+            raise CommandError(f"CSVが見つからない: {spec}")
+        for f in found:
+            paths.setdefault(f.resolve(), None)
+    return list(paths)
 
 
 class Command(BaseCommand):
-    help = "過去CSV（202412-202601など）を一括インポートする（今回限り用）"
+    help = "過去CSV（202412-202601など）を一括インポートする（ファイル / ディレクトリ / glob を複数指定OK）"
 
     def add_arguments(self, parser):
         parser.add_argument(
-            "csv_path",
-            nargs="?",
-            default="202412-202601.csv",
-            help="取り込みCSVのパス（デフォルト: 202412-202601.csv）",
+            "csv_paths",
+            nargs="*",
+            default=["202412-202601.csv"],
+            help="取り込みCSVのパス / ディレクトリ / glob（デフォルト: 202412-202601.csv）",
         )
         parser.add_argument(
             "--dry-run",
             action="store_true",
             help="DBには書かず、件数だけ確認する",
         )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="パースに使うプロセス数（デフォルト: CPUコア数。1ならこのプロセスだけで読む）",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=0,
+            help="指定すると少しずつ読んでこの行数ごとにコミットする（巨大ファイル用。落ちても続きから再開できる）",
+        )
 
     def handle(self, *args, **options):
-        csv_path = Path(options["csv_path"])
+        paths = _collect_paths(options["csv_paths"])
         dry_run = options["dry_run"]
 
-        if not csv_path.exists():
-            raise CommandError(f"CSVが見つからない: {csv_path}")
+        if options["chunk_size"] > 0:
+            self._handle_chunked(paths, options["chunk_size"], dry_run)
+            return
 
-        # Excel由来の文字コードにも耐えるため、まず utf-8-sig → ダメなら cp932
-        try_encodings = ["utf-8-sig", "utf-8", "cp932"]
+        workers = max(1, min(options["workers"], len(paths)))
+        single = len(paths) == 1
 
-        text = None
-        last_err = None
-        for enc in try_encodings:
-            try:
-                text = csv_path.read_text(encoding=enc, errors="strict")
-                break
-            except Exception as e:
-                last_err = e
-        if text is None:
-            raise CommandError(f"CSVが読めない（encoding試行失敗）: {last_err}")
-
-        reader = csv.DictReader(text.splitlines())
-        if not reader.fieldnames:
-            raise CommandError("CSVヘッダが読めない")
-
-        need = {COL_DATE, COL_SHOP, COL_AMOUNT, COL_MEMBER, COL_CATEGORY, COL_SOURCE, COL_CLOSED}
-        missing = need - set(reader.fieldnames)
-        if missing:
-            raise CommandError(f"CSVに必要な列がない: {sorted(missing)} / headers={reader.fieldnames}")
-
-        rows = list(reader)
-        self.stdout.write(self.style.SUCCESS(f"CSV rows: {len(rows)}"))
-
-        # 既存マスタをキャッシュ
+        self.stdout.write(f"対象ファイル: {len(paths)} / パース: {workers} プロセス")
+
+        # 既存マスタをキャッシュ（書き込み側だけが持つ）
         cat_map = {c.name: c for c in Category.objects.all()}
         mem_map = {m.name: m for m in Member.objects.all()}
 
-        to_create: list[Transaction] = []
+        totals = {"files": 0, "created": 0, "duplicates": 0, "skipped": 0, "errors": 0, "rows": 0, "seconds": 0.0}
+        seen_sha: set[str] = set()
+        t0 = time.perf_counter()
+
+        def write(i: int, parsed: ParsedFile) -> None:
+            head = f"[{i}/{len(paths)}] {parsed.name}"
+
+            if parsed.fatal:
+                if single:
+                    raise CommandError(parsed.fatal)
+                self.stdout.write(self.style.ERROR(f"{head}: {parsed.fatal}"))
+                return
+
+            # 同じ中身のファイルは2回取り込まない（今回の実行内でも）
+            done = find_imported_batch(parsed.file_sha256)
+            if done or parsed.file_sha256 in seen_sha:
+                msg = (
+                    f"同じ内容のファイルは取り込み済み: {done.file_name}（{done.created_at:%Y-%m-%d %H:%M}）"
+                    if done else "同じ内容のファイルを今回すでに処理済み"
+                )
+                if single:
+                    raise CommandError(msg)
+                self.stdout.write(self.style.WARNING(f"{head}: {msg}"))
+                return
+            seen_sha.add(parsed.file_sha256)
+
+            for note in parsed.notes:
+                self.stdout.write(self.style.WARNING(f"{head} {note}"))
+
+            try:
+                result = write_parsed_file(parsed, cat_map, mem_map, dry_run=dry_run)
+            except MonthClosedError as e:
+                if single:
+                    raise CommandError(str(e))
+                self.stdout.write(self.style.ERROR(f"{head}: {e}"))
+                return
+
+            totals["files"] += 1
+            totals["created"] += result.created
+            totals["duplicates"] += result.duplicates
+            totals["skipped"] += parsed.skipped
+            totals["errors"] += parsed.errors
+            totals["rows"] += result.load.rows
+            totals["seconds"] += result.load.seconds
+
+            line = (
+                f"{head}: 行 {len(parsed.rows) + parsed.skipped + parsed.errors}"
+                f" / 作成{'予定' if dry_run else ''} {result.created} / 重複 {result.duplicates}"
+                f" / スキップ {parsed.skipped} / エラー {parsed.errors}"
+                f" / parse {parsed.seconds:.2f}s"
+            )
+            if result.load.rows:
+                line += f" / {result.load.method} {result.load.seconds:.2f}s"
+            self.stdout.write(self.style.SUCCESS(line))
+            self.stdout.write(f"    source_file一覧: {sorted(parsed.sources)}")
+
+        if workers == 1:
+            for i, path in enumerate(paths, start=1):
+                write(i, parse_past_csv(str(path)))
+        else:
+            # 子プロセスにDB接続を持ち越さない（子はDBを触らない）
+            connections.close_all()
+            # spawn（Windows/macOS）でも子プロセスで models を import できるように django.setup を先に呼ぶ
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+                futures = [pool.submit(parse_past_csv, str(p)) for p in paths]
+                # パースが終わった順に、このプロセス（書き込みは1つだけ）で流し込む
+                for i, future in enumerate(as_completed(futures), start=1):
+                    write(i, future.result())
+
+        elapsed = time.perf_counter() - t0
+        self.stdout.write(
+            f"合計: ファイル {totals['files']} / 作成{'予定' if dry_run else ''} {totals['created']}"
+            f" / 重複 {totals['duplicates']} / スキップ {totals['skipped']} / エラー {totals['errors']}"
+            f" / {elapsed:.2f}s"
+        )
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("dry-run のためDBへは書き込みません"))
+            return
+
+        rows_per_sec = totals["rows"] / totals["seconds"] if totals["seconds"] > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"INSERT完了: {totals['rows']} 件（{totals['seconds']:.2f}s / {rows_per_sec:,.0f} rows/sec）"
+        ))
+
+    def _handle_chunked(self, paths: list[Path], chunk_size: int, dry_run: bool) -> None:
+        """--chunk-size：1ファイルずつ、このプロセスだけで少しずつ読んで入れる"""
+        single = len(paths) == 1
+        self.stdout.write(f"対象ファイル: {len(paths)} / チャンク: {chunk_size} 行ごとにコミット")
 
-        created = 0
-        skipped = 0
-        errors = 0
-        src_set = set()
+        cat_map = {c.name: c for c in Category.objects.all()}
+        mem_map = {m.name: m for m in Member.objects.all()}
+        totals = {"files": 0, "created": 0, "duplicates": 0, "skipped": 0, "errors": 0, "rows": 0, "seconds": 0.0}
+        t0 = time.perf_counter()
+
+        for i, path in enumerate(paths, start=1):
+            head = f"[{i}/{len(paths)}] {path.name}"
 
-        for idx, r in enumerate(rows, start=2):
             try:
-                d = parse_date(r.get(COL_DATE))
-                shop = (r.get(COL_SHOP) or "").strip()
-                amt = parse_amount(r.get(COL_AMOUNT))
-                mem_name = (r.get(COL_MEMBER) or "").strip()
-                cat_name = (r.get(COL_CATEGORY) or "").strip()
-                src = (r.get(COL_SOURCE) or "").strip()
-                closed = parse_bool(r.get(COL_CLOSED))
-
-                src_set.add(src)
-
-                # 必須項目が欠けてる行だけスキップ（=データとして成立しない）
-                # ※重複判定によるスキップはしない（同日同額は普通にありえるため）
-                if not (d and shop and src):
-                    skipped += 1
-                    if skipped <= 20:
-                        self.stdout.write(self.style.WARNING(f"SKIP(empty) line={idx}: {r!r}"))
-                    continue
-
-                # Category / Member はなければ作る
-                cat_obj = None
-                if cat_name:
-                    cat_obj = cat_map.get(cat_name)
-                    if not cat_obj:
-                        cat_obj = Category.objects.create(name=cat_name)
-                        cat_map[cat_name] = cat_obj
-
-                mem_obj = None
-                if mem_name:
-                    mem_obj = mem_map.get(mem_name)
-                    if not mem_obj:
-                        mem_obj = Member.objects.create(name=mem_name)
-                        mem_map[mem_name] = mem_obj
-
-                to_create.append(
-                    Transaction(
-                        date=d,
-                        shop=shop,
-                        amount=amt,
-                        member=mem_obj,
-                        category=cat_obj,
-                        source_file=src,
-                        is_closed=closed,
-                        memo="",  # CSVに無いので空
-                    )
+                scan = scan_past_csv(str(path))
+            except ValueError as e:
+                if single:
+                    raise CommandError(str(e))
+                self.stdout.write(self.style.ERROR(f"{head}: {e}"))
+                continue
+
+            done = find_imported_batch(scan.file_sha256)
+            if done:
+                msg = f"同じ内容のファイルは取り込み済み: {done.file_name}（{done.created_at:%Y-%m-%d %H:%M}）"
+                if single:
+                    raise CommandError(msg)
+                self.stdout.write(self.style.WARNING(f"{head}: {msg}"))
+                continue
+
+            def progress(r: StreamResult) -> None:
+                self.stdout.write(
+                    f"{head}: line {r.last_line} まで{'確認' if dry_run else 'コミット'}"
+                    f" / 作成 {r.created} / 重複 {r.duplicates}"
                 )
-                created += 1
 
-            except Exception as e:
-                errors += 1
-                # 文字化けしても落ちないように repr で出す
-                self.stdout.write(self.style.WARNING(f"ROW ERROR line={idx}: {e!r}"))
+            try:
+                result = stream_past_csv(
+                    str(path),
+                    scan,
+                    cat_map,
+                    mem_map,
+                    chunk_size=chunk_size,
+                    dry_run=dry_run,
+                    note=lambda msg: self.stdout.write(self.style.WARNING(f"{head} {msg}")),
+                    progress=progress,
+                )
+            except MonthClosedError as e:
+                # コミット済みのチャンクはチェックポイントに残る（締めを戻せば続きから入る）
+                if single:
+                    raise CommandError(str(e))
+                self.stdout.write(self.style.ERROR(f"{head}: {e}"))
                 continue
 
-        self.stdout.write(f"作成予定: {created} / スキップ: {skipped} / エラー: {errors}")
-        self.stdout.write(f"source_file一覧: {sorted(src_set)}")
+            totals["files"] += 1
+            totals["created"] += result.created
+            totals["duplicates"] += result.duplicates
+            totals["skipped"] += result.skipped
+            totals["errors"] += result.errors
+            totals["rows"] += result.load.rows
+            totals["seconds"] += result.load.seconds
+
+            resumed = f"（line {result.resumed_from} の続きから）" if result.resumed_from else ""
+            self.stdout.write(self.style.SUCCESS(
+                f"{head}: 作成{'予定' if dry_run else ''} {result.created} / 重複 {result.duplicates}"
+                f" / スキップ {result.skipped} / エラー {result.errors}{resumed}"
+            ))
+            self.stdout.write(f"    source_file一覧: {sorted(result.sources)}")
+
+        elapsed = time.perf_counter() - t0
+        self.stdout.write(
+            f"合計: ファイル {totals['files']} / 作成{'予定' if dry_run else ''} {totals['created']}"
+            f" / 重複 {totals['duplicates']} / スキップ {totals['skipped']} / エラー {totals['errors']}"
+            f" / {elapsed:.2f}s"
+        )
 
         if dry_run:
             self.stdout.write(self.style.WARNING("dry-run のためDBへは書き込みません"))
             return
 
-        with transaction.atomic():
-            Transaction.objects.bulk_create(to_create, batch_size=1000)
-
-        self.stdout.write(self.style.SUCCESS(f"INSERT完了: {len(to_create)} 件"))
+        rows_per_sec = totals["rows"] / totals["seconds"] if totals["seconds"] > 0 else 0.0
+        self.stdout.write(self.style.SUCCESS(
+            f"INSERT完了: {totals['rows']} 件（{totals['seconds']:.2f}s / {rows_per_sec:,.0f} rows/sec）"
+        ))
@@ -0,0 +1,35 @@
+# transactions/management/commands/rebuild_monthly_totals.py
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transactions.services.monthly_total_service import rebuild_monthly_totals
+
+
+class Command(BaseCommand):
+    help = "明細から月次集計（MonthlyTotal）を作り直す（ずれていたキーの数も出す）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="DBには書かず、ずれているキーの数だけ確認する（ずれがあれば終了コード1）",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+
+        t0 = time.perf_counter()
+        result = rebuild_monthly_totals(dry_run=dry_run)
+        elapsed = time.perf_counter() - t0
+
+        self.stdout.write(f"集計行: {result.rows} / ずれ: {result.mismatched} / {elapsed:.2f}s")
+
+        if dry_run:
+            if result.mismatched:
+                raise CommandError("月次集計が明細とずれている（--dry-run を外して作り直してね）")
+            self.stdout.write(self.style.SUCCESS("月次集計は明細と一致"))
+        else:
+            self.stdout.write(self.style.SUCCESS("月次集計を作り直しました"))
@@ -0,0 +1,25 @@
+# transactions/management/commands/rebuild_search_index.py
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from transactions.services.search_service import has_fts, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "明細の検索用テキスト（search_text）を入れ直す（SQLite は FTS5 の表とトリガーも作り直す）"
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        n = rebuild_search_index()
+        elapsed = time.perf_counter() - t0
+
+        self.stdout.write(f"明細: {n} 件 / {elapsed:.2f}s")
+        if connection.vendor == "sqlite" and not has_fts():
+            self.stdout.write(self.style.WARNING(
+                "この SQLite には FTS5 の trigram が無いので、検索は LIKE のまま（3.34 以上で使える）"
+            ))
+        self.stdout.write(self.style.SUCCESS("検索インデックスを作り直しました"))
@@ -0,0 +1,14 @@
+# transactions/management/commands/rebuild_shop_assignments.py
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from transactions.services.shop_assignment_service import rebuild_shop_assignments
+
+
+class Command(BaseCommand):
+    help = "確定済み明細の履歴から「店名 → カテゴリ/メンバー」の学習テーブルを作り直す"
+
+    def handle(self, *args, **options):
+        n = rebuild_shop_assignments()
+        self.stdout.write(self.style.SUCCESS(f"ShopAssignment 再構築完了: {n} 店名"))
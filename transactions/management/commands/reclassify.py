@@ -0,0 +1,48 @@
+# transactions/management/commands/reclassify.py
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from transactions.services.reclassify_service import reclassify_open_transactions
+
+
+class Command(BaseCommand):
+    help = "未確定の明細に今の分類ルールをかけ直す（変わった行だけ更新）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="1回に読んで書き戻す件数（デフォルト: 2000）",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="DBには書かず、変わる件数だけ確認する",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+
+        t0 = time.perf_counter()
+        result = reclassify_open_transactions(
+            chunk_size=max(1, options["chunk_size"]),
+            dry_run=dry_run,
+        )
+        elapsed = time.perf_counter() - t0
+
+        self.stdout.write(
+            f"対象: {result.scanned} / 変更: {result.changed}"
+            f"（カテゴリ {result.category_changed} / メンバー {result.member_changed}）"
+            f" / {elapsed:.2f}s"
+        )
+        for rule, n in sorted(result.rule_counts.items(), key=lambda x: -x[1]):
+            self.stdout.write(f"  {rule}: {n}")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING("dry-run のためDBへは書き込みません"))
+        else:
+            self.stdout.write(self.style.SUCCESS("再分類完了"))
@@ -0,0 +1,81 @@
+# transactions/management/commands/run_import_worker.py
+from __future__ import annotations
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from transactions.models import ImportJob
+from transactions.services.import_job_service import STALE_SECONDS, claim_next_job, recover_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = "アップロードされたCSVの取込ジョブ（ImportJob）を順番に処理する"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="待ちのジョブを全部処理したら終了する（cron などから呼ぶ用）",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=2.0,
+            help="待ちが無いときに次を見に行くまでの秒数（デフォルト: 2）",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=STALE_SECONDS,
+            help=f"この秒数以上進んでいない「取込中」のジョブを失敗にする（デフォルト: {STALE_SECONDS}）",
+        )
+        parser.add_argument(
+            "--recover-every",
+            type=float,
+            default=300.0,
+            help="起動時に加えて、この秒数ごとに止まったジョブを探す（デフォルト: 300）",
+        )
+
+    def _recover(self, stale_after: int) -> None:
+        # 別のワーカーが落ちて「取込中」のまま残ったジョブを片付ける
+        for job in recover_stale_jobs(stale_after):
+            self.stdout.write(self.style.WARNING(f"[{job.id}] {job.file_name}: {job.message}"))
+
+    def handle(self, *args, **options):
+        once = options["once"]
+        interval = max(0.1, options["interval"])
+
+        recover_every = max(1.0, options["recover_every"])
+
+        self.stdout.write("import worker started")
+
+        self._recover(options["stale_after"])
+        last_recover = time.monotonic()
+
+        while True:
+            # 長時間動かすので、切れた接続はここで捨てる
+            close_old_connections()
+
+            # 常駐中も定期的に見る（他のワーカーが落ちても、次の再起動まで「取込中」のまま残らない）
+            if time.monotonic() - last_recover >= recover_every:
+                self._recover(options["stale_after"])
+                last_recover = time.monotonic()
+
+            job = claim_next_job()
+            if job is None:
+                if once:
+                    break
+                time.sleep(interval)
+                continue
+
+            t0 = time.perf_counter()
+            job = run_job(job)
+            elapsed = time.perf_counter() - t0
+
+            line = f"[{job.id}] {job.file_name}: {job.message} ({elapsed:.2f}s)"
+            if job.status == ImportJob.Status.DONE:
+                self.stdout.write(self.style.SUCCESS(line))
+            else:
+                self.stdout.write(self.style.ERROR(line))
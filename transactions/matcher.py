@@ -0,0 +1,74 @@
+# transactions/matcher.py
+"""
+複数キーワードの部分一致を「1回の走査」でまとめて判定するための小物。
+
+- Aho-Corasick 法のオートマトン（外部ライブラリなし・標準ライブラリのみ）
+- キーワードごとに任意のタグ（payload）を持たせて、テキスト中でヒットしたタグを全部返す
+- rules.py のコンパイル済みルールから使う
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from typing import Hashable, Iterable, Mapping
+
+
+class KeywordAutomaton:
+    """
+    keywords: {キーワード: [タグ, ...]}
+    search(text) で text に部分一致したキーワードのタグを set で返す。
+    ※ 空文字のキーワードは無視する
+    """
+
+    def __init__(self, keywords: Mapping[str, Iterable[Hashable]]):
+        goto: list[dict[str, int]] = [{}]
+        outputs: list[set] = [set()]
+
+        # ① トライ木を作る
+        for kw, tags in keywords.items():
+            if not kw:
+                continue
+            state = 0
+            for ch in kw:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    outputs.append(set())
+                state = nxt
+            outputs[state].update(tags)
+
+        # ② 失敗リンク（BFS）＋ 出力のマージ
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                cand = goto[f].get(ch, 0)
+                fail[nxt] = cand if cand != nxt else 0
+                outputs[nxt] |= outputs[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [frozenset(o) for o in outputs]
+
+    def search(self, text: str) -> set:
+        goto = self._goto
+        fail = self._fail
+        outputs = self._outputs
+
+        found: set = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            out = outputs[state]
+            if out:
+                found |= out
+        return found
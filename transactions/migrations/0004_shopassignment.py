@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0002_alter_member_options_remove_member_created_at_and_more'),
+        ('transactions', '0003_remove_transaction_import_month_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shop_norm', models.CharField(max_length=255, unique=True, verbose_name='正規化店名')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='transactions.category', verbose_name='カテゴリ')),
+                ('member', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='members.member', verbose_name='メンバー')),
+            ],
+            options={
+                'verbose_name': '学習済み割り当て',
+                'verbose_name_plural': '学習済み割り当て',
+                'ordering': ['shop_norm'],
+            },
+        ),
+    ]
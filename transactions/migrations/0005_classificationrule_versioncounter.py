@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0004_shopassignment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassificationRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('category', 'カテゴリ'), ('category_ng', 'カテゴリ：分類しない'), ('member', 'メンバー'), ('member_ng', 'メンバー：分類しない'), ('weekend_shared', 'メンバー：土日は共有・平日はゆ'), ('derma_clinic', '皮膚科（同日判定の基準）'), ('derma_pharmacy', '皮膚科の薬局（同日ならゆ・それ以外はな）')], max_length=20, verbose_name='種類')),
+                ('keyword', models.CharField(max_length=255, verbose_name='キーワード')),
+                ('target', models.CharField(blank=True, default='', help_text='カテゴリ名 / メンバー名（種類がカテゴリ・メンバーのときだけ）', max_length=50, verbose_name='割り当て先')),
+                ('priority', models.IntegerField(default=0, help_text='小さいほど先に判定', verbose_name='優先順')),
+                ('is_active', models.BooleanField(default=True, verbose_name='有効')),
+            ],
+            options={
+                'verbose_name': '分類ルール',
+                'verbose_name_plural': '分類ルール',
+                'ordering': ['kind', 'priority', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='VersionCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='名前')),
+                ('value', models.BigIntegerField(default=0, verbose_name='バージョン')),
+            ],
+            options={
+                'verbose_name': 'バージョン',
+                'verbose_name_plural': 'バージョン',
+            },
+        ),
+    ]
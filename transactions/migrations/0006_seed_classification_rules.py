@@ -0,0 +1,138 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:35
+
+from django.db import migrations
+
+# 初期ルール（この時点の rules.py の定義をそのまま固定しておく。
+# rules.py を後から直しても、このマイグレーションで入る中身は変わらない）
+
+SHOP_RULES = {
+    "水道": ["東京都水道局"],
+    "電気": ["LOOOP", "Loooopでんき"],
+    "ガス": ["エルピオ"],
+    "インターネット": ["東京ベイネットワーク"],
+
+    "食品・日用品": [
+        "ライフ", "まいばすけっと", "オーケー",
+        "NEWDAYS", "ファミリーマート", "セブン", "ローソン",
+        "セリア", "アトレ亀戸", "KAMEIDO CLOCK", "コーナン",
+        "ココカラファイン", "マツモトキヨシ", "スギ薬局",
+        "カルディ", "シャトレーゼ", "おかしのまちおか", "ミスタードーナツ",
+    ],
+
+    "外食": [
+        "雛鮨", "インド", "マクドナルド", "大戸屋", "吉野家",
+        "笑縁食堂", "ママクック", "パスタママ",
+    ],
+
+    "娯楽": [
+        "クックパッド", "DMM", "GOOGLE PLAY JAPAN", "ニンテンドー",
+        "STEAMGAMES",
+    ],
+
+    "医療": ["亀戸駅前薬局", "錦糸町皮膚科内科クリニック"],
+    "衣服・美容": ["ユニクロ"],
+    "教養": ["APPLE COM BILL"],
+    "その他": ["ソフトバンクM"],
+}
+
+UNCLASSIFIABLE = ["AMAZON.CO.JP", "ＡＭＡＺＯＮ．ＣＯ．ＪＰ"]
+
+# ルール：店名に「これ」が含まれてたらこのメンバー
+MEMBER_RULES = {
+    "な": [
+        "ＡＰＰＬＥ　ＣＯＭ　ＢＩＬＬ",
+    ],
+    "ゆ": [
+        "笑縁食堂",
+        "ママクック",
+        "パスタママ",
+        "錦糸町皮膚科内科クリニック",
+        "ソフトバンクＭ",
+    ],
+    "共有": [
+        "東京都水道局",
+        "Ｌｏｏｏｐでんき",
+        "エルピオ",
+        "東京ベイネットワーク",
+        "ライフ",
+        "まいばすけっと",
+        "オーケー",
+        "セリア",
+        "アトレ亀戸",
+        "ＫＡＭＥＩＤＯ  ＣＬＯＣＫ",
+        "コーナン",
+        "ココカラファイン",
+        "マツモトキヨシ",
+        "スギ薬局",
+        "カルディ",
+        "シャトレーゼ",
+        "おかしのまちおか",
+        "ミスタードーナツ",
+        "雛鮨",
+        "インド",
+        "マクドナルド",
+        "クックパッド",
+        "ＤＭＭ",
+    ],
+}
+
+# 分類しない（Noneで返す）
+MEMBER_UNCLASSIFIABLE = [
+    "ＡＭＡＺＯＮ．ＣＯ．ＪＰ",
+    "ニンテンドー",
+    "STEAMGAMES",
+    "ユニクロ",
+]
+
+# 条件分岐：土日なら共有、平日ならゆ（対象店）
+WEEKEND_SHARED_WEEKDAY_YU = [
+    "ＮｅｗＤａｙｓ",
+    "ファミリーマート",
+    "セブン",
+    "ローソン",
+    "大戸屋",
+    "吉野家",
+]
+
+DERMA_CLINIC = "錦糸町皮膚科内科クリニック"
+DERMA_PHARMACY = "亀戸駅前薬局"
+
+
+def seed_rules(apps, schema_editor):
+    """初期ルールを ClassificationRule に入れる（定義順 = priority）"""
+    ClassificationRule = apps.get_model("transactions", "ClassificationRule")
+
+    objs = []
+    for i, (name, keywords) in enumerate(SHOP_RULES.items()):
+        for kw in keywords:
+            objs.append(ClassificationRule(kind="category", keyword=kw, target=name, priority=i))
+    for i, (name, keywords) in enumerate(MEMBER_RULES.items()):
+        for kw in keywords:
+            objs.append(ClassificationRule(kind="member", keyword=kw, target=name, priority=i))
+
+    for kind, keywords in (
+        ("category_ng", UNCLASSIFIABLE),
+        ("member_ng", MEMBER_UNCLASSIFIABLE),
+        ("weekend_shared", WEEKEND_SHARED_WEEKDAY_YU),
+        ("derma_clinic", [DERMA_CLINIC]),
+        ("derma_pharmacy", [DERMA_PHARMACY]),
+    ):
+        for kw in keywords:
+            objs.append(ClassificationRule(kind=kind, keyword=kw))
+
+    ClassificationRule.objects.bulk_create(objs)
+
+
+def unseed_rules(apps, schema_editor):
+    apps.get_model("transactions", "ClassificationRule").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0005_classificationrule_versioncounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_rules, unseed_rules),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:45
+
+import hashlib
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def backfill_row_fingerprint(apps, schema_editor):
+    """既存の明細にも row_fingerprint を入れる（source_file ごとに id 順で「何件目か」を数える）"""
+    Transaction = apps.get_model("transactions", "Transaction")
+
+    seen: dict[str, Counter] = {}
+    pending = []
+    rows = (
+        Transaction.objects
+        .order_by("source_file", "id")
+        .only("id", "date", "shop", "amount", "source_file")
+        .iterator(chunk_size=2000)
+    )
+    for t in rows:
+        counter = seen.setdefault(t.source_file, Counter())
+        key = (t.date, t.shop, t.amount)
+        occurrence = counter[key]
+        counter[key] = occurrence + 1
+
+        raw = f"{t.date.isoformat()}\t{t.shop}\t{t.amount}\t{occurrence}"
+        t.row_fingerprint = hashlib.sha256(raw.encode("utf-8")).hexdigest()
+        pending.append(t)
+        if len(pending) >= 2000:
+            Transaction.objects.bulk_update(pending, ["row_fingerprint"])
+            pending = []
+    if pending:
+        Transaction.objects.bulk_update(pending, ["row_fingerprint"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0006_seed_classification_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255, verbose_name='ファイル名')),
+                ('file_sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('row_count', models.IntegerField(default=0, verbose_name='追加件数')),
+                ('duplicate_count', models.IntegerField(default=0, verbose_name='重複スキップ件数')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='取込日時')),
+            ],
+            options={
+                'verbose_name': '取込履歴',
+                'verbose_name_plural': '取込履歴',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='row_fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64, verbose_name='行フィンガープリント'),
+        ),
+        migrations.RunPython(backfill_row_fingerprint, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0007_importbatch_row_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255, verbose_name='ファイル名')),
+                ('staged_path', models.CharField(max_length=500, verbose_name='置き場所')),
+                ('status', models.CharField(choices=[('queued', '待ち'), ('running', '取込中'), ('done', '完了'), ('failed', '失敗')], db_index=True, default='queued', max_length=10, verbose_name='状態')),
+                ('rows_parsed', models.IntegerField(default=0, verbose_name='読んだ行数')),
+                ('rows_inserted', models.IntegerField(default=0, verbose_name='追加件数')),
+                ('rows_duplicate', models.IntegerField(default=0, verbose_name='重複件数')),
+                ('rows_skipped', models.IntegerField(default=0, verbose_name='スキップ件数')),
+                ('rows_error', models.IntegerField(default=0, verbose_name='エラー件数')),
+                ('message', models.TextField(blank=True, default='', verbose_name='メッセージ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='受付日時')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+                ('batch', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='transactions.importbatch', verbose_name='取込履歴')),
+            ],
+            options={
+                'verbose_name': '取込ジョブ',
+                'verbose_name_plural': '取込ジョブ',
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+    ]
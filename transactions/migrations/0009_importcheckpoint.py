@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-16 20:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0008_importjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_name', models.CharField(max_length=255, verbose_name='ファイル名')),
+                ('file_sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256')),
+                ('last_line', models.IntegerField(default=0, verbose_name='取込済みの最終行')),
+                ('row_count', models.IntegerField(default=0, verbose_name='追加件数')),
+                ('duplicate_count', models.IntegerField(default=0, verbose_name='重複スキップ件数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '取込チェックポイント',
+                'verbose_name_plural': '取込チェックポイント',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0009_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importbatch',
+            name='telemetry',
+            field=models.JSONField(blank=True, default=dict, verbose_name='計測'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:06
+
+import re
+from datetime import date
+
+from django.db import migrations, models
+
+
+def backfill_billing_month(apps, schema_editor):
+    """既存の明細にも billing_month を入れる（source_file ごとに1回の UPDATE）"""
+    Transaction = apps.get_model("transactions", "Transaction")
+
+    sources = (
+        Transaction.objects
+        .exclude(source_file="")
+        .values_list("source_file", flat=True)
+        .distinct()
+    )
+    for sf in list(sources):
+        m = re.search(r"(\d{6})", sf)
+        if not m:
+            continue
+        y, mo = int(m.group(1)[:4]), int(m.group(1)[4:])
+        if not (1 <= mo <= 12) or y < 1:
+            continue
+        Transaction.objects.filter(source_file=sf).update(billing_month=date(y, mo, 1))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0010_importbatch_telemetry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='billing_month',
+            field=models.DateField(blank=True, db_index=True, null=True, verbose_name='請求月'),
+        ),
+        migrations.RunPython(backfill_billing_month, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:08
+
+import re
+from datetime import date
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def _billing_month(name):
+    m = re.search(r"(\d{6})", name)
+    if not m:
+        return None
+    y, mo = int(m.group(1)[:4]), int(m.group(1)[4:])
+    if not (1 <= mo <= 12) or y < 1:
+        return None
+    return date(y, mo, 1)
+
+
+def source_file_to_import_file(apps, schema_editor):
+    """source_file の種類ごとに ImportFile を作って、明細の import_file を埋める"""
+    Transaction = apps.get_model("transactions", "Transaction")
+    ImportFile = apps.get_model("transactions", "ImportFile")
+    ImportBatch = apps.get_model("transactions", "ImportBatch")
+
+    counts = (
+        Transaction.objects
+        .exclude(source_file="")
+        .values("source_file")
+        .annotate(n=models.Count("id"))
+    )
+    for r in list(counts):
+        name = r["source_file"]
+        batch = ImportBatch.objects.filter(file_name=name).order_by("-created_at").first()
+        f = ImportFile.objects.create(
+            name=name,
+            billing_month=_billing_month(name),
+            row_count=r["n"],
+            imported_at=batch.created_at if batch else django.utils.timezone.now(),
+        )
+        Transaction.objects.filter(source_file=name).update(import_file=f)
+
+
+def import_file_to_source_file(apps, schema_editor):
+    Transaction = apps.get_model("transactions", "Transaction")
+    ImportFile = apps.get_model("transactions", "ImportFile")
+    for f in ImportFile.objects.all():
+        Transaction.objects.filter(import_file=f).update(source_file=f.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0011_transaction_billing_month'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='ファイル名')),
+                ('billing_month', models.DateField(blank=True, null=True, verbose_name='請求月')),
+                ('row_count', models.IntegerField(default=0, verbose_name='件数')),
+                ('imported_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='取込日時')),
+            ],
+            options={
+                'verbose_name': '取込ファイル',
+                'verbose_name_plural': '取込ファイル',
+                'ordering': ['-billing_month', '-id'],
+                'indexes': [models.Index(fields=['-billing_month', '-id'], name='importfile_latest_idx')],
+            },
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='import_file',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='transactions.importfile', verbose_name='ファイル'),
+        ),
+        migrations.RunPython(source_file_to_import_file, import_file_to_source_file),
+        migrations.RemoveField(
+            model_name='transaction',
+            name='source_file',
+        ),
+    ]
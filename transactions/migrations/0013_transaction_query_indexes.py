@@ -0,0 +1,45 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0002_alter_member_options_remove_member_created_at_and_more'),
+        ('transactions', '0012_importfile'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['import_file', '-date', '-id'], name='txn_file_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('category__isnull', True), ('member__isnull', True), _connector='OR'), fields=['import_file', '-date', '-id'], name='txn_file_unassigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['import_file', 'is_closed', 'member', 'amount'], name='txn_file_closed_member_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['import_file', 'category', 'amount'], name='txn_file_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['billing_month', 'category', 'amount'], name='txn_month_category_idx'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='billing_month',
+            field=models.DateField(blank=True, null=True, verbose_name='請求月'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='import_file',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transactions', to='transactions.importfile', verbose_name='ファイル'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_monthly_totals(apps, schema_editor):
+    """今ある明細から月次集計を作る"""
+    Transaction = apps.get_model("transactions", "Transaction")
+    MonthlyTotal = apps.get_model("transactions", "MonthlyTotal")
+
+    rows = (
+        Transaction.objects
+        .filter(billing_month__isnull=False)
+        .order_by()
+        .values("billing_month", "category_id", "member_id", "is_closed")
+        .annotate(total=models.Sum("amount"), count=models.Count("amount"))
+    )
+    MonthlyTotal.objects.bulk_create(
+        [
+            MonthlyTotal(
+                month=r["billing_month"],
+                category_id=r["category_id"],
+                member_id=r["member_id"],
+                is_closed=r["is_closed"],
+                total=r["total"] or 0,
+                count=r["count"],
+            )
+            for r in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0002_alter_member_options_remove_member_created_at_and_more'),
+        ('transactions', '0013_transaction_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='請求月')),
+                ('is_closed', models.BooleanField(default=False, verbose_name='確定済みか')),
+                ('total', models.BigIntegerField(default=0, verbose_name='合計')),
+                ('count', models.IntegerField(default=0, verbose_name='件数')),
+            ],
+            options={
+                'verbose_name': '月次集計',
+                'verbose_name_plural': '月次集計',
+                'ordering': ['month', 'id'],
+            },
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='txn_file_category_idx',
+        ),
+        migrations.AddField(
+            model_name='monthlytotal',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='transactions.category', verbose_name='カテゴリ'),
+        ),
+        migrations.AddField(
+            model_name='monthlytotal',
+            name='member',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='members.member', verbose_name='メンバー'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlytotal',
+            index=models.Index(fields=['month', 'category', 'member', 'is_closed'], name='monthlytotal_key_idx'),
+        ),
+        migrations.RunPython(build_monthly_totals, migrations.RunPython.noop),
+    ]
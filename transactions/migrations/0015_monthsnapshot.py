@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0014_monthlytotal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(unique=True, verbose_name='請求月')),
+                ('row_count', models.IntegerField(default=0, verbose_name='件数')),
+                ('total', models.BigIntegerField(default=0, verbose_name='合計')),
+                ('totals', models.JSONField(default=list, verbose_name='カテゴリ×メンバー別')),
+                ('shops', models.JSONField(default=list, verbose_name='店×カテゴリ別')),
+                ('max_rows', models.JSONField(default=list, verbose_name='カテゴリ別の最高額')),
+                ('closed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='締め日時')),
+            ],
+            options={
+                'verbose_name': '月次スナップショット',
+                'verbose_name_plural': '月次スナップショット',
+                'ordering': ['month'],
+            },
+        ),
+    ]
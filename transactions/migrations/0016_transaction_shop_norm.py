@@ -0,0 +1,68 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:40
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+import transactions.models
+
+
+def _norm(s):
+    # rules._norm と同じ（マイグレーションはその時点の書き方で固定しておく）
+    s = unicodedata.normalize("NFKC", s or "")
+    s = s.upper()
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def backfill_shop_norm(apps, schema_editor):
+    """既存の明細にも shop_norm を入れる（id 順に 2000 件ずつ bulk_update。店名ごとの正規化は1回だけ）"""
+    Transaction = apps.get_model("transactions", "Transaction")
+
+    cache = {}
+    batch = []
+    for t in Transaction.objects.order_by("id").only("id", "shop").iterator(chunk_size=2000):
+        shop_n = cache.get(t.shop)
+        if shop_n is None:
+            shop_n = cache[t.shop] = _norm(t.shop)
+        t.shop_norm = shop_n
+        batch.append(t)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ["shop_norm"])
+            batch = []
+    if batch:
+        Transaction.objects.bulk_update(batch, ["shop_norm"])
+
+
+def renormalize_snapshots(apps, schema_editor):
+    """締めた月のスナップショットも店別を正規化店名で数え直す（表記ゆれの行をまとめる）"""
+    MonthSnapshot = apps.get_model("transactions", "MonthSnapshot")
+
+    for snap in MonthSnapshot.objects.all():
+        acc = {}
+        for shop, c, total, n in snap.shops:
+            a = acc.setdefault((_norm(shop), c), [0, 0])
+            a[0] += total
+            a[1] += n
+        snap.shops = [
+            [shop_n, c, total, n]
+            for (shop_n, c), (total, n) in sorted(acc.items(), key=lambda kv: kv[0][0])
+        ]
+        snap.save(update_fields=["shops"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0015_monthsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='shop_norm',
+            field=transactions.models.ShopNormField(blank=True, db_index=True, default='', editable=False, max_length=255, verbose_name='正規化店名'),
+        ),
+        migrations.RunPython(backfill_shop_norm, migrations.RunPython.noop),
+        migrations.RunPython(renormalize_snapshots, migrations.RunPython.noop),
+    ]
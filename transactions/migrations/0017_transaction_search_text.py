@@ -0,0 +1,110 @@
+# Generated by Django 5.2.8 on 2026-10-16 21:55
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+import transactions.models
+
+FTS_TABLE = "transactions_transaction_fts"
+
+
+def _norm(s):
+    # rules._norm と同じ（マイグレーションはその時点の書き方で固定しておく）
+    s = unicodedata.normalize("NFKC", s or "")
+    s = s.upper()
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def backfill_search_text(apps, schema_editor):
+    """既存の明細にも search_text を入れる（id 順に 2000 件ずつ bulk_update）"""
+    Transaction = apps.get_model("transactions", "Transaction")
+
+    batch = []
+    for t in Transaction.objects.order_by("id").only("id", "shop", "memo").iterator(chunk_size=2000):
+        t.search_text = _norm(f"{t.shop} {t.memo or ''}")
+        batch.append(t)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ["search_text"])
+            batch = []
+    if batch:
+        Transaction.objects.bulk_update(batch, ["search_text"])
+
+
+def create_search_index(apps, schema_editor):
+    """
+    PostgreSQL：pg_trgm の GIN インデックス（LIKE '%x%' がインデックスで引ける）
+    SQLite：search_text を写す FTS5（trigram）の外部コンテンツ表 + 同期トリガー
+      → trigram トークナイザが無い古い SQLite では作らない（search_service が LIKE に戻す）
+    """
+    conn = schema_editor.connection
+    table = conn.ops.quote_name("transactions_transaction")
+
+    if conn.vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS txn_search_trgm_idx ON {table} USING gin (search_text gin_trgm_ops)"
+        )
+        return
+
+    if conn.vendor != "sqlite":
+        return
+
+    from django.db import DatabaseError
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE VIRTUAL TABLE temp._fts_probe USING fts5(x, tokenize='trigram')")
+            cursor.execute("DROP TABLE temp._fts_probe")
+    except DatabaseError:
+        return
+
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"search_text, content='transactions_transaction', content_rowid='id', tokenize='trigram')"
+    )
+    schema_editor.execute(f"""
+        CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+        END
+    """)
+    schema_editor.execute(f"""
+        CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        END
+    """)
+    schema_editor.execute(f"""
+        CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF search_text ON {table} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+            INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+        END
+    """)
+    schema_editor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS txn_search_trgm_idx")
+    elif conn.vendor == "sqlite":
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0016_transaction_shop_norm'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='search_text',
+            field=transactions.models.SearchTextField(blank=True, default='', editable=False, verbose_name='検索用テキスト'),
+        ),
+        migrations.RunPython(backfill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
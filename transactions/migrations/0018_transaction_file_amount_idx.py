@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-16 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0017_transaction_search_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['import_file', 'amount'], name='txn_file_amount_idx'),
+        ),
+    ]
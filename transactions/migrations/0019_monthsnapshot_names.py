@@ -0,0 +1,41 @@
+# Generated by Django 5.2.8 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+def backfill_names(apps, schema_editor):
+    """
+    既に締めてあるスナップショットにも names を入れる
+    締めた時点の名前はもう分からないので、今の名前で固める（以後の名前変更では変わらない）
+    """
+    Category = apps.get_model("transactions", "Category")
+    Member = apps.get_model("members", "Member")
+    MonthSnapshot = apps.get_model("transactions", "MonthSnapshot")
+
+    cat_names = dict(Category.objects.values_list("id", "name"))
+    mem_names = dict(Member.objects.values_list("id", "name"))
+    for snap in MonthSnapshot.objects.all():
+        cat_ids = {r[0] for r in snap.totals} | {r[1] for r in snap.shops}
+        mem_ids = {r[1] for r in snap.totals}
+        snap.names = {
+            "category": {str(i): cat_names[i] for i in cat_ids if i in cat_names},
+            "member": {str(i): mem_names[i] for i in mem_ids if i in mem_names},
+        }
+        snap.save(update_fields=["names"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('members', '0002_alter_member_options_remove_member_created_at_and_more'),
+        ('transactions', '0018_transaction_file_amount_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthsnapshot',
+            name='names',
+            field=models.JSONField(default=dict, verbose_name='締めた時点の名前'),
+        ),
+        migrations.RunPython(backfill_names, migrations.RunPython.noop),
+    ]
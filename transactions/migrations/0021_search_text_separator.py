@@ -0,0 +1,49 @@
+# Generated by Django 5.2.8 on 2026-10-17 00:30
+
+import re
+import unicodedata
+
+from django.db import migrations
+
+
+def _norm(s):
+    # rules._norm と同じ（マイグレーションはその時点の書き方で固定しておく）
+    s = unicodedata.normalize("NFKC", s or "")
+    s = s.upper()
+    return re.sub(r"\s+", " ", s).strip()
+
+
+def _search_text(shop, memo):
+    # models.build_search_text と同じ（店名とメモの間は改行）
+    memo_n = _norm(memo)
+    return f"{_norm(shop)}\n{memo_n}" if memo_n else _norm(shop)
+
+
+def rebuild_search_text(apps, schema_editor):
+    """
+    search_text を「店名 + 改行 + メモ」で入れ直す（空白でつないでいたので、境目をまたいでヒットしていた）
+    メモのある明細だけ変わる。SQLite の FTS 表は UPDATE のトリガーで追従する
+    """
+    Transaction = apps.get_model("transactions", "Transaction")
+
+    batch = []
+    rows = Transaction.objects.exclude(memo="").order_by("id").only("id", "shop", "memo")
+    for t in rows.iterator(chunk_size=2000):
+        t.search_text = _search_text(t.shop, t.memo)
+        batch.append(t)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ["search_text"])
+            batch = []
+    if batch:
+        Transaction.objects.bulk_update(batch, ["search_text"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transactions', '0020_importjob_created_by'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_text, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,10 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from members.models import Member
 
+from .rules import normalize_shop
+
 class Category(models.Model):
     name = models.CharField("カテゴリ名", max_length=50)
 
@@ -8,9 +12,64 @@ class Category(models.Model):
         return self.name
 
 
+class ImportFile(models.Model):
+    """
+    明細の取込元ファイル（"202601.csv" など）1つ = 1行。明細は FK でここを指す
+    最新ファイルは (-billing_month, -id) のインデックスで1行だけ引く（latest_import_file）
+    """
+    name = models.CharField("ファイル名", max_length=255, unique=True)
+    billing_month = models.DateField("請求月", null=True, blank=True)
+    row_count = models.IntegerField("件数", default=0)
+    imported_at = models.DateTimeField("取込日時", default=timezone.now)
+
+    class Meta:
+        ordering = ["-billing_month", "-id"]
+        indexes = [
+            models.Index(fields=["-billing_month", "-id"], name="importfile_latest_idx"),
+        ]
+        verbose_name = "取込ファイル"
+        verbose_name_plural = "取込ファイル"
+
+    def __str__(self):
+        return self.name
+
+
+class ShopNormField(models.CharField):
+    """保存のたびに同じモデルの shop から正規化キーを作って入れる CharField"""
+
+    def pre_save(self, model_instance, add):
+        value = normalize_shop(model_instance.shop)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
+# 検索用テキストの店名とメモの区切り。正規化（空白を1個にする）で検索語には絶対に残らない文字なので、
+# 店名の終わり〜メモの始まりをまたいだ部分一致にならない
+SEARCH_TEXT_SEP = "\n"
+
+
+def build_search_text(shop: str, memo: str | None) -> str:
+    """店名とメモをそれぞれ正規化して SEARCH_TEXT_SEP でつなぐ（メモが空なら店名だけ）"""
+    memo_n = normalize_shop(memo or "")
+    shop_n = normalize_shop(shop)
+    return f"{shop_n}{SEARCH_TEXT_SEP}{memo_n}" if memo_n else shop_n
+
+
+class SearchTextField(models.TextField):
+    """保存のたびに shop と memo を正規化してつないだ検索用テキストを入れる TextField（search_service が引く）"""
+
+    def pre_save(self, model_instance, add):
+        value = build_search_text(model_instance.shop, model_instance.memo)
+        setattr(model_instance, self.attname, value)
+        return value
+
+
 class Transaction(models.Model):
     date = models.DateField("日付")
     shop = models.CharField("店名・サービス名", max_length=255)
+    # 店名の正規化キー（全半角統一・大文字・空白1個。rules.normalize_shop）。検索・店別集計・ルール照合はこっちを使う
+    # 取込（bulk_create / COPY）でも admin の保存でも pre_save で入る → 入れ忘れない
+    shop_norm = ShopNormField("正規化店名", max_length=255, blank=True, default="", editable=False, db_index=True)
     amount = models.IntegerField("金額")
 
     member = models.ForeignKey(
@@ -32,17 +91,53 @@ class Transaction(models.Model):
     )
 
     memo = models.TextField("メモ", blank=True, default="")
-    source_file = models.CharField("ファイル名", max_length=255, blank=True, default="")
+    # 検索用：正規化した「店名 メモ」。PostgreSQL は pg_trgm の GIN、SQLite は FTS5（trigram）で引く（migration 0017）
+    search_text = SearchTextField("検索用テキスト", blank=True, default="", editable=False)
+    import_file = models.ForeignKey(
+        ImportFile,
+        on_delete=models.PROTECT,
+        related_name="transactions",
+        verbose_name="ファイル",
+        null=True,
+        blank=True,
+        db_index=False,  # import_file が先頭の複合インデックス（Meta.indexes）で足りる
+    )
+    # 請求月（その月の1日）。ファイル名の YYYYMM から取込時に入れる（billing_month.py）
+    billing_month = models.DateField("請求月", null=True, blank=True)
     is_closed = models.BooleanField("確定済みか", default=False)
 
+    # 重複取込チェック用：(日付, 店名, 金額, 同じ組み合わせの何件目か) のハッシュ
+    row_fingerprint = models.CharField("行フィンガープリント", max_length=64, blank=True, default="", db_index=True)
+
     class Meta:
         ordering = ["-date", "-id"]
+        # 画面ごとの実際のクエリに合わせたインデックス（check_query_plans で確認できる）
+        indexes = [
+            # 一覧・行API：最新ファイルを -date, -id 順に
+            models.Index(fields=["import_file", "-date", "-id"], name="txn_file_date_idx"),
+            # 編集モード：最新ファイルの未割当（カテゴリ or メンバーが NULL）だけ。該当行だけの部分インデックス
+            models.Index(
+                fields=["import_file", "-date", "-id"],
+                condition=models.Q(category__isnull=True) | models.Q(member__isnull=True),
+                name="txn_file_unassigned_idx",
+            ),
+            # 検索の amount>= / amount:1000..5000：最新ファイルの中を金額の範囲で
+            models.Index(fields=["import_file", "amount"], name="txn_file_amount_idx"),
+            # 精算サマリ：ファイル × 確定済み → メンバー別合計（amount まで入れて表を読まずに済ませる）
+            models.Index(fields=["import_file", "is_closed", "member", "amount"], name="txn_file_closed_member_idx"),
+            # 内訳（店別）・高額単発：請求月（範囲/一致）× カテゴリ
+            models.Index(fields=["billing_month", "category", "amount"], name="txn_month_category_idx"),
+        ]
         verbose_name = "明細"
         verbose_name_plural = "明細"
 
     def __str__(self):
         return f"{self.date} {self.shop} {self.amount}円"
     
+    @property
+    def source_file(self):
+        return self.import_file.name if self.import_file_id else ""
+
     @property
     def date_label(self):
         youbi = ["月", "火", "水", "木", "金", "土", "日"]
@@ -52,3 +147,267 @@ class Transaction(models.Model):
     @property
     def import_month_label(self):
         return self.import_month.strftime("%Y/%m")
+
+
+class MonthlyTotal(models.Model):
+    """
+    請求月 × カテゴリ × メンバー × 確定済みか ごとの合計（分析画面は明細ではなくここを読む）
+    明細の追加・変更・削除と同じトランザクションで差分を足す（monthly_total_service.py）
+    ずれたら rebuild_monthly_totals で明細から作り直す
+    ※ 同じキーの行が2つできても、読む側は必ず Sum するので結果は変わらない
+    """
+    month = models.DateField("請求月")
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="カテゴリ",
+        null=True,
+        blank=True,
+    )
+    member = models.ForeignKey(
+        Member,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="メンバー",
+        null=True,
+        blank=True,
+    )
+    is_closed = models.BooleanField("確定済みか", default=False)
+    total = models.BigIntegerField("合計", default=0)
+    count = models.IntegerField("件数", default=0)
+
+    class Meta:
+        ordering = ["month", "id"]
+        indexes = [
+            models.Index(fields=["month", "category", "member", "is_closed"], name="monthlytotal_key_idx"),
+        ]
+        verbose_name = "月次集計"
+        verbose_name_plural = "月次集計"
+
+    def __str__(self):
+        return f"{self.month:%Y%m} {self.category_id}/{self.member_id}/{self.is_closed}: {self.total}円"
+
+
+class MonthSnapshot(models.Model):
+    """
+    締めた請求月の集計（month_close_service.close_month で作る。作ったあとは書き換えない）
+    締めた月の明細は変更できない（monthly_total_service が MonthClosedError で止める）
+    直したいときは締めを戻す（= この行を消す）→ 直す → もう一度締める
+    集計の JSON は id で持ち、id → 名前は締めた時点のものを names に固めておく
+    （あとでカテゴリ名を変えたり消したりしても、締めた月の分析は締めたときの名前のまま）
+    """
+    month = models.DateField("請求月", unique=True)
+    row_count = models.IntegerField("件数", default=0)
+    total = models.BigIntegerField("合計", default=0)
+    # [[category_id, member_id, 合計, 件数], ...]
+    totals = models.JSONField("カテゴリ×メンバー別", default=list)
+    # [[正規化店名, category_id, 合計, 件数], ...]
+    shops = models.JSONField("店×カテゴリ別", default=list)
+    # [[category_id, 金額, 店名, 明細id], ...]（カテゴリごとの一番高い1件。同額なら id の小さい方）
+    max_rows = models.JSONField("カテゴリ別の最高額", default=list)
+    # {"category": {"category_id": 名前}, "member": {"member_id": 名前}}（締めた時点の名前。キーは文字列）
+    names = models.JSONField("締めた時点の名前", default=dict)
+    closed_at = models.DateTimeField("締め日時", default=timezone.now)
+
+    class Meta:
+        ordering = ["month"]
+        verbose_name = "月次スナップショット"
+        verbose_name_plural = "月次スナップショット"
+
+    def __str__(self):
+        return f"{self.month:%Y%m}（{self.row_count}件 / {self.total}円）"
+
+
+class ImportBatch(models.Model):
+    """取り込んだCSVファイル1つ = 1行。同じ中身のファイル（SHA-256）は2回取り込まない"""
+    file_name = models.CharField("ファイル名", max_length=255)
+    file_sha256 = models.CharField("SHA-256", max_length=64, unique=True)
+    row_count = models.IntegerField("追加件数", default=0)
+    duplicate_count = models.IntegerField("重複スキップ件数", default=0)
+    # フェーズ別の秒数・rows/sec・ピークメモリ・スキップ/エラー行のサンプル（import_telemetry.py）
+    telemetry = models.JSONField("計測", default=dict, blank=True)
+    created_at = models.DateTimeField("取込日時", auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        verbose_name = "取込履歴"
+        verbose_name_plural = "取込履歴"
+
+    def __str__(self):
+        return f"{self.file_name} ({self.created_at:%Y-%m-%d %H:%M})"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    import_past_csv --chunk-size の途中経過（ファイル1つ = 1行）。
+    チャンクを入れたのと同じトランザクションで last_line を進めるので、落ちてもここから再開できる。
+    最後まで入ったら消して ImportBatch を作る。
+    """
+    file_name = models.CharField("ファイル名", max_length=255)
+    file_sha256 = models.CharField("SHA-256", max_length=64, unique=True)
+    last_line = models.IntegerField("取込済みの最終行", default=0)
+    row_count = models.IntegerField("追加件数", default=0)
+    duplicate_count = models.IntegerField("重複スキップ件数", default=0)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        verbose_name = "取込チェックポイント"
+        verbose_name_plural = "取込チェックポイント"
+
+    def __str__(self):
+        return f"{self.file_name} (line {self.last_line})"
+
+
+class ImportJob(models.Model):
+    """
+    アップロードされたCSVの取込待ち行列（1アップロード = 1行）。
+    画面はファイルを置いてここに積むだけで、実際の取込は run_import_worker が行う。
+    進捗は積んだユーザー（created_by）にだけ見せる。
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "待ち"
+        RUNNING = "running", "取込中"
+        DONE = "done", "完了"
+        FAILED = "failed", "失敗"
+
+    file_name = models.CharField("ファイル名", max_length=255)
+    staged_path = models.CharField("置き場所", max_length=500)
+    status = models.CharField("状態", max_length=10, choices=Status.choices, default=Status.QUEUED, db_index=True)
+
+    rows_parsed = models.IntegerField("読んだ行数", default=0)
+    rows_inserted = models.IntegerField("追加件数", default=0)
+    rows_duplicate = models.IntegerField("重複件数", default=0)
+    rows_skipped = models.IntegerField("スキップ件数", default=0)
+    rows_error = models.IntegerField("エラー件数", default=0)
+    message = models.TextField("メッセージ", blank=True, default="")
+
+    batch = models.ForeignKey(
+        ImportBatch,
+        on_delete=models.SET_NULL,
+        related_name="jobs",
+        verbose_name="取込履歴",
+        null=True,
+        blank=True,
+    )
+
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="import_jobs",
+        verbose_name="受付ユーザー",
+        null=True,
+        blank=True,
+    )
+    created_at = models.DateTimeField("受付日時", auto_now_add=True)
+    started_at = models.DateTimeField("開始日時", null=True, blank=True)
+    finished_at = models.DateTimeField("終了日時", null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        verbose_name = "取込ジョブ"
+        verbose_name_plural = "取込ジョブ"
+
+    def __str__(self):
+        return f"{self.file_name} [{self.get_status_display()}]"
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in (self.Status.QUEUED, self.Status.RUNNING)
+
+
+class ShopAssignment(models.Model):
+    """
+    確定済み明細から学習した「店名 → カテゴリ/メンバー」の対応表。
+    取込時にキーワードルールより先に引く（正規化店名で1回のインデックス検索）。
+    """
+    shop_norm = models.CharField("正規化店名", max_length=255, unique=True)
+
+    category = models.ForeignKey(
+        Category,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name="カテゴリ",
+        null=True,
+        blank=True,
+    )
+
+    member = models.ForeignKey(
+        Member,
+        on_delete=models.SET_NULL,
+        related_name="+",
+        verbose_name="メンバー",
+        null=True,
+        blank=True,
+    )
+
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        ordering = ["shop_norm"]
+        verbose_name = "学習済み割り当て"
+        verbose_name_plural = "学習済み割り当て"
+
+    def __str__(self):
+        return self.shop_norm
+
+
+class ClassificationRule(models.Model):
+    """
+    取込時の自動分類ルール（1行 = 1キーワード）。admin から編集する。
+    保存/削除のたびに VersionCounter("rules") が進み、各プロセスはそれを見て作り直す。
+    """
+
+    class Kind(models.TextChoices):
+        CATEGORY = "category", "カテゴリ"
+        CATEGORY_NG = "category_ng", "カテゴリ：分類しない"
+        MEMBER = "member", "メンバー"
+        MEMBER_NG = "member_ng", "メンバー：分類しない"
+        WEEKEND_SHARED = "weekend_shared", "メンバー：土日は共有・平日はゆ"
+        DERMA_CLINIC = "derma_clinic", "皮膚科（同日判定の基準）"
+        DERMA_PHARMACY = "derma_pharmacy", "皮膚科の薬局（同日ならゆ・それ以外はな）"
+
+    kind = models.CharField("種類", max_length=20, choices=Kind.choices)
+    keyword = models.CharField("キーワード", max_length=255)
+    target = models.CharField(
+        "割り当て先",
+        max_length=50,
+        blank=True,
+        default="",
+        help_text="カテゴリ名 / メンバー名（種類がカテゴリ・メンバーのときだけ）",
+    )
+    priority = models.IntegerField("優先順", default=0, help_text="小さいほど先に判定")
+    is_active = models.BooleanField("有効", default=True)
+
+    class Meta:
+        ordering = ["kind", "priority", "id"]
+        verbose_name = "分類ルール"
+        verbose_name_plural = "分類ルール"
+
+    def __str__(self):
+        if self.target:
+            return f"[{self.get_kind_display()}] {self.keyword} → {self.target}"
+        return f"[{self.get_kind_display()}] {self.keyword}"
+
+    def clean(self):
+        from django.core.exceptions import ValidationError
+
+        needs_target = self.kind in (self.Kind.CATEGORY, self.Kind.MEMBER)
+        if needs_target and not self.target:
+            raise ValidationError({"target": "カテゴリ/メンバーのルールは割り当て先が必要"})
+        if not needs_target and self.target:
+            raise ValidationError({"target": "この種類では割り当て先は使わない"})
+
+
+class VersionCounter(models.Model):
+    """キャッシュ無効化用のバージョン番号（name ごとに1行）"""
+    name = models.CharField("名前", max_length=50, unique=True)
+    value = models.BigIntegerField("バージョン", default=0)
+
+    class Meta:
+        verbose_name = "バージョン"
+        verbose_name_plural = "バージョン"
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
@@ -1,9 +1,12 @@
 # transactions/rules.py
 import re
 import unicodedata
-from typing import Optional
+from functools import lru_cache
+from typing import Iterable, NamedTuple, Optional
 from datetime import date
 
+from .matcher import KeywordAutomaton
+
 def _norm(s: str) -> str:
     """表記ゆれ吸収: 全半角統一 + 大文字化 + 空白を1個に"""
     s = s or ""
@@ -12,6 +15,21 @@ def _norm(s: str) -> str:
     s = re.sub(r"\s+", " ", s).strip()
     return s
 
+
+@lru_cache(maxsize=8192)
+def normalize_shop(shop: str) -> str:
+    """
+    店名の正規化キー（Transaction.shop_norm / ShopAssignment の照合キー）
+    取込では同じ店名の繰り返しが大半なので、店名ごとに1回だけ計算する
+    """
+    return _norm(shop)
+
+# =========================
+# 初期ルール
+# =========================
+# 実際の判定は DB の ClassificationRule（admin で編集）を使う。
+# ここの定義はマイグレーションで DB に入れる初期値 兼 DBなしで試すとき用（compile_rules）。
+
 # ここは「カテゴリ名」と「キーワード」をセットで持つ
 SHOP_RULES = {
     "水道": ["東京都水道局"],
@@ -45,23 +63,6 @@ SHOP_RULES = {
 
 UNCLASSIFIABLE = ["AMAZON.CO.JP", "ＡＭＡＺＯＮ．ＣＯ．ＪＰ"]
 
-def guess_category(shop: str) -> Optional[str]:
-    """店名からカテゴリ名（Category.nameと一致する文字列）を返す。見つからなければNone。"""
-    shop_n = _norm(shop)
-
-    # Amazonは“分類不可能”扱い（= Noneで返す）
-    for bad in UNCLASSIFIABLE:
-        if _norm(bad) in shop_n:
-            return None
-
-    for category_name, keywords in SHOP_RULES.items():
-        for kw in keywords:
-            if _norm(kw) in shop_n:
-                return category_name
-
-    return None
-
-
 # ルール：店名に「これ」が含まれてたらこのメンバー
 MEMBER_RULES = {
     "な": [
@@ -123,43 +124,287 @@ DERMA_CLINIC = "錦糸町皮膚科内科クリニック"
 DERMA_PHARMACY = "亀戸駅前薬局"
 
 
-def is_derm_clinic(shop: str) -> bool:
-    """店名が皮膚科クリニックか（表記ゆれ吸収込み）"""
-    return _norm(DERMA_CLINIC) in _norm(shop)
+# =========================
+# コンパイル済みルール
+# =========================
+# キーワードは読み込み時に1回だけ _norm して、1つのオートマトンに詰める。
+# 店名は1回の走査でヒットしたタグを全部拾い、優先順位は下の resolve 側で判定する。
+#   カテゴリ：分類不可 → 学習済み（ShopAssignment） → SHOP_RULES（定義順）
+#   メンバー：分類不可 → 薬局の特例 → 土日/平日 → 学習済み → MEMBER_RULES（定義順）
+# ※ 学習済みは1店名につき1値なので、日付で変わる特例は上書きしない
+
+# どのルールで決まったか（再分類の集計などで使う）
+RULE_UNCLASSIFIABLE = "分類しない"
+RULE_LEARNED = "学習済み"
+RULE_DERMA_PHARMACY = "薬局特例"
+RULE_WEEKEND = "土日/平日"
+RULE_KEYWORD = "キーワード"
+RULE_NONE = "該当なし"
+
+_TAG_CAT_NG = ("cat_ng",)
+_TAG_MEM_NG = ("mem_ng",)
+_TAG_WEEKEND = ("weekend",)
+_TAG_CLINIC = ("clinic",)
+_TAG_PHARMACY = ("pharmacy",)
+
+
+def _rule_pairs(rules: dict[str, list[str]]) -> list[tuple[str, str]]:
+    """{割り当て先: [キーワード, ...]} → 定義順の (キーワード, 割り当て先) の並び"""
+    return [(kw, target) for target, kws in rules.items() for kw in kws]
+
+
+class CompiledRules:
+    """
+    ルール一式をまとめてコンパイルしたもの（作ったら変更しない）
+    shop_rules / member_rules は判定順に並べた (キーワード, 割り当て先) の並び。
+    複数ヒットしたら並びで一番前のルールが勝つ（割り当て先ごとにまとめない）
+    """
+
+    def __init__(
+        self,
+        *,
+        shop_rules: Iterable[tuple[str, str]],
+        unclassifiable: Iterable[str],
+        member_rules: Iterable[tuple[str, str]],
+        member_unclassifiable: Iterable[str],
+        weekend_shared_weekday_yu: Iterable[str],
+        derma_clinics: Iterable[str],
+        derma_pharmacies: Iterable[str],
+    ):
+        # タグ ("cat", i) / ("mem", i) の i はルールの並び順。i 番目のルールの割り当て先
+        self.category_targets: list[str] = []
+        self.member_targets: list[str] = []
+
+        keywords: dict[str, set] = {}
+
+        def add(words: Iterable[str], tag) -> None:
+            for w in words:
+                keywords.setdefault(_norm(w), set()).add(tag)
+
+        add(unclassifiable, _TAG_CAT_NG)
+        for i, (kw, target) in enumerate(shop_rules):
+            self.category_targets.append(target)
+            add([kw], ("cat", i))
+
+        add(member_unclassifiable, _TAG_MEM_NG)
+        add(derma_pharmacies, _TAG_PHARMACY)
+        add(derma_clinics, _TAG_CLINIC)
+        add(weekend_shared_weekday_yu, _TAG_WEEKEND)
+        for i, (kw, target) in enumerate(member_rules):
+            self.member_targets.append(target)
+            add([kw], ("mem", i))
+
+        self._automaton = KeywordAutomaton(keywords)
+
+    def hits(self, shop: str) -> set:
+        """店名（未正規化でOK）にヒットしたタグの集合"""
+        return self._automaton.search(normalize_shop(shop))
+
+    def hits_normalized(self, shop_n: str) -> set:
+        """_norm 済みの店名にヒットしたタグの集合"""
+        return self._automaton.search(shop_n)
+
+    def category_from_hits(self, hits: set, learned: str | None = None) -> Optional[str]:
+        return self.resolve_category(hits, learned)[0]
+
+    def member_from_hits(
+        self,
+        hits: set,
+        d: date,
+        derma_dates: set[date] | None = None,
+        learned: str | None = None,
+    ) -> str | None:
+        return self.resolve_member(hits, d, derma_dates, learned)[0]
 
-def _contains_any_norm(text: str, keywords: list[str]) -> bool:
-    """text と keywords を _norm して部分一致判定"""
-    t = _norm(text)
-    return any(_norm(k) in t for k in keywords)
+    def resolve_category(
+        self,
+        hits: set,
+        learned: str | None = None,
+    ) -> tuple[str | None, str]:
+        """return: (カテゴリ名, 効いたルール)"""
+        if _TAG_CAT_NG in hits:
+            return None, RULE_UNCLASSIFIABLE
+        # 確定済み明細から学習した割り当てがあれば、キーワードより優先
+        if learned:
+            return learned, RULE_LEARNED
+        idx = [t[1] for t in hits if t[0] == "cat"]
+        if idx:
+            return self.category_targets[min(idx)], RULE_KEYWORD
+        return None, RULE_NONE
 
+    def resolve_member(
+        self,
+        hits: set,
+        d: date,
+        derma_dates: set[date] | None = None,
+        learned: str | None = None,
+    ) -> tuple[str | None, str]:
+        """return: (メンバー名, 効いたルール)"""
+        if _TAG_MEM_NG in hits:
+            return None, RULE_UNCLASSIFIABLE
 
-def guess_member(shop: str, d: date, derma_dates: set[date] | None = None) -> str | None:
+        if _TAG_PHARMACY in hits:
+            if derma_dates and d in derma_dates:
+                return "ゆ", RULE_DERMA_PHARMACY
+            return "な", RULE_DERMA_PHARMACY
+
+        if _TAG_WEEKEND in hits:
+            # weekday(): 月0 .. 日6
+            return ("共有" if d.weekday() >= 5 else "ゆ"), RULE_WEEKEND
+
+        # 学習済みの割り当て（日付で変わる特例よりは後、固定ルールよりは前）
+        if learned:
+            return learned, RULE_LEARNED
+
+        idx = [t[1] for t in hits if t[0] == "mem"]
+        if idx:
+            return self.member_targets[min(idx)], RULE_KEYWORD
+        return None, RULE_NONE
+
+    @staticmethod
+    def is_derm_clinic_hits(hits: set) -> bool:
+        return _TAG_CLINIC in hits
+
+
+def compile_rules() -> CompiledRules:
+    """モジュール定義の初期ルールからコンパイル済みルールを作る（DBを見ない）"""
+    return CompiledRules(
+        shop_rules=_rule_pairs(SHOP_RULES),
+        unclassifiable=UNCLASSIFIABLE,
+        member_rules=_rule_pairs(MEMBER_RULES),
+        member_unclassifiable=MEMBER_UNCLASSIFIABLE,
+        weekend_shared_weekday_yu=WEEKEND_SHARED_WEEKDAY_YU,
+        derma_clinics=[DERMA_CLINIC],
+        derma_pharmacies=[DERMA_PHARMACY],
+    )
+
+
+def compile_rules_from_db() -> CompiledRules:
+    """有効な ClassificationRule を (優先順, id) 順に読んでコンパイルする"""
+    from .models import ClassificationRule
+
+    Kind = ClassificationRule.Kind
+    shop_rules: list[tuple[str, str]] = []
+    member_rules: list[tuple[str, str]] = []
+    lists: dict[str, list[str]] = {k: [] for k in Kind.values}
+
+    rows = (
+        ClassificationRule.objects
+        .filter(is_active=True)
+        .order_by("priority", "id")
+        .values_list("kind", "keyword", "target")
+    )
+    for kind, keyword, target in rows:
+        if kind == Kind.CATEGORY:
+            shop_rules.append((keyword, target))
+        elif kind == Kind.MEMBER:
+            member_rules.append((keyword, target))
+        elif kind in lists:
+            lists[kind].append(keyword)
+
+    return CompiledRules(
+        shop_rules=shop_rules,
+        unclassifiable=lists[Kind.CATEGORY_NG],
+        member_rules=member_rules,
+        member_unclassifiable=lists[Kind.MEMBER_NG],
+        weekend_shared_weekday_yu=lists[Kind.WEEKEND_SHARED],
+        derma_clinics=lists[Kind.DERMA_CLINIC],
+        derma_pharmacies=lists[Kind.DERMA_PHARMACY],
+    )
+
+
+# ワーカープロセスごとのキャッシュ：(ルールのバージョン, コンパイル済みルール)
+_COMPILED: tuple[int, CompiledRules] | None = None
+
+
+def get_compiled_rules() -> CompiledRules:
     """
-    shop: CSVの店名
-    d: 日付
-    derma_dates: 「皮膚科が同日にある日付」の集合（views側で作って渡す）
+    DBのルールをコンパイルしたものを返す。
+    毎回見るのはバージョン番号（1行）だけで、変わっていた時だけルール表を読み直す。
+    その1行も毎回のクエリなので、行ごとではなく取込・再分類の1回ごとに呼んで classify_rows(rules=...) に渡す。
     """
-    shop = (shop or "").strip()
-
-    # まず「分類しない」(None)
-    if _contains_any_norm(shop, MEMBER_UNCLASSIFIABLE):
-        return None
-
-    # 皮膚科ルール（薬局だけ特例）
-    if _norm(DERMA_PHARMACY) in _norm(shop):
-        if derma_dates and d in derma_dates:
-            return "ゆ"
-        return "な"
-
-    # 土日/平日で分岐する店
-    if _contains_any_norm(shop, WEEKEND_SHARED_WEEKDAY_YU):
-        # weekday(): 月0 .. 日6
-        is_weekend = d.weekday() >= 5
-        return "共有" if is_weekend else "ゆ"
-
-    # ふつうの固定ルール
-    for member_name, keywords in MEMBER_RULES.items():
-        if _contains_any_norm(shop, keywords):
-            return member_name
-
-    return None
\ No newline at end of file
+    from .services.version_service import RULES_VERSION, get_version
+
+    global _COMPILED
+    version = get_version(RULES_VERSION)
+    if _COMPILED is None or _COMPILED[0] != version:
+        _COMPILED = (version, compile_rules_from_db())
+    return _COMPILED[1]
+
+
+# 学習済みの割り当て： {正規化店名: (カテゴリ名, メンバー名)}
+LearnedMap = dict[str, tuple[str | None, str | None]]
+
+
+# =========================
+# まとめて分類（取込用）
+# =========================
+class Classification(NamedTuple):
+    category: str | None
+    member: str | None
+    category_rule: str = RULE_NONE
+    member_rule: str = RULE_NONE
+
+
+def classify_rows(
+    rows: Iterable[tuple[date, str, int]],
+    *,
+    derma_dates: set[date] | None = None,
+    learned: LearnedMap | None = None,
+    rules: CompiledRules | None = None,
+    normalized: bool = False,
+) -> list[Classification]:
+    """
+    rows: パース済みの (日付, 店名, 金額) の並び
+    normalized: rows の店名が正規化済み（Transaction.shop_norm）なら True。正規化を飛ばす
+    learned: 確定済み明細から学習した割り当て（{正規化店名: (カテゴリ名, メンバー名)}）
+    rules: 使うルール（省略時は DB のルール = get_compiled_rules()）
+    return: rows と同じ順の Classification（カテゴリ・メンバーと、それぞれ効いたルール）
+
+    - 同じ店名は1回だけ正規化・照合する（明細は同じ店の繰り返しが大半）
+    - 皮膚科の「同日判定」用の日付も rows から作る
+      （チャンク単位で呼ぶときなど、外で作った derma_dates を渡すこともできる）
+    """
+    rules = rules or get_compiled_rules()
+    rows = list(rows)
+
+    # ① 店名ごとに1回だけ照合（正規化後が同じなら結果も共有）
+    hits_by_norm: dict[str, set] = {}
+    hits_by_shop: dict[str, set] = {}
+    learned_by_shop: dict[str, tuple[str | None, str | None]] = {}
+    for _, shop, _ in rows:
+        if shop in hits_by_shop:
+            continue
+        shop_n = shop if normalized else normalize_shop(shop)
+        hits = hits_by_norm.get(shop_n)
+        if hits is None:
+            hits = rules.hits_normalized(shop_n)
+            hits_by_norm[shop_n] = hits
+        hits_by_shop[shop] = hits
+        learned_by_shop[shop] = learned.get(shop_n, (None, None)) if learned else (None, None)
+
+    # ② 皮膚科が同日にある日付
+    if derma_dates is None:
+        derma_dates = {
+            d for d, shop, _ in rows
+            if rules.is_derm_clinic_hits(hits_by_shop[shop])
+        }
+
+    # ③ カテゴリは店名だけで決まる / メンバーは日付も見るので (店名, 日付) で使い回す
+    category_by_shop = {
+        shop: rules.resolve_category(hits, learned_by_shop[shop][0])
+        for shop, hits in hits_by_shop.items()
+    }
+    member_memo: dict[tuple[str, date], tuple[str | None, str]] = {}
+
+    result: list[Classification] = []
+    for d, shop, _ in rows:
+        key = (shop, d)
+        if key not in member_memo:
+            member_memo[key] = rules.resolve_member(
+                hits_by_shop[shop], d, derma_dates, learned_by_shop[shop][1]
+            )
+        cat, cat_rule = category_by_shop[shop]
+        mem, mem_rule = member_memo[key]
+        result.append(Classification(cat, mem, cat_rule, mem_rule))
+    return result
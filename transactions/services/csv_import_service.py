@@ -0,0 +1,409 @@
+# transactions/services/csv_import_service.py
+"""
+service：アップロードされた明細CSVの取り込み（パース → 分類 → INSERT）
+
+- ファイル全体を read() せず、UploadedFile.chunks() を少しずつデコードして流す
+- 文字コードは先頭の一部（SNIFF_BYTES）で当たりを付け、1パス目でファイル全体を厳密にデコードして確かめる
+  → 途中で読めなくなったら cp932 で1パス目からやり直す。それでもダメなら cp932 の置換デコード（errors="replace"）で読み、
+    置換文字（U+FFFD）が出た行はエラーに数えて入れない（読める行だけ取り込む。置換文字入りの明細は作らない）
+- パース・分類・INSERT は BATCH_SIZE 行ずつ（メモリは行数に関係なくほぼ一定）
+- INSERT は bulk_loader 経由（PostgreSQL なら COPY）
+- 皮膚科の「同日判定」はファイル全体を見ないと決まらないので、
+  先に1回だけ流して日付を集めてから本番の取り込みをする（2パス）
+- 1パス目でファイルの SHA-256 も取る：取込済みのファイルなら何もしない（DuplicateFileError）
+- 2パス目は行ごとの row_fingerprint で、既にある行を飛ばす（重なった期間のCSVでもOK）
+- progress を渡すとバッチごとに進み具合を知らせる（バックグラウンド取込の進捗表示用）
+- 日付・金額は MemoParser で「同じ文字列は1回だけ」パースする（strptime を行数ぶん呼ばない）
+- フェーズ別の時間・メモリ・スキップ/エラー行は ImportTelemetry で測って ImportBatch.telemetry に残す
+  （エラー行の中身は logging の transactions.services.csv_import_service に出す）
+"""
+
+from __future__ import annotations
+
+import codecs
+import csv
+import hashlib
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Callable, Iterable, Iterator
+
+from django.db import transaction
+
+from transactions.billing_month import billing_month_from_source
+from transactions.models import Category, ImportBatch, ImportFile, Member, Transaction
+from transactions.rules import classify_rows, get_compiled_rules
+from transactions.services.bulk_loader import LoadStats, insert_transactions
+from transactions.services.dedup_service import (
+    DuplicateFileError,
+    FingerprintCounter,
+    existing_fingerprints,
+    find_imported_batch,
+)
+from transactions.services.import_file_service import add_row_counts, ensure_import_files
+from transactions.services.import_telemetry import ImportTelemetry
+from transactions.services.shop_assignment_service import load_shop_assignments
+
+# CSVの文字コード：UTF-8 / UTF-8(BOM付き) / CP932(Shift_JIS系)
+ENCODINGS = ("utf-8-sig", "utf-8", "cp932", "shift_jis")
+SNIFF_BYTES = 64 * 1024
+BATCH_SIZE = 2000
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    skipped: int = 0
+    errors: int = 0
+    duplicates: int = 0
+    encoding: str = ""
+    # "replace" なら厳密に読めなかったファイル（置換文字が出た行は errors に数えて入れない）
+    decode_errors: str = "strict"
+    file_sha256: str = ""
+    # INSERT部分の件数・時間（rows/sec はここから出す）
+    load: LoadStats = field(default_factory=LoadStats)
+    # 進捗用：読んだ行数 / データ行の総数（ヘッダ除く。1パス目で数える）
+    rows_read: int = 0
+    rows_total: int = 0
+    # フェーズ別の計測（ImportTelemetry.as_dict()）
+    telemetry: dict = field(default_factory=dict)
+
+
+# progress(result) … result.rows_read / rows_total / created などを見て進捗を出す
+ProgressCallback = Callable[[ImportResult], None]
+
+
+def parse_date(s: str) -> date:
+    s = (s or "").strip()
+    # 例: 2025-11-30 / 2025/11/30 どっちでもOKにする
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"日付形式が不正: {s}")
+
+
+def parse_amount(s: str) -> int:
+    s = (s or "").strip()
+    s = s.replace(",", "").replace("円", "")
+    return int(s)
+
+
+class _Rejected:
+    __slots__ = ("message",)
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+class MemoParser:
+    """
+    列ごとのパース関数を包んで、同じ文字列は1回だけパースする。
+    - 日付：1か月の明細なら distinct は高々31種類 → strptime をほぼ呼ばない
+    - 読めなかった文字列も覚えておいて、毎回同じメッセージの ValueError を出す（error に数えられる）
+    - max_size を超えたら1回捨てる（金額のように種類が多い列でもメモリが増え続けない）
+    """
+
+    def __init__(self, parse: Callable[[str], object], max_size: int = 100_000):
+        self._parse = parse
+        self._max_size = max_size
+        self._memo: dict = {}
+
+    def __call__(self, s):
+        try:
+            hit = self._memo[s]
+        except KeyError:
+            try:
+                hit = self._parse(s)
+            except ValueError as e:
+                hit = _Rejected(str(e))
+            if len(self._memo) >= self._max_size:
+                self._memo.clear()
+            self._memo[s] = hit
+
+        if type(hit) is _Rejected:
+            raise ValueError(hit.message)
+        return hit
+
+
+def detect_encoding(sample: bytes, *, is_complete: bool = False) -> str:
+    """
+    先頭の一部だけで文字コードを決める。
+    sample の末尾でマルチバイト文字が切れていてもいいように、途中までのデコードで判定する。
+    """
+    for enc in ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(enc)().decode(sample, final=is_complete)
+            return enc
+        except UnicodeDecodeError:
+            continue
+    # 先頭では決まらなかった：cp932 として1パス目で確かめる（読めなければ取り込まない）
+    return "cp932"
+
+
+def _sniff(f) -> str:
+    f.seek(0)
+    sample = f.read(SNIFF_BYTES)
+    is_complete = len(sample) < SNIFF_BYTES
+    f.seek(0)
+    return detect_encoding(sample, is_complete=is_complete)
+
+
+def iter_decoded_lines(chunks: Iterable[bytes], encoding: str, *, errors: str = "strict") -> Iterator[str]:
+    """
+    バイト列のチャンクを少しずつデコードして1行ずつ返す（改行は残す）。
+    ※ 行の区切りは "\\n" だけ（csv.reader 側で "\\r\\n" もちゃんと扱える）
+    読めないバイト列があれば UnicodeDecodeError（errors="replace" なら U+FFFD に置き換えて続ける）
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors=errors)
+    buf = ""
+    for chunk in chunks:
+        buf += decoder.decode(chunk)
+        start = 0
+        while True:
+            i = buf.find("\n", start)
+            if i < 0:
+                break
+            yield buf[start:i + 1]
+            start = i + 1
+        buf = buf[start:]
+    buf += decoder.decode(b"", final=True)
+    if buf:
+        yield buf
+
+
+def _chunks(f, hasher=None) -> Iterator[bytes]:
+    f.seek(0)
+    for chunk in f.chunks():
+        if hasher is not None:
+            hasher.update(chunk)
+        yield chunk
+
+
+def iter_csv_rows(
+    f,
+    encoding: str,
+    *,
+    errors: str = "strict",
+    hasher=None,
+    telemetry: ImportTelemetry | None = None,
+) -> Iterator[tuple[str, int, object]]:
+    """
+    UploadedFile を先頭から流して、1行ずつ判定結果を返す。
+      ("ok", 行番号, (日付, 店名, 金額)) / ("skip", 行番号, row) / ("error", 行番号, (row, 例外))
+    errors: "replace" なら読めないバイト列を置換文字にして読み、置換文字が出た行は "error" にする
+    hasher: 渡すと読んだバイト列をそのまま update する（SHA-256 用）
+    telemetry: 渡すと読み込み＋デコードの時間を "decode" に足す
+    """
+    lines = iter_decoded_lines(_chunks(f, hasher), encoding, errors=errors)
+    if telemetry is not None:
+        lines = telemetry.timed("decode", lines)
+    reader = csv.reader(lines)
+    to_date = MemoParser(parse_date)
+    to_amount = MemoParser(parse_amount)
+
+    for row_index, row in enumerate(reader, start=1):
+        # 1行目はヘッダ想定（不要なら削除OK）
+        if row_index == 1:
+            continue
+
+        # 空行スキップ
+        if not row or all((c or "").strip() == "" for c in row):
+            yield "skip", row_index, row
+            continue
+
+        # 左から3列だけ使う（足りなければスキップ）
+        if len(row) < 3:
+            yield "skip", row_index, row
+            continue
+
+        date_str = row[0].strip()
+        shop = row[1].strip()
+        amount_str = row[2].strip()
+
+        if not date_str or not shop or not amount_str:
+            yield "skip", row_index, row
+            continue
+
+        if errors != "strict" and any("\ufffd" in c for c in row):
+            yield "error", row_index, (row, ValueError(f"文字コード（{encoding}）で読めない文字がある"))
+            continue
+
+        try:
+            d = to_date(date_str)
+            amount = to_amount(amount_str)
+        except Exception as e:
+            yield "error", row_index, (row, e)
+            continue
+
+        yield "ok", row_index, (d, shop, amount)
+
+
+def _first_pass(f, encoding: str, rules, errors: str = "strict") -> tuple[str, set[date], int]:
+    """
+    1パス目：ファイルの SHA-256 と、皮膚科がある日付と、データ行数だけ集める
+    （店名は distinct ごとに1回だけ照合）
+    """
+    hasher = hashlib.sha256()
+    is_clinic: dict[str, bool] = {}
+    dates: set[date] = set()
+    n_rows = 0
+    for status, _, payload in iter_csv_rows(f, encoding, errors=errors, hasher=hasher):
+        n_rows += 1
+        if status != "ok":
+            continue
+        d, shop, _ = payload
+        hit = is_clinic.get(shop)
+        if hit is None:
+            hit = rules.is_derm_clinic_hits(rules.hits(shop))
+            is_clinic[shop] = hit
+        if hit:
+            dates.add(d)
+    return hasher.hexdigest(), dates, n_rows
+
+
+def _scan(f, encoding: str, rules) -> tuple[str, str, str, set[date], int]:
+    """
+    1パス目を厳密なデコードで回す。推測した文字コードで途中から読めなくなったら cp932 で最初からやり直す
+    return: (文字コード, デコードの errors, SHA-256, 皮膚科がある日付, データ行数)
+    どの文字コードでも厳密には読めないファイルは、cp932 の置換デコードで読む
+    （置換文字が出た行は iter_csv_rows が "error" にするので、読める行だけ取り込まれる）
+    """
+    for enc in dict.fromkeys((encoding, "cp932")):
+        try:
+            return (enc, "strict", *_first_pass(f, enc, rules))
+        except UnicodeDecodeError as e:
+            logger.info("IMPORT DECODE %s failed: %s", enc, e)
+    return ("cp932", "replace", *_first_pass(f, "cp932", rules, errors="replace"))
+
+
+def import_uploaded_csv(
+    f,
+    source_file: str,
+    *,
+    batch_size: int = BATCH_SIZE,
+    progress: ProgressCallback | None = None,
+) -> ImportResult:
+    """
+    f: UploadedFile（chunks() と seek() が使えるもの。django.core.files.File でもOK）
+    source_file: 取込元のファイル名（例: 202601.csv）
+    progress: 1パス目の後と、バッチをINSERTするたびに呼ばれる
+    全体を1トランザクションで入れる（途中で落ちたら何も入らない）
+    同じ中身のファイルが取込済みなら DuplicateFileError
+    文字コードが読めない行はエラーに数える（result.decode_errors が "replace" になる）
+    """
+    tel = ImportTelemetry()
+    result = ImportResult(encoding=_sniff(f))
+
+    def report() -> None:
+        if progress is not None:
+            progress(result)
+
+    rules = get_compiled_rules()
+    billing_month = billing_month_from_source(source_file)
+    with tel.phase("scan"):
+        (
+            result.encoding, result.decode_errors, result.file_sha256, derma_dates, result.rows_total,
+        ) = _scan(f, result.encoding, rules)
+    report()
+
+    done = find_imported_batch(result.file_sha256)
+    if done:
+        raise DuplicateFileError(done)
+
+    # 先にカテゴリ/メンバーを全件辞書にしておく（DBアクセスを減らす）
+    category_map = {c.name: c for c in Category.objects.all()}
+    member_map = {m.name: m for m in Member.objects.all()}
+
+    fingerprint = FingerprintCounter()
+
+    def flush(batch: list[tuple[date, str, int]], fps: list[str]) -> None:
+        # 既にDBにある行（重なった期間の再取込）は飛ばす
+        with tel.phase("dedup"):
+            exists = existing_fingerprints(fps)
+        if exists:
+            keep = [i for i, fp in enumerate(fps) if fp not in exists]
+            result.duplicates += len(fps) - len(keep)
+            batch = [batch[i] for i in keep]
+            fps = [fps[i] for i in keep]
+            if not batch:
+                return
+
+        # ルールでカテゴリ/メンバーをまとめて割り当てて一括INSERT
+        # 確定済みの履歴から学習した割り当て（ShopAssignment）があればそちらを優先
+        with tel.phase("classify"):
+            learned = load_shop_assignments({shop for _, shop, _ in batch})
+            classified = classify_rows(batch, derma_dates=derma_dates, learned=learned, rules=rules)
+
+        with tel.phase("insert"):
+            to_create = [
+                Transaction(
+                    date=d,
+                    shop=shop,
+                    amount=amount,
+                    memo="",
+                    import_file=import_file,
+                    billing_month=billing_month,
+                    category=category_map.get(c.category) if c.category else None,
+                    member=member_map.get(c.member) if c.member else None,
+                    is_closed=False,
+                    row_fingerprint=fp,
+                )
+                for (d, shop, amount), c, fp in zip(batch, classified, fps)
+            ]
+            result.load.add(insert_transactions(to_create))
+        result.created += len(to_create)
+
+    with transaction.atomic():
+        # 明細は ImportFile を FK で指す（無ければここで作る）
+        file_map: dict[str, ImportFile] = {}
+        ensure_import_files({source_file}, file_map)
+        import_file = file_map.get(source_file)
+
+        batch: list[tuple[date, str, int]] = []
+        fps: list[str] = []
+        # "read" = デコード＋パース（最後に decode を引いて parse にする）
+        rows = tel.timed("read", iter_csv_rows(f, result.encoding, errors=result.decode_errors, telemetry=tel))
+        for status, row_index, payload in rows:
+            result.rows_read += 1
+            if status == "skip":
+                result.skipped += 1
+                tel.skip(row_index)
+                continue
+            if status == "error":
+                row, e = payload
+                result.errors += 1
+                tel.error(row_index)
+                logger.warning("IMPORT ERROR line=%d: %r %r", row_index, row, e)
+                continue
+
+            batch.append(payload)
+            fps.append(fingerprint(*payload))
+            if len(batch) >= batch_size:
+                flush(batch, fps)
+                batch = []
+                fps = []
+                report()
+
+        if batch:
+            flush(batch, fps)
+
+        tel.add("parse", tel.phases.pop("read", 0.0) - tel.phases.get("decode", 0.0))
+        tel.rows = result.rows_read
+        result.telemetry = tel.as_dict()
+
+        add_row_counts(Counter({source_file: result.created}), file_map)
+        ImportBatch.objects.create(
+            file_name=source_file,
+            file_sha256=result.file_sha256,
+            row_count=result.created,
+            duplicate_count=result.duplicates,
+            telemetry=result.telemetry,
+        )
+
+    report()
+    return result
@@ -0,0 +1,118 @@
+# transactions/services/dedup_service.py
+"""
+service：同じ明細を2回取り込まないためのチェック
+
+- ファイル単位：中身の SHA-256 が ImportBatch にあれば丸ごと取込済み（1回のインデックス検索）
+- 行単位：(日付, 店名, 金額, 同じ組み合わせの何件目か) のハッシュ = row_fingerprint
+  同日・同店・同額の明細は普通にありえるので「何件目か」まで入れて区別する
+  バッチごとに row_fingerprint__in で1回だけ引いて、既にある行は入れない
+- 巨大なファイルをチャンクで流すときは、件数を一時ファイルに逃がす SpillingFingerprintCounter を使う
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import tempfile
+from collections import Counter
+from datetime import date
+from pathlib import Path
+from typing import Iterable
+
+from transactions.models import ImportBatch, Transaction
+
+
+class DuplicateFileError(Exception):
+    """同じ中身のファイルが取込済み"""
+
+    def __init__(self, batch: ImportBatch):
+        self.batch = batch
+        super().__init__(f"同じ内容のファイルは取り込み済み: {batch.file_name}（{batch.created_at:%Y-%m-%d %H:%M}）")
+
+
+def row_fingerprint(d: date, shop: str, amount: int, occurrence: int) -> str:
+    key = f"{d.isoformat()}\t{shop}\t{amount}\t{occurrence}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class FingerprintCounter:
+    """ファイルを頭から流しながら、同じ (日付, 店名, 金額) が何件目かを数えてハッシュを作る"""
+
+    def __init__(self):
+        self._seen: Counter = Counter()
+
+    def __call__(self, d: date, shop: str, amount: int) -> str:
+        key = (d, shop, amount)
+        occurrence = self._seen[key]
+        self._seen[key] = occurrence + 1
+        return row_fingerprint(d, shop, amount, occurrence)
+
+
+class SpillingFingerprintCounter:
+    """
+    FingerprintCounter と同じハッシュを作るが、「何件目か」の件数を一時ファイル（SQLite）に持つ。
+    何千万行のファイルでもメモリが増えない。チャンク単位でまとめて引く（batch）。
+    with で使う（抜けたら一時ファイルごと消える）
+    """
+
+    def __init__(self):
+        self._dir = tempfile.TemporaryDirectory(prefix="kakeibo_fp_")
+        self._db = sqlite3.connect(str(Path(self._dir.name) / "seen.sqlite3"))
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute("CREATE TABLE seen (k BLOB PRIMARY KEY, n INTEGER NOT NULL) WITHOUT ROWID")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self._db.close()
+        self._dir.cleanup()
+
+    @staticmethod
+    def _key(source_file: str, d: date, shop: str, amount: int) -> bytes:
+        raw = f"{source_file}\t{d.isoformat()}\t{shop}\t{amount}".encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).digest()
+
+    def batch(self, rows: list[tuple[str, date, str, int]]) -> list[str]:
+        """rows: (source_file, 日付, 店名, 金額) を頭から順に。return: 各行の row_fingerprint"""
+        keys = [self._key(*r) for r in rows]
+
+        base: dict[bytes, int] = {}
+        uniq = list(set(keys))
+        for i in range(0, len(uniq), 500):
+            part = uniq[i:i + 500]
+            marks = ",".join("?" * len(part))
+            base.update(self._db.execute(f"SELECT k, n FROM seen WHERE k IN ({marks})", part))
+
+        counts = dict(base)
+        out = []
+        for (_, d, shop, amount), k in zip(rows, keys):
+            occurrence = counts.get(k, 0)
+            counts[k] = occurrence + 1
+            out.append(row_fingerprint(d, shop, amount, occurrence))
+
+        self._db.executemany(
+            "INSERT INTO seen (k, n) VALUES (?, ?) ON CONFLICT(k) DO UPDATE SET n = excluded.n",
+            [(k, n) for k, n in counts.items() if n != base.get(k)],
+        )
+        return out
+
+
+def find_imported_batch(file_sha256: str) -> ImportBatch | None:
+    return ImportBatch.objects.filter(file_sha256=file_sha256).first()
+
+
+def existing_fingerprints(fingerprints: Iterable[str]) -> set[str]:
+    """このうち既にDBにあるもの（1クエリ）"""
+    fps = set(fingerprints)
+    if not fps:
+        return set()
+    return set(
+        Transaction.objects
+        .filter(row_fingerprint__in=fps)
+        .values_list("row_fingerprint", flat=True)
+    )
@@ -0,0 +1,59 @@
+# transactions/services/import_file_service.py
+"""
+service：取込元ファイル（ImportFile）
+
+- 取込時：ファイル名 → ImportFile をまとめて用意（ensure_import_files）して、明細は FK で指す
+- 取込後：ファイルごとの件数と取込日時を足す（add_row_counts。取込と同じトランザクションで呼ぶ）
+- 一覧画面：最新ファイルをインデックスで1行だけ引く（latest_import_file）
+  明細が残っているかは row_count ではなく EXISTS で見る（明細を消しても row_count は減らないので）
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from transactions.billing_month import billing_month_from_source
+from transactions.models import ImportFile, Transaction
+
+
+def ensure_import_files(names: set[str], file_map: dict[str, ImportFile]) -> None:
+    """足りない ImportFile をまとめて作って file_map に足す（空のファイル名は無視）"""
+    missing = sorted(n for n in names if n and n not in file_map)
+    if not missing:
+        return
+    ImportFile.objects.bulk_create(
+        [ImportFile(name=n, billing_month=billing_month_from_source(n)) for n in missing],
+        ignore_conflicts=True,
+    )
+    file_map.update({f.name: f for f in ImportFile.objects.filter(name__in=missing)})
+
+
+def add_row_counts(counts: Counter, file_map: dict[str, ImportFile]) -> None:
+    """counts: {ファイル名: 今回入れた件数}"""
+    now = timezone.now()
+    for name, n in counts.items():
+        if name and n:
+            ImportFile.objects.filter(pk=file_map[name].pk).update(
+                row_count=F("row_count") + n,
+                imported_at=now,
+            )
+
+
+def latest_import_file() -> ImportFile | None:
+    """
+    明細が1件でも残っているファイルのうち、請求月が一番新しいもの（同じ月なら後から作った方）
+    請求月が取れるファイルが無ければ最後に作ったもの
+    """
+    files = ImportFile.objects.filter(Exists(Transaction.objects.filter(import_file=OuterRef("pk"))))
+    latest = (
+        files
+        .filter(billing_month__isnull=False)
+        .order_by("-billing_month", "-id")
+        .first()
+    )
+    if latest is None:
+        latest = files.order_by("-id").first()
+    return latest
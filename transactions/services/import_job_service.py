@@ -0,0 +1,225 @@
+# transactions/services/import_job_service.py
+"""
+service：CSV取込のバックグラウンド化（ImportJob）
+
+- 画面側（enqueue_upload）：アップロードを IMPORT_STAGING_DIR に置いて ImportJob を積むだけ
+  （Django が一時ファイルにしていれば移動だけなので、リクエストはすぐ返る）
+- ワーカー側（claim_next_job → run_job）：管理コマンド run_import_worker が1件ずつ取り出して
+  csv_import_service.import_uploaded_csv で取り込む
+- 取込本体は1トランザクションなので、途中経過はDBではなく置き場の進捗ファイル（JSON）に書く
+  → 画面は job_progress() で ImportJob ＋ 進捗ファイルを合わせて見る
+- ワーカーが落ちると「取込中」のまま残る → ワーカーの起動時と常駐中の定期チェックで recover_stale_jobs() が
+  失敗にして置き場を片付ける（進捗ファイルの更新時刻を生存確認に使う。取込は1トランザクションなので途中までの行は残っていない）
+- 置き場のファイルと進捗ファイルを画面とワーカーの両方が読むので、両方が同じディスクを見ていること
+  （同じホスト / 同じサービス内で動かす。ディスクを共有しない別サービスに分けると取り込めない）
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from transactions.models import ImportBatch, ImportJob
+from transactions.services.csv_import_service import ImportResult, import_uploaded_csv
+from transactions.services.dedup_service import DuplicateFileError
+
+# 開始（または最後の進捗）からこれだけ経っても「取込中」のジョブは、ワーカーが落ちたとみなす
+STALE_SECONDS = 30 * 60
+
+
+def staging_dir() -> Path:
+    path = Path(settings.IMPORT_STAGING_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _progress_path(job: ImportJob) -> Path:
+    return Path(job.staged_path).with_suffix(".progress.json")
+
+
+def enqueue_upload(f, user=None) -> ImportJob:
+    """
+    f: UploadedFile
+    user: アップロードしたユーザー（進捗はこのユーザーにだけ見せる）
+    置き場にファイルを置いて ImportJob（待ち）を作る
+    """
+    file_name = getattr(f, "name", "") or "upload.csv"
+    dest = staging_dir() / f"{uuid.uuid4().hex}.csv"
+
+    temp_path = getattr(f, "temporary_file_path", None)
+    if temp_path is not None:
+        # 大きいファイルは Django が既にディスクに書いているので、移動するだけ
+        # （close() すると一時ファイルは消されるので、移動が先。移動後の close() は消す物が無くて FileNotFoundError）
+        shutil.move(temp_path(), dest)
+        try:
+            f.close()
+        except FileNotFoundError:
+            pass
+    else:
+        with dest.open("wb") as out:
+            for chunk in f.chunks():
+                out.write(chunk)
+
+    return ImportJob.objects.create(file_name=file_name, staged_path=str(dest), created_by=user)
+
+
+def claim_next_job() -> ImportJob | None:
+    """
+    待ちのジョブを1件取り出して「取込中」にする
+    ワーカーが複数いても同じジョブを2回取らないように、状態つきの UPDATE で取り合う
+    """
+    while True:
+        job = (
+            ImportJob.objects
+            .filter(status=ImportJob.Status.QUEUED)
+            .order_by("created_at", "id")
+            .first()
+        )
+        if job is None:
+            return None
+
+        now = timezone.now()
+        claimed = (
+            ImportJob.objects
+            .filter(pk=job.pk, status=ImportJob.Status.QUEUED)
+            .update(status=ImportJob.Status.RUNNING, started_at=now)
+        )
+        if claimed:
+            job.status = ImportJob.Status.RUNNING
+            job.started_at = now
+            return job
+
+
+def _last_heartbeat(job: ImportJob) -> datetime:
+    """最後に生きていた時刻（進捗ファイルの更新時刻。まだ無ければ開始時刻）"""
+    beat = job.started_at or job.created_at
+    try:
+        mtime = _progress_path(job).stat().st_mtime
+    except (OSError, ValueError):
+        return beat
+    return max(beat, datetime.fromtimestamp(mtime, tz=beat.tzinfo))
+
+
+def recover_stale_jobs(stale_seconds: int = STALE_SECONDS) -> list[ImportJob]:
+    """
+    「取込中」のまま止まっているジョブを失敗にして、置き場のファイルを消す（ワーカーが起動時と定期的に呼ぶ）
+    生きている別ワーカーが持っているジョブは進捗ファイルが更新され続けるので対象にならない
+    """
+    limit = timezone.now() - timedelta(seconds=stale_seconds)
+    recovered = []
+    for job in ImportJob.objects.filter(status=ImportJob.Status.RUNNING, started_at__lt=limit):
+        if _last_heartbeat(job) >= limit:
+            continue
+        job.status = ImportJob.Status.FAILED
+        job.message = "取込が途中で止まった（ワーカーが落ちた？）。もう一度アップロードしてください"
+        job.finished_at = timezone.now()
+        # 見ている間に別のワーカーが書き換えていたら触らない
+        updated = (
+            ImportJob.objects
+            .filter(pk=job.pk, status=ImportJob.Status.RUNNING, started_at=job.started_at)
+            .update(status=job.status, message=job.message, finished_at=job.finished_at)
+        )
+        if updated:
+            _cleanup(job)
+            recovered.append(job)
+    return recovered
+
+
+def _write_progress(job: ImportJob, result: ImportResult) -> None:
+    path = _progress_path(job)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({
+        "rows_parsed": result.rows_read,
+        "rows_total": result.rows_total,
+        "rows_inserted": result.created,
+        "rows_duplicate": result.duplicates,
+        "rows_skipped": result.skipped,
+        "rows_error": result.errors,
+    }))
+    # 読む側が書きかけを見ないように置き換えで書く
+    os.replace(tmp, path)
+
+
+def _read_progress(job: ImportJob) -> dict:
+    try:
+        return json.loads(_progress_path(job).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _cleanup(job: ImportJob) -> None:
+    for path in (Path(job.staged_path), _progress_path(job)):
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def run_job(job: ImportJob) -> ImportJob:
+    """取込中のジョブを1件処理して、結果を ImportJob に書く"""
+    try:
+        with open(job.staged_path, "rb") as fh:
+            result = import_uploaded_csv(
+                File(fh, name=job.file_name),
+                job.file_name,
+                progress=lambda r: _write_progress(job, r),
+            )
+    except DuplicateFileError as e:
+        job.status = ImportJob.Status.FAILED
+        job.message = str(e)
+        job.batch = e.batch
+    except Exception as e:
+        job.status = ImportJob.Status.FAILED
+        job.message = f"CSVの読み込みで落ちた: {e}"
+    else:
+        job.status = ImportJob.Status.DONE
+        job.rows_parsed = result.rows_read
+        job.rows_inserted = result.created
+        job.rows_duplicate = result.duplicates
+        job.rows_skipped = result.skipped
+        job.rows_error = result.errors
+        job.batch = ImportBatch.objects.filter(file_sha256=result.file_sha256).first()
+        job.message = (
+            f"CSV取り込み完了！ 追加 {result.created} / 重複 {result.duplicates}"
+            f" / スキップ {result.skipped} / エラー {result.errors}"
+        )
+        if result.decode_errors != "strict":
+            job.message += "（文字コードが読めない部分があり、その行はエラーとして取り込んでいない）"
+
+    job.finished_at = timezone.now()
+    job.save()
+    _cleanup(job)
+    return job
+
+
+def job_progress(job: ImportJob) -> dict:
+    """
+    進捗API用の dict（取込中は進捗ファイルの値で上書き）
+    rows_total は分かっているときだけ入れる（取込中は1パス目が終わってから。完了なら読んだ行数 = 全行）
+    """
+    data = {
+        "id": job.id,
+        "file_name": job.file_name,
+        "status": job.status,
+        "status_label": job.get_status_display(),
+        "rows_parsed": job.rows_parsed,
+        "rows_inserted": job.rows_inserted,
+        "rows_duplicate": job.rows_duplicate,
+        "rows_skipped": job.rows_skipped,
+        "rows_error": job.rows_error,
+        "message": job.message,
+        "is_active": job.is_active,
+    }
+    if job.status == ImportJob.Status.DONE:
+        data["rows_total"] = job.rows_parsed
+    elif job.status == ImportJob.Status.RUNNING:
+        data.update(_read_progress(job))
+    return data
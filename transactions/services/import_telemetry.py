@@ -0,0 +1,144 @@
+# transactions/services/import_telemetry.py
+"""
+service：CSV取込のフェーズ別計測（どこが遅いかを後から見られるようにする）
+
+- フェーズ（scan / decode / parse / dedup / classify / insert）ごとの秒数
+- 行数・rows/sec・ピークメモリ（RSS。バッチの区切りごとに測った最大値）
+- スキップ/エラーの件数と、何行目だったかのサンプル（先頭 MAX_SAMPLES 件）
+- as_dict() の結果を ImportBatch.telemetry（JSON）に保存 → CSV Import 画面に出す
+"""
+
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+import psutil
+
+from transactions.models import ImportBatch
+
+# 画面に出す順番（無いフェーズは出さない）
+PHASES = ("scan", "decode", "parse", "dedup", "classify", "insert")
+PHASE_LABELS = {
+    "scan": "1パス目",
+    "decode": "デコード",
+    "parse": "パース",
+    "dedup": "重複チェック",
+    "classify": "分類",
+    "insert": "INSERT",
+}
+MAX_SAMPLES = 10
+
+
+class ImportTelemetry:
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.rows = 0
+        self.skipped = 0
+        self.errors = 0
+        self.skip_rows: list[int] = []
+        self.error_rows: list[int] = []
+        self._process = psutil.Process()
+        self._peak_rss = 0
+        # 別プロセスで使った時間（merge で足す）
+        self._extra_seconds = 0.0
+        self._t0 = time.perf_counter()
+        self.sample_memory()
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+            self.sample_memory()
+
+    def timed(self, name: str, it: Iterable) -> Iterator:
+        """イテレータの next() にかかった時間を name に足す（ジェネレータの中身の計測用）"""
+        it = iter(it)
+        clock = time.perf_counter
+        total = 0.0
+        try:
+            while True:
+                t0 = clock()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    total += clock() - t0
+                    return
+                total += clock() - t0
+                yield item
+        finally:
+            self.add(name, total)
+
+    def sample_memory(self) -> None:
+        try:
+            rss = self._process.memory_info().rss
+        except psutil.Error:
+            return
+        self._peak_rss = max(self._peak_rss, rss)
+
+    def skip(self, row_index: int) -> None:
+        self.skipped += 1
+        if len(self.skip_rows) < MAX_SAMPLES:
+            self.skip_rows.append(row_index)
+
+    def error(self, row_index: int) -> None:
+        self.errors += 1
+        if len(self.error_rows) < MAX_SAMPLES:
+            self.error_rows.append(row_index)
+
+    def merge(self, other: dict) -> None:
+        """別プロセス（並列パース）で取った as_dict() を足し込む"""
+        for name, seconds in other.get("phases", {}).items():
+            self.add(name, seconds)
+        self.skipped += other.get("skipped", 0)
+        self.errors += other.get("errors", 0)
+        self.skip_rows = (self.skip_rows + other.get("skip_rows", []))[:MAX_SAMPLES]
+        self.error_rows = (self.error_rows + other.get("error_rows", []))[:MAX_SAMPLES]
+        self._peak_rss = max(self._peak_rss, int(other.get("peak_rss_mb", 0) * 1024 * 1024))
+        self._extra_seconds += other.get("total_seconds", 0.0)
+
+    def as_dict(self) -> dict:
+        self.sample_memory()
+        total = time.perf_counter() - self._t0 + self._extra_seconds
+        return {
+            "phases": {name: round(sec, 4) for name, sec in self.phases.items()},
+            "total_seconds": round(total, 4),
+            "rows": self.rows,
+            "rows_per_sec": round(self.rows / total, 1) if total > 0 else 0.0,
+            "peak_rss_mb": round(self._peak_rss / (1024 * 1024), 1),
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "skip_rows": self.skip_rows,
+            "error_rows": self.error_rows,
+        }
+
+
+def recent_imports(limit: int = 10) -> list[dict]:
+    """CSV Import 画面用：最近の取込とフェーズ別の内訳（一番遅いフェーズに印）"""
+    out = []
+    for batch in ImportBatch.objects.all()[:limit]:
+        t = batch.telemetry or {}
+        phases = t.get("phases", {})
+        slowest = max(phases, key=phases.get) if phases else None
+        out.append({
+            "batch": batch,
+            "t": t,
+            "phases": [
+                {
+                    "name": name,
+                    "label": PHASE_LABELS[name],
+                    "ms": round(phases[name] * 1000),
+                    "is_slowest": name == slowest,
+                }
+                for name in PHASES
+                if name in phases
+            ],
+        })
+    return out
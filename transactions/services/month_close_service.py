@@ -0,0 +1,263 @@
+# transactions/services/month_close_service.py
+"""
+service：月締め（MonthSnapshot）と、分析画面向けの「締めた月はスナップショット / それ以外はライブ」読み出し
+
+- close_month：請求月の明細が全部確定済みなら、カテゴリ×メンバー別・店別・最高額1件をスナップショットに固める
+  （以後その月の明細は変更できない。monthly_total_service.MonthClosedError）
+- reopen_month：締めを戻す（スナップショットを消すだけ。明細はそのまま）
+- month_rows / shop_totals / max_single：EDA・ゾーン・予測・内訳・高額単発が読むところ
+  → 締めた月はスナップショット、開いている月だけ MonthlyTotal / 明細から計算する
+  → 分析のコストが履歴の長さではなく「開いている月の数」で決まる
+- 除外キーワード（「家具・家電」など）はカテゴリ名の部分一致（大文字小文字は区別しない）
+- 締めた月のカテゴリ名・メンバー名はスナップショットの names（締めた時点の名前）を使う
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from transactions.billing_month import month_label
+from transactions.models import Category, Member, MonthlyTotal, MonthSnapshot, Transaction
+from transactions.services.version_service import DATA_VERSION, bump_version_on_commit
+
+
+class MonthNotReadyError(Exception):
+    """まだ締められない（明細が無い / 未確定が残っている / もう締めてある）"""
+
+
+@dataclass(frozen=True)
+class MonthRow:
+    month: date
+    category: str | None
+    member: str | None
+    is_closed: bool
+    total: int
+    count: int
+
+
+# ---------------------------------------------------------------------------
+# 締める / 戻す
+# ---------------------------------------------------------------------------
+
+def close_month(month: date) -> MonthSnapshot:
+    """month（月の1日）を締めてスナップショットを返す"""
+    with transaction.atomic():
+        # 差分更新（apply_deltas）と同じ行をロックしてから確認する → 確認と作成の間に明細が変わらない
+        list(MonthlyTotal.objects.select_for_update().filter(month=month).values_list("id", flat=True))
+
+        if MonthSnapshot.objects.filter(month=month).exists():
+            raise MonthNotReadyError(f"{month_label(month)} はもう締めてある")
+
+        rows = Transaction.objects.filter(billing_month=month).order_by()
+        n_open = rows.filter(is_closed=False).count()
+        if n_open:
+            raise MonthNotReadyError(f"{month_label(month)} に未確定の明細が {n_open} 件ある")
+
+        totals = [
+            [c, m, int(total or 0), n]
+            for c, m, total, n in rows.values_list("category_id", "member_id")
+            .annotate(total=Sum("amount"), n=Count("amount"))
+            .order_by("category_id", "member_id")
+        ]
+        if not totals:
+            raise MonthNotReadyError(f"{month_label(month)} の明細が無い")
+
+        shops = [
+            [shop, c, int(total or 0), n]
+            for shop, c, total, n in rows.values_list("shop_norm", "category_id")
+            .annotate(total=Sum("amount"), n=Count("amount"))
+            .order_by("shop_norm", "category_id")
+        ]
+
+        # カテゴリごとの最高額1件（同額なら id の小さい方。max_single のライブ側と同じ順）
+        max_rows: dict[int | None, list] = {}
+        for tid, c, amount, shop in rows.order_by("-amount", "id").values_list("id", "category_id", "amount", "shop"):
+            if c not in max_rows:
+                max_rows[c] = [c, amount, shop, tid]
+
+        # id → 名前は締めた時点のものを固める（あとで名前を変えても締めた月はそのまま）
+        cat_ids = {r[0] for r in totals} | {r[1] for r in shops}
+        mem_ids = {r[1] for r in totals}
+        names = {
+            "category": {str(i): n for i, n in Category.objects.filter(id__in=cat_ids).values_list("id", "name")},
+            "member": {str(i): n for i, n in Member.objects.filter(id__in=mem_ids).values_list("id", "name")},
+        }
+
+        # 分析の HTML 断片の ETag（data_etag）を進める。数字は変わらないはずだが、読む先が変わるので念のため
+        bump_version_on_commit(DATA_VERSION)
+        return MonthSnapshot.objects.create(
+            month=month,
+            row_count=sum(r[3] for r in totals),
+            total=sum(r[2] for r in totals),
+            totals=totals,
+            shops=shops,
+            max_rows=list(max_rows.values()),
+            names=names,
+        )
+
+
+def reopen_month(month: date) -> bool:
+    """締めを戻す（消したら True）"""
+    n, _ = MonthSnapshot.objects.filter(month=month).delete()
+    if n:
+        bump_version_on_commit(DATA_VERSION)
+    return bool(n)
+
+
+def closable_months() -> list[date]:
+    """全部確定済みで、まだ締めていない月"""
+    closed = set(MonthSnapshot.objects.values_list("month", flat=True))
+    rows = (
+        MonthlyTotal.objects
+        .values("month")
+        .annotate(n=Sum("count"), n_open=Sum("count", filter=Q(is_closed=False)))
+        .order_by("month")
+    )
+    return [r["month"] for r in rows if r["n"] and not r["n_open"] and r["month"] not in closed]
+
+
+# ---------------------------------------------------------------------------
+# 読む（分析画面）
+# ---------------------------------------------------------------------------
+
+def _excluded(name: str | None, exclude_keywords: Iterable[str]) -> bool:
+    if name is None:
+        return False
+    low = name.lower()
+    return any(kw.lower() in low for kw in exclude_keywords)
+
+
+def _category_names() -> dict[int, str]:
+    return dict(Category.objects.values_list("id", "name"))
+
+
+def _snapshot_names(snap: MonthSnapshot, key: str) -> dict[int, str]:
+    """スナップショットに固めた id → 名前（key: "category" / "member"）"""
+    return {int(i): name for i, name in (snap.names or {}).get(key, {}).items()}
+
+
+def _excluded_category_ids(names: dict[int, str], exclude_keywords: Iterable[str]) -> set[int]:
+    kws = list(exclude_keywords)
+    return {cid for cid, name in names.items() if _excluded(name, kws)} if kws else set()
+
+
+def month_rows(*, exclude_keywords: Iterable[str] = ()) -> list[MonthRow]:
+    """
+    請求月 × カテゴリ × メンバー × 確定済みか の合計（全期間）
+    除外キーワードに当たるカテゴリの行は入れない（未分類＝None はそのまま入る）
+    """
+    kws = list(exclude_keywords)
+    cat_names = _category_names()
+    mem_names = dict(Member.objects.values_list("id", "name"))
+
+    out: list[MonthRow] = []
+    closed: set[date] = set()
+    for snap in MonthSnapshot.objects.only("month", "totals", "names"):
+        closed.add(snap.month)
+        snap_cats = _snapshot_names(snap, "category")
+        snap_mems = _snapshot_names(snap, "member")
+        for c, m, total, n in snap.totals:
+            name = snap_cats.get(c) if c is not None else None
+            if _excluded(name, kws):
+                continue
+            out.append(MonthRow(snap.month, name, snap_mems.get(m) if m is not None else None, True, total, n))
+
+    live = (
+        MonthlyTotal.objects
+        .exclude(month__in=closed)
+        .values_list("month", "category_id", "member_id", "is_closed")
+        .annotate(total=Sum("total"), n=Sum("count"))
+        .order_by()
+    )
+    for mo, c, m, is_closed, total, n in live:
+        if not n:
+            continue
+        name = cat_names.get(c) if c is not None else None
+        if _excluded(name, kws):
+            continue
+        out.append(MonthRow(mo, name, mem_names.get(m) if m is not None else None, is_closed, int(total or 0), int(n)))
+
+    out.sort(key=lambda r: r.month)
+    return out
+
+
+def shop_totals(
+    *,
+    exclude_keywords: Iterable[str] = (),
+    month: date | None = None,
+    before: date | None = None,
+) -> list[dict]:
+    """
+    店ごとの合計（カテゴリあり・除外キーワード以外）。month=その月だけ / before=その月より前の全部
+    店は正規化店名（shop_norm）でまとめる → 全角/半角などの表記ゆれが別の行にならない
+    return: [{"shop"（正規化店名）, "total", "count"}, ...]（合計の大きい順、同額なら店名順）
+    """
+    kws = list(exclude_keywords)
+    excluded = _excluded_category_ids(_category_names(), kws)
+
+    snaps = MonthSnapshot.objects.only("month", "shops", "names")
+    live = Transaction.objects.exclude(category__isnull=True).exclude(category_id__in=excluded)
+    if month is not None:
+        snaps = snaps.filter(month=month)
+        live = live.filter(billing_month=month)
+    if before is not None:
+        snaps = snaps.filter(month__lt=before)
+        live = live.filter(billing_month__lt=before)
+
+    acc: dict[str, list[int]] = {}
+    closed: list[date] = []
+    for snap in snaps:
+        closed.append(snap.month)
+        snap_excluded = _excluded_category_ids(_snapshot_names(snap, "category"), kws)
+        for shop, c, total, n in snap.shops:
+            if c is None or c in snap_excluded:
+                continue
+            a = acc.setdefault(shop, [0, 0])
+            a[0] += total
+            a[1] += n
+
+    rows = (
+        live.exclude(billing_month__in=closed)
+        .values_list("shop_norm")
+        .annotate(total=Sum("amount"), n=Count("amount"))
+        .order_by()
+    )
+    for shop, total, n in rows:
+        a = acc.setdefault(shop, [0, 0])
+        a[0] += int(total or 0)
+        a[1] += int(n)
+
+    out = [{"shop": shop, "total": total, "count": n} for shop, (total, n) in acc.items()]
+    out.sort(key=lambda r: (-r["total"], r["shop"]))
+    return out
+
+
+def max_single(month: date, *, exclude_keywords: Iterable[str] = ()) -> dict | None:
+    """その月の一番高い1件（カテゴリあり・除外キーワード以外）。return: {"amount", "shop"} / なければ None"""
+    kws = list(exclude_keywords)
+    snap = MonthSnapshot.objects.filter(month=month).only("max_rows", "names").first()
+    if snap is not None:
+        excluded = _excluded_category_ids(_snapshot_names(snap, "category"), kws)
+        best = None
+        for c, amount, shop, tid in snap.max_rows:
+            if c is None or c in excluded:
+                continue
+            if best is None or (amount, -tid) > (best[0], -best[2]):
+                best = (amount, shop, tid)
+        return {"amount": best[0], "shop": best[1]} if best else None
+
+    excluded = _excluded_category_ids(_category_names(), kws)
+    return (
+        Transaction.objects
+        .exclude(category__isnull=True)
+        .exclude(category_id__in=excluded)
+        .filter(billing_month=month)
+        .order_by("-amount", "id")
+        .values("amount", "shop")
+        .first()
+    )
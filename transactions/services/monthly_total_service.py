@@ -0,0 +1,175 @@
+# transactions/services/monthly_total_service.py
+"""
+service：月次集計（MonthlyTotal）の差分更新と作り直し
+
+- キー = (請求月, カテゴリ, メンバー, 確定済みか)、値 = (合計, 件数)
+- 取込（bulk_loader.insert_transactions）：入れた明細からそのまま差分を作って足す
+- 再分類：変更前後のカテゴリ/メンバーから差分を作って足す（reassign_deltas）
+- 一括変更・確定・admin の編集/削除：track_monthly_totals(ids) で囲む
+  → 変更前と変更後に対象行だけ GROUP BY して、その差を足す（追加・変更・削除どれでも同じ書き方）
+- rebuild_monthly_totals：明細を全部集計し直して突き合わせ → 置き換え（管理コマンド rebuild_monthly_totals）
+- billing_month が無い明細は分析に出てこないので集計しない
+- 締めた月（MonthSnapshot がある月）に差分が出たら MonthClosedError で止める
+  → どの経路で明細を触っても、締めた月の数字はスナップショットとずれない
+- 明細の書き込みはここを必ず通るので、データのバージョン（DATA_VERSION）もここで進める（コミット後）
+  → 一覧の行キャッシュ（rows_cache_service）が捨てられる
+"""
+
+from __future__ import annotations
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterable, Iterator
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from transactions.billing_month import month_label
+from transactions.models import MonthlyTotal, MonthSnapshot, Transaction
+from transactions.services.version_service import DATA_VERSION, bump_version_on_commit
+
+Key = tuple[date, int | None, int | None, bool]
+Deltas = dict[Key, list[int]]  # キー → [合計, 件数]
+
+
+class MonthClosedError(Exception):
+    """締めた月の明細を変えようとした"""
+
+    def __init__(self, months: Iterable[date]):
+        self.months = sorted(months)
+        labels = ", ".join(month_label(m) for m in self.months)
+        super().__init__(f"締め済みの月は変更できない: {labels}（先に締めを戻してね）")
+
+
+def _add(deltas: Deltas, key: Key, total: int, count: int) -> None:
+    acc = deltas.setdefault(key, [0, 0])
+    acc[0] += total
+    acc[1] += count
+
+
+def deltas_from_objs(objs: Iterable[Transaction]) -> Deltas:
+    deltas: Deltas = {}
+    for t in objs:
+        if t.billing_month is not None:
+            _add(deltas, (t.billing_month, t.category_id, t.member_id, t.is_closed), t.amount, 1)
+    return deltas
+
+
+def reassign_deltas(moved: Iterable[tuple[int | None, int | None, Transaction]]) -> Deltas:
+    """moved: (変更前のカテゴリ, 変更前のメンバー, 変更後の明細)。カテゴリ/メンバーの付け替え分だけ動かす"""
+    deltas: Deltas = {}
+    for old_cat, old_mem, t in moved:
+        if t.billing_month is None:
+            continue
+        _add(deltas, (t.billing_month, old_cat, old_mem, t.is_closed), -t.amount, -1)
+        _add(deltas, (t.billing_month, t.category_id, t.member_id, t.is_closed), t.amount, 1)
+    return deltas
+
+
+def _group(qs) -> Deltas:
+    """明細の QuerySet をキーごとに集計"""
+    rows = (
+        qs.filter(billing_month__isnull=False)
+        .order_by()
+        .values_list("billing_month", "category_id", "member_id", "is_closed")
+        .annotate(total=Sum("amount"), count=Count("amount"))
+    )
+    return {(m, c, mem, closed): [int(total or 0), int(n)] for m, c, mem, closed, total, n in rows}
+
+
+def apply_deltas(deltas: Deltas) -> None:
+    """差分を MonthlyTotal に足す（0件になった行は消す）"""
+    deltas = {k: v for k, v in deltas.items() if v[0] or v[1]}
+    if not deltas:
+        return
+
+    months = {k[0] for k in deltas}
+    with transaction.atomic():
+        existing: dict[Key, MonthlyTotal] = {}
+        rows = MonthlyTotal.objects.select_for_update().filter(month__in=months)
+        for r in rows:
+            existing.setdefault((r.month, r.category_id, r.member_id, r.is_closed), r)
+
+        # 行ロックを取ってから見る（close_month も同じ行をロックしてからスナップショットを作る）
+        closed_months = set(MonthSnapshot.objects.filter(month__in=months).values_list("month", flat=True))
+        if closed_months:
+            raise MonthClosedError(closed_months)
+
+        to_update: list[MonthlyTotal] = []
+        to_create: list[MonthlyTotal] = []
+        for (m, c, mem, closed), (total, count) in deltas.items():
+            r = existing.get((m, c, mem, closed))
+            if r is None:
+                to_create.append(MonthlyTotal(
+                    month=m, category_id=c, member_id=mem, is_closed=closed, total=total, count=count,
+                ))
+            else:
+                r.total += total
+                r.count += count
+                to_update.append(r)
+
+        MonthlyTotal.objects.bulk_update(to_update, ["total", "count"], batch_size=500)
+        MonthlyTotal.objects.bulk_create(to_create, batch_size=500)
+        MonthlyTotal.objects.filter(month__in=months, count__lte=0).delete()
+
+
+def add_inserted(objs: Iterable[Transaction]) -> None:
+    """新しく入れた明細の分を足す"""
+    apply_deltas(deltas_from_objs(objs))
+    bump_version_on_commit(DATA_VERSION)
+
+
+@contextmanager
+def track_monthly_totals(ids: Iterable[int]) -> Iterator[set[int]]:
+    """
+    with の中で ids の明細を変更/削除する。新しく作った明細は yield した set に id を足す
+    （例：admin の新規作成）
+    """
+    ids = {i for i in ids if i is not None}
+    with transaction.atomic():
+        before = _group(Transaction.objects.filter(id__in=ids)) if ids else {}
+        yield ids
+        after = _group(Transaction.objects.filter(id__in=ids)) if ids else {}
+
+        deltas: Deltas = {}
+        for k, (total, count) in after.items():
+            _add(deltas, k, total, count)
+        for k, (total, count) in before.items():
+            _add(deltas, k, -total, -count)
+        apply_deltas(deltas)
+        # 集計に出ない変更（メモ・日付など）でも一覧の表示は変わる
+        bump_version_on_commit(DATA_VERSION)
+
+
+@dataclass
+class RebuildResult:
+    rows: int = 0         # 作り直した MonthlyTotal の行数
+    mismatched: int = 0   # 明細と合っていなかったキーの数（足りない/余分/値違い）
+
+
+def rebuild_monthly_totals(*, dry_run: bool = False) -> RebuildResult:
+    """明細から全部集計し直して、今の MonthlyTotal と突き合わせてから置き換える"""
+    result = RebuildResult()
+    with transaction.atomic():
+        raw = _group(Transaction.objects.all())
+
+        current: Deltas = {}
+        for r in MonthlyTotal.objects.select_for_update():
+            _add(current, (r.month, r.category_id, r.member_id, r.is_closed), r.total, r.count)
+        current = {k: v for k, v in current.items() if v[0] or v[1]}
+
+        result.mismatched = sum(1 for k in raw.keys() | current.keys() if raw.get(k) != current.get(k))
+        result.rows = len(raw)
+        if dry_run:
+            return result
+
+        MonthlyTotal.objects.all().delete()
+        MonthlyTotal.objects.bulk_create(
+            [
+                MonthlyTotal(month=m, category_id=c, member_id=mem, is_closed=closed, total=total, count=count)
+                for (m, c, mem, closed), (total, count) in raw.items()
+            ],
+            batch_size=1000,
+        )
+    return result
@@ -0,0 +1,536 @@
+# transactions/services/past_csv_service.py
+"""
+service：過去CSV（カテゴリ/メンバー/確定済みか まで入った書き出し形式）の取り込み
+
+- parse_past_csv：1ファイルをパースして行（PastRow）にする。DBは触らない
+  → 管理コマンド import_past_csv が ProcessPoolExecutor で複数ファイルを並列に回す
+- write_parsed_file：パース済みの1ファイルをDBに入れる（書き込みは1プロセスだけ）
+  重複チェック（ファイルの SHA-256 / 行の row_fingerprint）もここ
+- scan_past_csv → stream_past_csv：巨大ファイル用（--chunk-size）
+  少しずつ読んで chunk_size 行ごとにコミットし、ImportCheckpoint に「どの行まで入ったか」を残す
+  落ちたら次の実行でそこから再開する。メモリは行数に関係なくほぼ一定
+- どちらもフェーズ別の計測（ImportTelemetry）を ImportBatch.telemetry に残す
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+
+from django.db import transaction
+
+from transactions.billing_month import billing_month_from_source
+from transactions.models import Category, ImportBatch, ImportCheckpoint, ImportFile, Member, Transaction
+from transactions.services.bulk_loader import LoadStats, insert_transactions
+from transactions.services.csv_import_service import MemoParser, iter_decoded_lines
+from transactions.services.dedup_service import (
+    FingerprintCounter,
+    SpillingFingerprintCounter,
+    existing_fingerprints,
+)
+from transactions.services.import_file_service import add_row_counts, ensure_import_files
+from transactions.services.import_telemetry import ImportTelemetry
+
+# --- CSVの列名（日本語そのまま） ---
+COL_DATE = "日付"
+COL_SHOP = "店名・サービス名"
+COL_AMOUNT = "金額"
+COL_MEMBER = "メンバー"
+COL_CATEGORY = "カテゴリ"
+COL_SOURCE = "ファイル名"
+COL_CLOSED = "確定済みか"
+
+REQUIRED_COLUMNS = {COL_DATE, COL_SHOP, COL_AMOUNT, COL_MEMBER, COL_CATEGORY, COL_SOURCE, COL_CLOSED}
+
+# Excel由来の文字コードにも耐えるため、まず utf-8-sig → ダメなら cp932
+ENCODINGS = ("utf-8-sig", "utf-8", "cp932")
+
+# SKIP の行は最初のこれだけ表示する（ROW ERROR は全部）
+MAX_SKIP_NOTES = 20
+
+# ストリーミング時に1回で読むバイト数
+READ_BYTES = 1024 * 1024
+
+
+def parse_date(s: str | None):
+    if not s:
+        return None
+    s = str(s).strip()
+    for fmt in ("%Y/%m/%d", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(s, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"日付が解釈できない: {s!r}")
+
+
+def parse_amount(s: str | None) -> int:
+    if s is None:
+        raise ValueError("金額が空")
+    s = str(s).strip()
+    # "¥3,000" "3,000" "3000" "-120" などを許容
+    m = re.search(r"-?\d[\d,]*", s)
+    if not m:
+        raise ValueError(f"金額が解釈できない: {s!r}")
+    return int(m.group().replace(",", ""))
+
+
+def parse_bool(s: str | None) -> bool:
+    if s is None:
+        return False
+    s = str(s).strip().lower()
+    return s in ("true", "1", "t", "yes", "y", "済", "確定")
+
+
+class PastRow(NamedTuple):
+    date: date
+    shop: str
+    amount: int
+    member: str
+    category: str
+    source_file: str
+    is_closed: bool
+    row_fingerprint: str
+
+
+@dataclass
+class ParsedFile:
+    path: str
+    file_sha256: str = ""
+    encoding: str = ""
+    rows: list[PastRow] = field(default_factory=list)
+    skipped: int = 0
+    errors: int = 0
+    # 表示用メッセージ（SKIP / ROW ERROR）
+    notes: list[str] = field(default_factory=list)
+    sources: set[str] = field(default_factory=set)
+    seconds: float = 0.0
+    # ファイルごと読めなかったとき（文字コード・ヘッダ）
+    fatal: str = ""
+    # パース側（子プロセス）の計測。書き込み側で足し込む
+    telemetry: dict = field(default_factory=dict)
+
+    @property
+    def name(self) -> str:
+        return Path(self.path).name
+
+
+@dataclass
+class WriteResult:
+    created: int = 0
+    duplicates: int = 0
+    load: LoadStats = field(default_factory=LoadStats)
+
+
+@dataclass
+class ScanResult:
+    file_sha256: str = ""
+    encoding: str = ""
+    categories: set[str] = field(default_factory=set)
+    members: set[str] = field(default_factory=set)
+    seconds: float = 0.0
+
+
+@dataclass
+class StreamResult:
+    # created / duplicates は再開前の分も含む（チェックポイントから引き継ぐ）
+    created: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+    errors: int = 0
+    resumed_from: int = 0
+    last_line: int = 0
+    chunks: int = 0
+    sources: set[str] = field(default_factory=set)
+    load: LoadStats = field(default_factory=LoadStats)
+
+
+class _RecordParser:
+    """DictReader の1行 → (日付, 店名, 金額, メンバー, カテゴリ, source_file, 確定済みか)。読めなければ例外
+    日付・金額・確定済みかは同じ文字列を1回だけパースする（MemoParser）"""
+
+    def __init__(self):
+        self._date = MemoParser(parse_date)
+        self._amount = MemoParser(parse_amount)
+        self._bool = MemoParser(parse_bool)
+
+    def __call__(self, r: dict) -> tuple:
+        return (
+            self._date(r.get(COL_DATE)),
+            (r.get(COL_SHOP) or "").strip(),
+            self._amount(r.get(COL_AMOUNT)),
+            (r.get(COL_MEMBER) or "").strip(),
+            (r.get(COL_CATEGORY) or "").strip(),
+            (r.get(COL_SOURCE) or "").strip(),
+            self._bool(r.get(COL_CLOSED)),
+        )
+
+
+def _missing_columns(fieldnames) -> str:
+    if not fieldnames:
+        return "CSVヘッダが読めない"
+    missing = REQUIRED_COLUMNS - set(fieldnames)
+    if missing:
+        return f"CSVに必要な列がない: {sorted(missing)} / headers={fieldnames}"
+    return ""
+
+
+def _decode(data: bytes) -> tuple[str, str]:
+    last_err = None
+    for enc in ENCODINGS:
+        try:
+            return data.decode(enc), enc
+        except UnicodeDecodeError as e:
+            last_err = e
+    raise ValueError(f"CSVが読めない（encoding試行失敗）: {last_err}")
+
+
+def parse_past_csv(path: str) -> ParsedFile:
+    """
+    1ファイルをパースする（DBアクセスなし。別プロセスで動かす前提）
+    row_fingerprint の「何件目か」はファイル内の source_file ごとに数える
+    """
+    t0 = time.perf_counter()
+    tel = ImportTelemetry()
+    result = ParsedFile(path=str(path))
+
+    with tel.phase("decode"):
+        data = Path(path).read_bytes()
+        result.file_sha256 = hashlib.sha256(data).hexdigest()
+
+        try:
+            text, result.encoding = _decode(data)
+        except ValueError as e:
+            result.fatal = str(e)
+            return result
+        del data
+
+    reader = csv.DictReader(text.splitlines())
+    result.fatal = _missing_columns(reader.fieldnames)
+    if result.fatal:
+        return result
+
+    # 重複チェック用：source_file ごとに「同じ (日付, 店名, 金額) の何件目か」を数える
+    fingerprints: dict[str, FingerprintCounter] = {}
+    parse_record = _RecordParser()
+    t_parse = time.perf_counter()
+
+    for idx, r in enumerate(reader, start=2):
+        try:
+            d, shop, amt, mem, cat, src, closed = parse_record(r)
+
+            result.sources.add(src)
+
+            # 必須項目が欠けてる行だけスキップ（=データとして成立しない）
+            # ※重複判定によるスキップはしない（同日同額は普通にありえるため）
+            if not (d and shop and src):
+                result.skipped += 1
+                tel.skip(idx)
+                if result.skipped <= MAX_SKIP_NOTES:
+                    result.notes.append(f"SKIP(empty) line={idx}: {r!r}")
+                continue
+
+            result.rows.append(PastRow(
+                d, shop, amt, mem, cat, src, closed,
+                fingerprints.setdefault(src, FingerprintCounter())(d, shop, amt),
+            ))
+
+        except Exception as e:
+            result.errors += 1
+            tel.error(idx)
+            # 文字化けしても落ちないように repr で出す
+            result.notes.append(f"ROW ERROR line={idx}: {e!r}")
+
+    tel.add("parse", time.perf_counter() - t_parse)
+    tel.rows = len(result.rows) + result.skipped + result.errors
+    result.telemetry = tel.as_dict()
+    result.seconds = time.perf_counter() - t0
+    return result
+
+
+def ensure_masters(
+    category_names: set[str],
+    member_names: set[str],
+    cat_map: dict[str, Category],
+    mem_map: dict[str, Member],
+) -> None:
+    """足りないカテゴリ/メンバーをまとめて作って、cat_map / mem_map に足す"""
+    missing_cat = sorted(n for n in category_names if n and n not in cat_map)
+    if missing_cat:
+        Category.objects.bulk_create([Category(name=n) for n in missing_cat])
+        cat_map.update({c.name: c for c in Category.objects.filter(name__in=missing_cat)})
+
+    missing_mem = sorted(n for n in member_names if n and n not in mem_map)
+    if missing_mem:
+        Member.objects.bulk_create([Member(name=n) for n in missing_mem], ignore_conflicts=True)
+        mem_map.update({m.name: m for m in Member.objects.filter(name__in=missing_mem)})
+
+
+def drop_existing(rows: list[PastRow], chunk_size: int = 1000) -> tuple[list[PastRow], int]:
+    """
+    既にDBにある行（重なった期間の再取込）と、rows の中で同じ row_fingerprint の2件目以降を落とす
+    （別の source_file に同じ明細が載っているケース。チャンクの切れ目に関係なく同じ結果になるように）
+    return: (残す行, 重複件数)
+    """
+    fresh: list[PastRow] = []
+    seen: set[str] = set()
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i + chunk_size]
+        exists = existing_fingerprints(r.row_fingerprint for r in chunk)
+        for r in chunk:
+            if r.row_fingerprint in exists or r.row_fingerprint in seen:
+                continue
+            seen.add(r.row_fingerprint)
+            fresh.append(r)
+    return fresh, len(rows) - len(fresh)
+
+
+def to_transactions(
+    rows: list[PastRow],
+    cat_map: dict[str, Category],
+    mem_map: dict[str, Member],
+    file_map: dict[str, ImportFile],
+) -> list[Transaction]:
+    return [
+        Transaction(
+            date=r.date,
+            shop=r.shop,
+            amount=r.amount,
+            member=mem_map.get(r.member) if r.member else None,
+            category=cat_map.get(r.category) if r.category else None,
+            import_file=file_map.get(r.source_file),
+            billing_month=billing_month_from_source(r.source_file),
+            is_closed=r.is_closed,
+            memo="",  # CSVに無いので空
+            row_fingerprint=r.row_fingerprint,
+        )
+        for r in rows
+    ]
+
+
+def write_parsed_file(
+    parsed: ParsedFile,
+    cat_map: dict[str, Category],
+    mem_map: dict[str, Member],
+    *,
+    dry_run: bool = False,
+) -> WriteResult:
+    """
+    パース済みの1ファイルをDBに入れる（1ファイル = 1トランザクション）
+    dry_run のときは重複件数を数えるだけ
+    """
+    tel = ImportTelemetry()
+    tel.merge(parsed.telemetry)
+    tel.rows = parsed.telemetry.get("rows", 0)
+
+    result = WriteResult()
+    with tel.phase("dedup"):
+        rows, result.duplicates = drop_existing(parsed.rows)
+    result.created = len(rows)
+
+    if dry_run:
+        return result
+
+    with transaction.atomic():
+        with tel.phase("insert"):
+            ensure_masters({r.category for r in rows}, {r.member for r in rows}, cat_map, mem_map)
+            file_map: dict[str, ImportFile] = {}
+            ensure_import_files({r.source_file for r in rows}, file_map)
+            # PostgreSQL なら COPY、それ以外は bulk_create
+            result.load = insert_transactions(to_transactions(rows, cat_map, mem_map, file_map))
+            add_row_counts(Counter(r.source_file for r in rows), file_map)
+        ImportBatch.objects.create(
+            file_name=parsed.name,
+            file_sha256=parsed.file_sha256,
+            row_count=result.load.rows,
+            duplicate_count=result.duplicates,
+            telemetry=tel.as_dict(),
+        )
+    return result
+
+
+# =========================
+# 巨大ファイル用（--chunk-size）
+# =========================
+def _read_chunks(fh, hasher=None) -> Iterator[bytes]:
+    while True:
+        chunk = fh.read(READ_BYTES)
+        if not chunk:
+            return
+        if hasher is not None:
+            hasher.update(chunk)
+        yield chunk
+
+
+def scan_past_csv(path: str) -> ScanResult:
+    """
+    1パス目：SHA-256・文字コード・出てくるカテゴリ/メンバー名だけ集める（少しずつ読む）
+    読めないファイルは ValueError
+    """
+    t0 = time.perf_counter()
+    last_err = None
+    for enc in ENCODINGS:
+        result = ScanResult(encoding=enc)
+        hasher = hashlib.sha256()
+        try:
+            with open(path, "rb") as fh:
+                reader = csv.DictReader(iter_decoded_lines(_read_chunks(fh, hasher), enc, errors="strict"))
+                fatal = _missing_columns(reader.fieldnames)
+                if fatal:
+                    raise ValueError(fatal)
+                for r in reader:
+                    result.categories.add((r.get(COL_CATEGORY) or "").strip())
+                    result.members.add((r.get(COL_MEMBER) or "").strip())
+        except UnicodeDecodeError as e:
+            last_err = e
+            continue
+        result.file_sha256 = hasher.hexdigest()
+        result.seconds = time.perf_counter() - t0
+        return result
+    raise ValueError(f"CSVが読めない（encoding試行失敗）: {last_err}")
+
+
+def stream_past_csv(
+    path: str,
+    scan: ScanResult,
+    cat_map: dict[str, Category],
+    mem_map: dict[str, Member],
+    *,
+    chunk_size: int,
+    note: Callable[[str], None],
+    dry_run: bool = False,
+    progress: Callable[[StreamResult], None] | None = None,
+) -> StreamResult:
+    """
+    chunk_size 行ごとに1トランザクションで入れる（チェックポイントも同じトランザクションで進める）
+    チェックポイントがあればその行の次から再開する
+    note: SKIP / ROW ERROR の行を知らせる先（管理コマンドなら self.stdout.write）
+    ※ row_fingerprint の「何件目か」はファイル先頭から数える必要があるので、
+       再開時も先頭から読んで件数だけ数え直す（INSERT はしない）
+    """
+    name = Path(path).name
+    result = StreamResult()
+    checkpoint = None
+    tel = ImportTelemetry()
+    tel.add("scan", scan.seconds)
+
+    if not dry_run:
+        # 足りないカテゴリ/メンバーは最初にまとめて作る
+        with tel.phase("insert"):
+            ensure_masters(scan.categories, scan.members, cat_map, mem_map)
+        checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+            file_sha256=scan.file_sha256,
+            defaults={"file_name": name},
+        )
+        result.resumed_from = checkpoint.last_line
+        result.created = checkpoint.row_count
+        result.duplicates = checkpoint.duplicate_count
+
+    start = result.resumed_from
+    file_map: dict[str, ImportFile] = {}
+
+    def flush(pending: list[tuple], last_line: int) -> None:
+        # (行番号, 日付, 店名, 金額, メンバー, カテゴリ, source_file, 確定済みか)
+        with tel.phase("dedup"):
+            fps = counter.batch([(p[6], p[1], p[2], p[3]) for p in pending])
+        if last_line <= start:
+            return  # 取込済みの範囲：件数を数え直しただけ
+
+        rows = [PastRow(*p[1:], fp) for p, fp in zip(pending, fps) if p[0] > start]
+
+        if dry_run:
+            with tel.phase("dedup"):
+                fresh, dup = drop_existing(rows)
+            result.created += len(fresh)
+            result.duplicates += dup
+        else:
+            with transaction.atomic():
+                with tel.phase("dedup"):
+                    fresh, dup = drop_existing(rows)
+                with tel.phase("insert"):
+                    ensure_import_files({r.source_file for r in fresh}, file_map)
+                    result.load.add(insert_transactions(to_transactions(fresh, cat_map, mem_map, file_map)))
+                    add_row_counts(Counter(r.source_file for r in fresh), file_map)
+                result.created += len(fresh)
+                result.duplicates += dup
+                ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(
+                    last_line=last_line,
+                    row_count=result.created,
+                    duplicate_count=result.duplicates,
+                )
+
+        result.last_line = last_line
+        result.chunks += 1
+        if progress is not None:
+            progress(result)
+
+    with SpillingFingerprintCounter() as counter, open(path, "rb") as fh:
+        lines = tel.timed("decode", iter_decoded_lines(_read_chunks(fh), scan.encoding))
+        reader = csv.DictReader(lines)
+        pending: list[tuple] = []
+        parse_record = _RecordParser()
+        idx = 1
+        chunk_end = 1 + chunk_size
+        # ループ全体の時間から decode / dedup / insert を引いた残りを parse にする
+        t_loop = time.perf_counter()
+        before = sum(tel.phases.get(k, 0.0) for k in ("dedup", "insert"))
+
+        for idx, r in enumerate(reader, start=2):
+            resumed = idx <= start
+            try:
+                d, shop, amt, mem, cat, src, closed = parse_record(r)
+                if not resumed:
+                    result.sources.add(src)
+
+                # 必須項目が欠けてる行だけスキップ（=データとして成立しない）
+                if not (d and shop and src):
+                    if not resumed:
+                        result.skipped += 1
+                        tel.skip(idx)
+                        if result.skipped <= MAX_SKIP_NOTES:
+                            note(f"SKIP(empty) line={idx}: {r!r}")
+                else:
+                    pending.append((idx, d, shop, amt, mem, cat, src, closed))
+
+            except Exception as e:
+                if not resumed:
+                    result.errors += 1
+                    tel.error(idx)
+                    note(f"ROW ERROR line={idx}: {e!r}")
+
+            if idx >= chunk_end:
+                flush(pending, idx)
+                pending = []
+                chunk_end = idx + chunk_size
+
+        if idx > max(start, result.last_line):
+            flush(pending, idx)
+
+        inner = sum(tel.phases.get(k, 0.0) for k in ("dedup", "insert")) - before
+        loop_seconds = time.perf_counter() - t_loop
+
+    tel.add("parse", loop_seconds - inner - tel.phases.get("decode", 0.0))
+    tel.rows = max(0, idx - 1 - start)
+
+    if dry_run:
+        return result
+
+    # 最後まで入った：チェックポイントを消して取込履歴にする
+    with transaction.atomic():
+        ImportBatch.objects.create(
+            file_name=name,
+            file_sha256=scan.file_sha256,
+            row_count=result.created,
+            duplicate_count=result.duplicates,
+            telemetry=tel.as_dict(),
+        )
+        checkpoint.delete()
+
+    return result
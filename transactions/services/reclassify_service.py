@@ -0,0 +1,120 @@
+# transactions/services/reclassify_service.py
+"""
+service：未確定（is_closed=False）の明細に今のルールをかけ直す
+
+- チャンクごとに .iterator() で流すので、件数が増えてもメモリは一定
+- 変わった行だけ bulk_update で書き戻す（チャンクごとにコミット。月次集計の付け替えも同じトランザクション）
+- ルールで決まらなかった（None）ときは、既存の割り当てを消さない
+  （手で入れた未確定の割り当てを守るため）
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.db import transaction
+
+from transactions.models import Category, Member, Transaction
+from transactions.rules import classify_rows, get_compiled_rules
+from transactions.services.monthly_total_service import apply_deltas, reassign_deltas
+from transactions.services.shop_assignment_service import load_shop_assignments
+from transactions.services.version_service import DATA_VERSION, bump_version_on_commit
+
+
+@dataclass
+class ReclassifyResult:
+    scanned: int = 0
+    changed: int = 0
+    category_changed: int = 0
+    member_changed: int = 0
+    # {"カテゴリ:キーワード": 件数, "メンバー:土日/平日": 件数, ...}（変わった行だけ数える）
+    rule_counts: Counter = field(default_factory=Counter)
+
+
+def _derma_dates(qs, rules) -> set:
+    """未確定の明細のうち、皮膚科がある日付（distinct な正規化店名だけ照合する）"""
+    shops = qs.order_by().values_list("shop_norm", flat=True).distinct()
+    clinic_shops = [s for s in shops.iterator() if rules.is_derm_clinic_hits(rules.hits_normalized(s))]
+    if not clinic_shops:
+        return set()
+    return set(
+        qs.filter(shop_norm__in=clinic_shops)
+        .order_by()
+        .values_list("date", flat=True)
+        .distinct()
+    )
+
+
+def reclassify_open_transactions(
+    queryset=None,
+    *,
+    chunk_size: int = 2000,
+    dry_run: bool = False,
+) -> ReclassifyResult:
+    """
+    queryset: 対象（省略時は全件）。このうち is_closed=False の行だけ触る
+    dry_run: True なら書き込まずに件数だけ数える
+    """
+    qs = (queryset if queryset is not None else Transaction.objects.all()).filter(is_closed=False)
+
+    rules = get_compiled_rules()
+    derma_dates = _derma_dates(qs, rules)
+    category_map = {c.name: c.id for c in Category.objects.all()}
+    member_map = {m.name: m.id for m in Member.objects.all()}
+
+    result = ReclassifyResult()
+
+    def flush(chunk: list[Transaction]) -> None:
+        # 保存済みの正規化店名で照合する（行ごとの正規化はしない）
+        rows = [(t.date, t.shop_norm, t.amount) for t in chunk]
+        learned = load_shop_assignments({t.shop_norm for t in chunk}, normalized=True)
+        classified = classify_rows(rows, derma_dates=derma_dates, learned=learned, rules=rules, normalized=True)
+
+        changed: list[Transaction] = []
+        moved: list[tuple[int | None, int | None, Transaction]] = []  # (変更前のカテゴリ, 変更前のメンバー, 明細)
+        for t, c in zip(chunk, classified):
+            is_changed = False
+            old_cat, old_mem = t.category_id, t.member_id
+
+            new_cat = category_map.get(c.category) if c.category else None
+            if new_cat and new_cat != t.category_id:
+                t.category_id = new_cat
+                result.category_changed += 1
+                result.rule_counts[f"カテゴリ:{c.category_rule}"] += 1
+                is_changed = True
+
+            new_mem = member_map.get(c.member) if c.member else None
+            if new_mem and new_mem != t.member_id:
+                t.member_id = new_mem
+                result.member_changed += 1
+                result.rule_counts[f"メンバー:{c.member_rule}"] += 1
+                is_changed = True
+
+            if is_changed:
+                changed.append(t)
+                moved.append((old_cat, old_mem, t))
+
+        result.scanned += len(chunk)
+        result.changed += len(changed)
+        if changed and not dry_run:
+            with transaction.atomic():
+                Transaction.objects.bulk_update(changed, ["category", "member"], batch_size=1000)
+                apply_deltas(reassign_deltas(moved))
+                bump_version_on_commit(DATA_VERSION)
+
+    chunk: list[Transaction] = []
+    rows_iter = (
+        qs.order_by("id")
+        .only("id", "date", "shop_norm", "amount", "category_id", "member_id", "billing_month", "is_closed")
+        .iterator(chunk_size=chunk_size)
+    )
+    for t in rows_iter:
+        chunk.append(t)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    return result
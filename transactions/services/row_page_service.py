@@ -0,0 +1,56 @@
+# transactions/services/row_page_service.py
+"""
+service：一覧の行をページ単位で返す（keyset / seek ページング）
+
+- 並びは Transaction.Meta.ordering と同じ (-date, -id)。インデックス txn_file_date_idx の順そのまま
+- 次ページは「前ページ最後の行より後ろ」を WHERE で指す（OFFSET は使わない）
+  → 何ページ目でも、月に 100 件でも 5 万件でも、1ページ分だけ読む
+- カーソルは "YYYY-MM-DD.id" の文字列（壊れていたら先頭ページ扱い）
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+
+from django.db.models import Q
+
+PAGE_SIZE = 200
+
+
+@dataclass
+class RowPage:
+    rows: list
+    next_cursor: str | None  # 続きが無ければ None
+    is_first: bool
+
+
+def encode_cursor(t) -> str:
+    return f"{t.date.isoformat()}.{t.pk}"
+
+
+def decode_cursor(raw: str | None) -> tuple[date, int] | None:
+    if not raw:
+        return None
+    d, _, pk = raw.partition(".")
+    try:
+        return date.fromisoformat(d), int(pk)
+    except ValueError:
+        return None
+
+
+def row_page(qs, cursor: str | None = None, *, page_size: int = PAGE_SIZE) -> RowPage:
+    """qs（絞り込み済み）の1ページ分。1件多く読んで続きがあるかを見る"""
+    after = decode_cursor(cursor)
+    if after is not None:
+        d, pk = after
+        qs = qs.filter(Q(date__lt=d) | Q(date=d, id__lt=pk))
+
+    rows = list(qs.order_by("-date", "-id")[:page_size + 1])
+    has_next = len(rows) > page_size
+    rows = rows[:page_size]
+    return RowPage(
+        rows=rows,
+        next_cursor=encode_cursor(rows[-1]) if has_next else None,
+        is_first=after is None,
+    )
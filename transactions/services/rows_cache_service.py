@@ -0,0 +1,53 @@
+# transactions/services/rows_cache_service.py
+"""
+service：一覧の行（_transaction_rows.html の描画結果）のキャッシュ
+
+- ライブ検索は1文字打つ/消すたびに /transactions/rows/ を叩く → 同じ検索語が何度も来る
+- キー = (データのバージョン, 検索語, 編集モード, 全件表示, guest, カーソル)
+  - データのバージョン（DATA_VERSION）は明細の書き込み（取込・一括変更・確定・admin・再分類）と
+    カテゴリ/メンバーの変更でコミット後に +1 される（version_service）
+  - 最新ファイルが変わるのは取込のときだけなので、バージョンに含まれる（キーに入れなくていい）
+- ワーカープロセスごとの LRU（最大 MAX_ENTRIES 件）。バージョンが変わったら中身は全部捨てる
+- ヒットしたときは DB を1回（バージョンの1行）読むだけで、検索も描画もしない
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from transactions.services.version_service import DATA_VERSION, get_version
+
+MAX_ENTRIES = 256
+
+_lock = threading.Lock()
+_cache: OrderedDict[Hashable, str] = OrderedDict()
+_cache_version: int | None = None
+
+
+def cached_rows_html(key: Hashable, build: Callable[[], str]) -> str:
+    """key の描画結果を返す（無ければ build() で作って覚える）"""
+    global _cache_version
+
+    version = get_version(DATA_VERSION)
+    with _lock:
+        if version != _cache_version:
+            _cache.clear()
+            _cache_version = version
+        html = _cache.get(key)
+        if html is not None:
+            _cache.move_to_end(key)
+            return html
+
+    html = build()
+
+    with _lock:
+        # 作っている間にバージョンが進んでいたら覚えない（古い結果を新しいバージョンに混ぜない）
+        if version == _cache_version:
+            _cache[key] = html
+            _cache.move_to_end(key)
+            while len(_cache) > MAX_ENTRIES:
+                _cache.popitem(last=False)
+    return html
+
@@ -0,0 +1,275 @@
+# transactions/services/search_service.py
+"""
+service：一覧の検索（フリーワード1個 → Q）をインデックスで引けるようにする
+
+- 店名・メモ：正規化済みの search_text 1カラムだけを見る（トークンも同じ正規化をかける）
+  店名とメモの間は改行（models.SEARCH_TEXT_SEP）。正規化したトークンに改行は残らないので、境目をまたいでヒットしない
+  - PostgreSQL：search_text LIKE '%x%' → pg_trgm の GIN（txn_search_trgm_idx）で引ける
+  - SQLite：FTS5（trigram）の表を MATCH → rowid を id IN (...) で返す
+    （3文字未満は trigram で引けないので LIKE。FTS 表が無い古い SQLite も LIKE）
+- カテゴリ名・メンバー名・ファイル名：小さい表の側を先に絞って id IN (SELECT ...)（明細側は JOIN しない）
+- フィールド指定（field_q）：1トークン = インデックスで引ける条件1つ（OR で広げない）
+    shop:ライフ / cat:外食 / member:ゆ（cat:未・member:未 は未割当）
+    amount:3000 / amount>=1000 / amount<500 / amount:1000..5000
+    date:2025-04 / date:2025-04-01 / date:2025-04..2025-09（片側だけ: date:2025-04.. / date:..2025-09）
+    is:open / is:closed / is:unassigned
+  値が読めないときは None（呼び出し側で普通のフリーワードとして扱う）
+- FTS 表とトリガーは migration 0017 で作る。SQLite でテーブルを作り直すマイグレーション（AlterField など）は
+  同期トリガーを黙って消すので、migrate のあと（post_migrate）に ensure_fts_triggers で欠けていれば作り直す
+  search_text を SQL で直接いじったあとは rebuild_search_index で作り直す
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import date, timedelta
+
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from transactions.models import Category, ImportFile, Member, Transaction, build_search_text
+from transactions.rules import normalize_shop
+from transactions.services.version_service import DATA_VERSION, bump_version_on_commit
+
+FTS_TABLE = "transactions_transaction_fts"
+FTS_TRIGGERS = tuple(f"{FTS_TABLE}_{suffix}" for suffix in ("ai", "ad", "au"))
+FTS_MIN_CHARS = 3  # trigram なので3文字から
+
+# SQLite に FTS 表があるか（プロセスごとに1回だけ見る）
+_HAS_FTS: bool | None = None
+
+
+def has_fts() -> bool:
+    global _HAS_FTS
+    if connection.vendor != "sqlite":
+        return False
+    if _HAS_FTS is None:
+        _HAS_FTS = FTS_TABLE in connection.introspection.table_names()
+    return _HAS_FTS
+
+
+def _fts_phrase(text: str) -> str:
+    # FTS5 のフレーズ（"..."）。中の " は "" にする
+    return '"' + text.replace('"', '""') + '"'
+
+
+def text_q(token: str) -> Q:
+    """店名・メモの部分一致（全角/半角・大文字小文字・空白の違いは吸収）"""
+    needle = normalize_shop(token)
+    if not needle:
+        return Q()
+    if len(needle) >= FTS_MIN_CHARS and has_fts():
+        return Q(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [_fts_phrase(needle)],
+        ))
+    return Q(search_text__contains=needle)
+
+
+def name_q(token: str) -> Q:
+    """カテゴリ名・メンバー名・ファイル名の部分一致（マスタ側で絞ってから id で当てる）"""
+    return (
+        Q(category_id__in=Category.objects.filter(name__icontains=token).values("id"))
+        | Q(member_id__in=Member.objects.filter(name__icontains=token).values("id"))
+        | Q(import_file_id__in=ImportFile.objects.filter(name__icontains=token).values("id"))
+    )
+
+
+_FIELD_RE = re.compile(r"^(shop|cat|member|amount|date|is)(:|>=|<=|>|<)(.+)$", re.IGNORECASE)
+_UNASSIGNED = ("未", "none", "null")
+
+
+def _parse_int(raw: str) -> int | None:
+    raw = raw.replace(",", "").replace("円", "")
+    return int(raw) if re.fullmatch(r"-?\d+", raw) else None
+
+
+def _parse_day_range(raw: str) -> tuple[date, date] | None:
+    """"2025-04" → [4/1, 5/1)、"2025-04-15" → [4/15, 4/16)（"/" 区切りも可）"""
+    m = re.fullmatch(r"(\d{4})[-/](\d{1,2})(?:[-/](\d{1,2}))?", raw)
+    if not m:
+        return None
+    y, mo = int(m.group(1)), int(m.group(2))
+    try:
+        if m.group(3):
+            start = date(y, mo, int(m.group(3)))
+            return start, start + timedelta(days=1)
+        start = date(y, mo, 1)
+    except ValueError:
+        return None
+    end = date(y + 1, 1, 1) if mo == 12 else date(y, mo + 1, 1)
+    return start, end
+
+
+def _amount_q(op: str, raw: str) -> Q | None:
+    if op == ":" and ".." in raw:
+        lo_raw, _, hi_raw = raw.partition("..")
+        lo = _parse_int(lo_raw) if lo_raw else None
+        hi = _parse_int(hi_raw) if hi_raw else None
+        if (lo_raw and lo is None) or (hi_raw and hi is None) or (lo is None and hi is None):
+            return None
+        q = Q()
+        if lo is not None:
+            q &= Q(amount__gte=lo)
+        if hi is not None:
+            q &= Q(amount__lte=hi)
+        return q
+
+    n = _parse_int(raw)
+    if n is None:
+        return None
+    lookup = {":": "exact", ">=": "gte", "<=": "lte", ">": "gt", "<": "lt"}[op]
+    return Q(**{f"amount__{lookup}": n})
+
+
+def _date_q(op: str, raw: str) -> Q | None:
+    if op != ":":
+        return None
+    if ".." in raw:
+        lo_raw, _, hi_raw = raw.partition("..")
+        lo = _parse_day_range(lo_raw) if lo_raw else None
+        hi = _parse_day_range(hi_raw) if hi_raw else None
+        if (lo_raw and lo is None) or (hi_raw and hi is None) or (lo is None and hi is None):
+            return None
+        q = Q()
+        if lo is not None:
+            q &= Q(date__gte=lo[0])
+        if hi is not None:
+            q &= Q(date__lt=hi[1])  # 終わりの月（日）も含める
+        return q
+
+    day_range = _parse_day_range(raw)
+    if day_range is None:
+        return None
+    return Q(date__gte=day_range[0], date__lt=day_range[1])
+
+
+def field_q(token: str) -> Q | None:
+    """フィールド指定のトークン → Q（フィールド指定でない / 値が読めないときは None）"""
+    m = _FIELD_RE.match(token.strip())
+    if not m:
+        return None
+    field, op, raw = m.group(1).lower(), m.group(2), m.group(3).strip()
+    if not raw:
+        return None
+
+    if field == "amount":
+        return _amount_q(op, raw)
+    if field == "date":
+        return _date_q(op, raw)
+    if op != ":":
+        return None
+
+    if field == "shop":
+        # search_text のインデックスで絞ってから、店名側に入っているかだけ確かめる（メモのヒットは落とす）
+        needle = normalize_shop(raw)
+        return text_q(raw) & Q(shop_norm__contains=needle) if needle else None
+    if field == "cat":
+        if raw.lower() in _UNASSIGNED:
+            return Q(category__isnull=True)
+        return Q(category_id__in=Category.objects.filter(name__icontains=raw).values("id"))
+    if field == "member":
+        if raw.lower() in _UNASSIGNED:
+            return Q(member__isnull=True)
+        return Q(member_id__in=Member.objects.filter(name__icontains=raw).values("id"))
+    if field == "is":
+        value = raw.lower()
+        if value in ("open", "未", "未確定"):
+            return Q(is_closed=False)
+        if value in ("closed", "済", "確定"):
+            return Q(is_closed=True)
+        if value == "unassigned":
+            return Q(category__isnull=True) | Q(member__isnull=True)
+    return None
+
+
+def rebuild_search_index() -> int:
+    """
+    search_text を明細から全部入れ直し、SQLite なら FTS 表とトリガーも作り直す
+    return: 入れ直した明細の件数
+    """
+    global _HAS_FTS
+
+    n = 0
+    with transaction.atomic():
+        batch: list[Transaction] = []
+        for t in Transaction.objects.order_by("id").only("id", "shop", "memo").iterator(chunk_size=2000):
+            t.search_text = build_search_text(t.shop, t.memo)
+            batch.append(t)
+            if len(batch) >= 2000:
+                Transaction.objects.bulk_update(batch, ["search_text"])
+                n += len(batch)
+                batch = []
+        if batch:
+            Transaction.objects.bulk_update(batch, ["search_text"])
+            n += len(batch)
+
+        if connection.vendor == "sqlite" and _sqlite_has_trigram():
+            _install_sqlite_fts(connection)
+        bump_version_on_commit(DATA_VERSION)
+    _HAS_FTS = None
+    return n
+
+
+def ensure_fts_triggers(using: str = "default") -> bool:
+    """
+    SQLite：FTS 表はあるのに同期トリガーが欠けていたら、表ごと作り直して中身も入れ直す
+    （欠けていた間の書き込みは FTS に入っていないので rebuild まで要る）
+    return: 作り直したか
+    """
+    conn = connections[using]
+    if conn.vendor != "sqlite":
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [FTS_TABLE, *FTS_TRIGGERS],
+        )
+        names = {row[0] for row in cursor.fetchall()}
+    if FTS_TABLE not in names or names.issuperset(FTS_TRIGGERS):
+        return False
+    with transaction.atomic(using=using):
+        _install_sqlite_fts(conn)
+    return True
+
+
+def _sqlite_has_trigram() -> bool:
+    """FTS5 の trigram トークナイザがあるか（SQLite 3.34 から）"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE VIRTUAL TABLE temp._fts_probe USING fts5(x, tokenize='trigram')")
+            cursor.execute("DROP TABLE temp._fts_probe")
+    except DatabaseError:
+        return False
+    return True
+
+
+def _install_sqlite_fts(conn) -> None:
+    db_table = Transaction._meta.db_table
+    table = conn.ops.quote_name(db_table)
+    with conn.cursor() as cursor:
+        for trigger in FTS_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"search_text, content='{db_table}', content_rowid='id', tokenize='trigram')"
+        )
+        cursor.execute(f"""
+            CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {table} BEGIN
+                INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {table} BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF search_text ON {table} BEGIN
+                INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+                INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+            END
+        """)
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
@@ -0,0 +1,87 @@
+# transactions/services/shop_assignment_service.py
+"""
+service：確定済み明細から「店名 → カテゴリ/メンバー」を学習する（ShopAssignment）
+
+- 取込時：distinct な店名ぶんだけ1クエリで引いて rules.classify_rows に渡す
+- 確定時：確定した明細の割り当てで上書き（最後に確定したものが勝ち）
+- 再構築：確定済みの全履歴から作り直す（管理コマンド rebuild_shop_assignments）
+"""
+
+from __future__ import annotations
+
+from typing import Iterable
+
+from django.db import transaction
+
+from transactions.models import ShopAssignment, Transaction
+from transactions.rules import LearnedMap, normalize_shop
+
+
+def load_shop_assignments(shops: Iterable[str], *, normalized: bool = False) -> LearnedMap:
+    """
+    店名の集合 → {正規化店名: (カテゴリ名, メンバー名)}（1クエリ）
+    normalized: 渡すのが正規化済みの店名（Transaction.shop_norm）なら True
+    """
+    norms = set(shops) if normalized else {normalize_shop(s) for s in shops}
+    norms.discard("")
+    if not norms:
+        return {}
+
+    rows = (
+        ShopAssignment.objects
+        .filter(shop_norm__in=norms)
+        .values_list("shop_norm", "category__name", "member__name")
+    )
+    return {shop_norm: (cat, mem) for shop_norm, cat, mem in rows}
+
+
+def _collect_latest(qs) -> dict[str, tuple[int | None, int | None]]:
+    """確定済み明細を古い順に流して、正規化店名ごとに最後の割り当てを残す"""
+    latest: dict[str, tuple[int | None, int | None]] = {}
+    rows = (
+        qs.filter(is_closed=True)
+        .order_by("date", "id")
+        .values_list("shop_norm", "category_id", "member_id")
+        .iterator(chunk_size=2000)
+    )
+    for shop_n, category_id, member_id in rows:
+        if shop_n:
+            latest[shop_n] = (category_id, member_id)
+    return latest
+
+
+def _to_objects(latest: dict[str, tuple[int | None, int | None]]) -> list[ShopAssignment]:
+    return [
+        ShopAssignment(shop_norm=shop_n, category_id=cat_id, member_id=mem_id)
+        for shop_n, (cat_id, mem_id) in latest.items()
+    ]
+
+
+def learn_shop_assignments(qs) -> int:
+    """
+    qs（Transaction の QuerySet）のうち確定済みの行で ShopAssignment を上書きする。
+    return: 更新した店名の数
+    """
+    latest = _collect_latest(qs)
+    if not latest:
+        return 0
+
+    ShopAssignment.objects.bulk_create(
+        _to_objects(latest),
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=["shop_norm"],
+        update_fields=["category", "member", "updated_at"],
+    )
+    return len(latest)
+
+
+def rebuild_shop_assignments() -> int:
+    """確定済みの全履歴から ShopAssignment を作り直す。return: 店名の数"""
+    latest = _collect_latest(Transaction.objects.all())
+
+    with transaction.atomic():
+        ShopAssignment.objects.all().delete()
+        ShopAssignment.objects.bulk_create(_to_objects(latest), batch_size=1000)
+
+    return len(latest)
@@ -0,0 +1,56 @@
+# transactions/services/version_service.py
+"""
+service：キャッシュ無効化用のバージョン番号（VersionCounter）
+
+- 書き込み側は bump_version(name) で +1 するだけ
+- 読み込み側は get_version(name) を見て、手元のキャッシュと違えば作り直す
+  （gunicorn のワーカーごとにキャッシュを持っても、次のリクエストで揃う）
+- RULES_VERSION：分類ルール（ClassificationRule）
+- DATA_VERSION：明細とカテゴリ/メンバー名（一覧の行キャッシュ rows_cache_service が見る）
+  → 明細の書き込みはトランザクションが長いこともあるので、コミット後に +1（bump_version_on_commit）
+- data_etag：DATA_VERSION + 画面の条件から ETag を作る（HTML断片の 304 用。クエリも描画も走らせずに判定できる）
+"""
+
+from __future__ import annotations
+
+import hashlib
+
+from django.db import transaction
+from django.db.models import F
+
+from transactions.models import VersionCounter
+
+RULES_VERSION = "rules"
+DATA_VERSION = "data"
+
+
+def get_version(name: str) -> int:
+    value = (
+        VersionCounter.objects
+        .filter(name=name)
+        .values_list("value", flat=True)
+        .first()
+    )
+    return int(value or 0)
+
+
+def bump_version(name: str) -> None:
+    n = VersionCounter.objects.filter(name=name).update(value=F("value") + 1)
+    if not n:
+        obj, created = VersionCounter.objects.get_or_create(name=name, defaults={"value": 1})
+        if not created:
+            VersionCounter.objects.filter(name=name).update(value=F("value") + 1)
+
+
+def bump_version_on_commit(name: str) -> None:
+    """
+    今のトランザクションがコミットされたら +1（トランザクションの外なら今すぐ）
+    取込の間ずっとカウンタの行をロックしない / ロールバックしたら進めない
+    """
+    transaction.on_commit(lambda: bump_version(name))
+
+
+def data_etag(*parts) -> str:
+    """DATA_VERSION と parts（検索語・月・guest など、描画結果を変える条件）から ETag を作る"""
+    raw = "|".join(str(p) for p in (get_version(DATA_VERSION), *parts))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
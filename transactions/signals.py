@@ -0,0 +1,33 @@
+# transactions/signals.py
+from django.db.models.signals import post_delete, post_migrate, post_save
+from django.dispatch import receiver
+
+from members.models import Member
+
+from .models import Category, ClassificationRule
+from .services.search_service import ensure_fts_triggers
+from .services.version_service import DATA_VERSION, RULES_VERSION, bump_version, bump_version_on_commit
+
+
+@receiver(post_save, sender=ClassificationRule)
+@receiver(post_delete, sender=ClassificationRule)
+def _bump_rules_version(sender, **kwargs):
+    # ルールが変わったら各ワーカーのコンパイル済みキャッシュを捨てさせる
+    bump_version(RULES_VERSION)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Member)
+@receiver(post_delete, sender=Member)
+def _bump_data_version(sender, **kwargs):
+    # 一覧の行にはカテゴリ名/メンバー名が出るので、名前が変わったら行キャッシュも捨てさせる
+    bump_version_on_commit(DATA_VERSION)
+
+
+@receiver(post_migrate)
+def _restore_fts_triggers(sender, using="default", **kwargs):
+    # SQLite でテーブルを作り直すマイグレーションは FTS の同期トリガーを消すので、欠けていたら戻す
+    if sender.label != "transactions":
+        return
+    ensure_fts_triggers(using)
@@ -1,2 +1,677 @@
+# transactions/tests.py
+import csv
+import io
+import os
+import tempfile
+from datetime import date, timedelta
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.messages import get_messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.files import File
+from django.forms.models import model_to_dict
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from transactions.management.commands.check_query_plans import _full_scans, _hot_queries
+from transactions.forms import TransactionAdminForm
+from transactions.models import (
+    Category,
+    ClassificationRule,
+    ImportBatch,
+    ImportCheckpoint,
+    ImportFile,
+    ImportJob,
+    Member,
+    MonthlyTotal,
+    MonthSnapshot,
+    Transaction,
+)
+from transactions.rules import classify_rows, compile_rules_from_db
+from transactions.services.csv_import_service import import_uploaded_csv
+from transactions.services.dedup_service import (
+    DuplicateFileError,
+    FingerprintCounter,
+    SpillingFingerprintCounter,
+)
+from transactions.services.month_close_service import close_month, max_single, month_rows, shop_totals
+from transactions.services.monthly_total_service import MonthClosedError, rebuild_monthly_totals
+from transactions.views import _rows_queryset
+from transactions.services.reclassify_service import reclassify_open_transactions
+from transactions.services.row_page_service import decode_cursor, row_page
+from transactions.services import rows_cache_service
+from transactions.services.version_service import DATA_VERSION, bump_version
+from transactions.services.past_csv_service import scan_past_csv, stream_past_csv
+from transactions.services.search_service import field_q, text_q
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    check_query_plans の重いクエリが明細テーブルの全件スキャンにならないこと（EXPLAIN で見る）
+    小さい表だと planner は全件スキャンを選ぶので、
+    SQLite は ANALYZE で統計を入れ、PostgreSQL は enable_seqscan を切って「インデックスで引けるか」だけを見る
+    """
+
+    FILES = 24
+    ROWS_PER_FILE = 400
+
+    @classmethod
+    def setUpTestData(cls):
+        cats = [Category.objects.create(name=n) for n in ("食品・日用品", "外食", "娯楽")]
+        members = [Member.objects.create(name=n) for n in ("な", "ゆ", "共有")]
+        rows = []
+        for i in range(cls.FILES):
+            month = date(2024 + i // 12, i % 12 + 1, 1)
+            f = ImportFile.objects.create(name=f"{month:%Y%m}.csv", billing_month=month)
+            for j in range(cls.ROWS_PER_FILE):
+                rows.append(Transaction(
+                    date=month - timedelta(days=j % 28 + 1),
+                    shop=f"SHOP{j % 50}",
+                    amount=100 + j,
+                    import_file=f,
+                    billing_month=month,
+                    category=cats[j % 3] if j % 7 else None,
+                    member=members[j % 3] if j % 5 else None,
+                    is_closed=j % 4 != 0,
+                    row_fingerprint=f"{i}-{j}",
+                ))
+        Transaction.objects.bulk_create(rows, batch_size=2000)
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("ANALYZE")
+            elif connection.vendor == "postgresql":
+                cursor.execute(f"ANALYZE {Transaction._meta.db_table}")
+                cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def test_hot_queries_use_indexes(self):
+        table = Transaction._meta.db_table
+        latest = ImportFile.objects.order_by("-billing_month", "-id").first()
+        for name, qs in _hot_queries(latest).items():
+            with self.subTest(name):
+                self.assertEqual(_full_scans(qs.explain(), table), [])
+
+
+class RulePriorityTests(TestCase):
+    """DBルールは割り当て先ごとではなく、ルール1件ずつの (優先順, id) で勝ち負けが決まること"""
+
+    def setUp(self):
+        ClassificationRule.objects.update(is_active=False)
+        Kind = ClassificationRule.Kind
+        for kind, keyword, target, priority in (
+            (Kind.CATEGORY, "ランチ", "外食", 0),
+            (Kind.CATEGORY, "サンプル", "食品・日用品", 5),
+            (Kind.CATEGORY, "サンプル商店", "外食", 9),
+            (Kind.MEMBER, "ランチ", "な", 0),
+            (Kind.MEMBER, "サンプル", "ゆ", 1),
+            (Kind.MEMBER, "サンプル商店", "な", 2),
+        ):
+            ClassificationRule.objects.create(kind=kind, keyword=keyword, target=target, priority=priority)
+        self.rules = compile_rules_from_db()
+
+    def test_hit_rule_priority_decides(self):
+        # 「外食」には priority 0 のルールもあるが、ヒットしたのは 9 の方なので 5 の「食品・日用品」が勝つ
+        hits = self.rules.hits("サンプル商店")
+        self.assertEqual(self.rules.category_from_hits(hits), "食品・日用品")
+        self.assertEqual(self.rules.member_from_hits(hits, date(2025, 4, 1)), "ゆ")
+
+    def test_first_rule_still_wins_when_hit(self):
+        hits = self.rules.hits("ランチ サンプル商店")
+        self.assertEqual(self.rules.category_from_hits(hits), "外食")
+        self.assertEqual(self.rules.member_from_hits(hits, date(2025, 4, 1)), "な")
+
+
+class GoldenDbRulesTests(TestCase):
+    """マイグレーションで seed されたDBルールでも、ゴールデン（tools/golden/rules_golden.csv）と1件も違わないこと"""
+
+    GOLDEN_PATH = Path(__file__).resolve().parent.parent / "tools" / "golden" / "rules_golden.csv"
+
+    def test_db_rules_match_golden(self):
+        with self.GOLDEN_PATH.open(newline="", encoding="utf-8") as f:
+            golden = list(csv.DictReader(f))
+        rows = [(date.fromisoformat(r["date"]), r["shop"], int(r["amount"])) for r in golden]
+        expected = [(r["category"] or None, r["member"] or None) for r in golden]
+
+        got = [(c.category, c.member) for c in classify_rows(rows, rules=compile_rules_from_db())]
+        self.assertEqual(got, expected)
+
+
+class UndecodableCsvTests(TestCase):
+    """UTF-8 でも CP932 でも読めないファイルは、読める行だけ入れて読めない行をエラーに数える"""
+
+    def test_replaced_rows_are_errors(self):
+        raw = "日付,店名,金額\n2025-04-02,SHOP,200\n".encode("cp932") + b"2025-04-03,\x82\xa0\x85\x40,300\n"
+        result = import_uploaded_csv(File(io.BytesIO(raw), name="202505.csv"), "202505.csv")
+
+        self.assertEqual(result.decode_errors, "replace")
+        self.assertEqual((result.created, result.errors), (1, 1))
+        self.assertEqual(list(Transaction.objects.values_list("shop", flat=True)), ["SHOP"])
+
+
+class MonthSnapshotNameTests(TestCase):
+    """締めた月はカテゴリ名・メンバー名を締めた時点のまま読む（あとで名前を変えても変わらない）"""
+
+    def setUp(self):
+        self.month = date(2025, 5, 1)
+        self.cat = Category.objects.create(name="外食")
+        self.mem = Member.objects.create(name="な")
+        f = ImportFile.objects.create(name="202505.csv", billing_month=self.month)
+        for i, amount in enumerate((1200, 800)):
+            Transaction.objects.create(
+                date=date(2025, 4, 10 + i), shop="サンプル食堂", amount=amount, import_file=f,
+                billing_month=self.month, category=self.cat, member=self.mem, is_closed=True,
+                row_fingerprint=f"snap-{i}",
+            )
+        close_month(self.month)
+        self.cat.name = "家具・家電"
+        self.cat.save()
+        self.mem.name = "ゆ"
+        self.mem.save()
+
+    def test_month_rows_keep_closed_names(self):
+        rows = month_rows(exclude_keywords=["家具"])
+        self.assertEqual([(r.category, r.member, r.total) for r in rows], [("外食", "な", 2000)])
+
+    def test_exclusion_uses_closed_names(self):
+        self.assertEqual([r["total"] for r in shop_totals(exclude_keywords=["家具"], month=self.month)], [2000])
+        self.assertEqual(max_single(self.month, exclude_keywords=["家具"])["amount"], 1200)
+        self.assertIsNone(max_single(self.month, exclude_keywords=["外食"]))
+
+
+class ImportProgressAccessTests(TestCase):
+    """取込の進捗APIは、ジョブを積んだユーザーにだけ見せる"""
+
+    def setUp(self):
+        User = get_user_model()
+        self.owner = User.objects.create_user("owner", password="pw")
+        self.other = User.objects.create_user("other", password="pw")
+        job = ImportJob.objects.create(file_name="202505.csv", staged_path="/nonexistent.csv", created_by=self.owner)
+        self.url = reverse("transactions:import_progress", args=[job.id])
+
+    def test_owner_sees_progress(self):
+        self.client.force_login(self.owner)
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()["file_name"], "202505.csv")
+
+    def test_other_user_gets_404(self):
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_anonymous_is_redirected_to_login(self):
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class SearchTextBoundaryTests(TestCase):
+    """店名とメモは別々に引けて、店名の終わり〜メモの始まりをまたいだ語ではヒットしない"""
+
+    def setUp(self):
+        f = ImportFile.objects.create(name="202505.csv", billing_month=date(2025, 5, 1))
+        self.t = Transaction.objects.create(
+            date=date(2025, 4, 10), shop="サンプル商店", memo="ランチ会", amount=1000, import_file=f,
+            billing_month=date(2025, 5, 1), row_fingerprint="search-1",
+        )
+
+    def _ids(self, token):
+        return list(Transaction.objects.filter(text_q(token)).values_list("id", flat=True))
+
+    def test_shop_and_memo_hit(self):
+        for token in ("サンプル商店", "ランチ会", "商店", "ﾗﾝﾁ"):
+            with self.subTest(token):
+                self.assertEqual(self._ids(token), [self.t.id])
+
+    def test_no_match_across_boundary(self):
+        for token in ("商店 ランチ", "店 ラ", "店ラ"):
+            with self.subTest(token):
+                self.assertEqual(self._ids(token), [])
+
+
+class BulkAllMatchingTests(TestCase):
+    """一括操作の all_matching=1 は、まだ読み込んでいない続きのページも含めて検索に一致する行すべてに効く"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("owner", password="pw")
+        self.client.force_login(self.user)
+        self.cat = Category.objects.create(name="外食")
+        month = date(2025, 5, 1)
+        f = ImportFile.objects.create(name="202505.csv", billing_month=month)
+        Transaction.objects.bulk_create([
+            Transaction(
+                date=date(2025, 4, 1) + timedelta(days=i % 28), shop="ALPHA MART" if i % 4 else "BETA STORE",
+                amount=100 + i, import_file=f, billing_month=month, row_fingerprint=f"bulk-{i}",
+            )
+            for i in range(320)
+        ])
+        self.url = reverse("transactions:list") + "?edit=1"
+
+    def _post(self, **extra):
+        data = {"bulk_action": "category", "category_id": self.cat.id, "q": "ALPHA", **extra}
+        return self.client.post(self.url, data)
+
+    def test_all_matching_updates_every_matching_row(self):
+        self._post(all_matching="1", selected_ids="")
+        self.assertEqual(Transaction.objects.filter(category=self.cat).count(), 240)
+        self.assertFalse(Transaction.objects.filter(category=self.cat, shop="BETA STORE").exists())
+
+    def test_page_offers_select_all_matching(self):
+        res = self.client.get(self.url + "&q=ALPHA")
+        self.assertContains(res, 'id="selectAllMatching"')
+        self.assertContains(res, 'class="rows-more"')
+
+    def test_selected_ids_only_without_flag(self):
+        ids = list(Transaction.objects.filter(shop="ALPHA MART").order_by("id").values_list("id", flat=True)[:3])
+        self._post(selected_ids=",".join(map(str, ids)))
+        self.assertEqual(sorted(Transaction.objects.filter(category=self.cat).values_list("id", flat=True)), ids)
+
+
+def _csv_file(lines: list[str], name: str) -> File:
+    raw = ("日付,店名,金額\n" + "".join(f"{line}\n" for line in lines)).encode("utf-8")
+    return File(io.BytesIO(raw), name=name)
+
+
+class ReimportDedupTests(TestCase):
+    """期間が重なったCSVを取り込み直しても、同じ明細は2回入らない（同日・同店・同額は何件目かで区別）"""
+
+    FIRST = [
+        "2025-04-01,サンプル食堂,900",
+        "2025-04-01,サンプル食堂,900",  # 同日・同店・同額が2件
+        "2025-04-02,サンプル商店,1500",
+    ]
+
+    def setUp(self):
+        import_uploaded_csv(_csv_file(self.FIRST, "202505.csv"), "202505.csv")
+
+    def test_overlapping_file_inserts_only_new_rows(self):
+        second = self.FIRST + [
+            "2025-04-01,サンプル食堂,900",  # 3件目は新しい明細
+            "2025-04-03,サンプル商店,700",
+        ]
+        result = import_uploaded_csv(_csv_file(second, "202505b.csv"), "202505b.csv")
+
+        self.assertEqual((result.created, result.duplicates), (2, 3))
+        self.assertEqual(Transaction.objects.filter(shop="サンプル食堂", amount=900).count(), 3)
+        self.assertEqual(Transaction.objects.count(), 5)
+
+    def test_same_file_is_rejected(self):
+        with self.assertRaises(DuplicateFileError):
+            import_uploaded_csv(_csv_file(self.FIRST, "202505.csv"), "202505.csv")
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_spilling_counter_matches_in_memory_counter(self):
+        rows = [(date(2025, 4, 1), "A", 100), (date(2025, 4, 1), "A", 100), (date(2025, 4, 2), "B", 200)] * 2
+        counter = FingerprintCounter()
+        expected = [counter(*r) for r in rows]
+        with SpillingFingerprintCounter() as spill:
+            got = spill.batch([("f.csv", *r) for r in rows[:4]]) + spill.batch([("f.csv", *r) for r in rows[4:]])
+        self.assertEqual(got, expected)
+        self.assertEqual(len(set(got)), len(rows))
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class ChunkedResumeTests(TestCase):
+    """import_past_csv --chunk-size が途中で落ちても、ImportCheckpoint の次の行から入れ直して同じ結果になる"""
+
+    CHUNK = 3
+
+    def setUp(self):
+        lines = ["日付,店名・サービス名,金額,メンバー,カテゴリ,ファイル名,確定済みか"]
+        for i in range(10):
+            # 同日・同店・同額の組がチャンクの境目（4行目/5行目）をまたぐ
+            shop, amount = ("サンプル食堂", 900) if i in (2, 3) else (f"SHOP{i}", 100 + i)
+            lines.append(f"2025/04/01,{shop},{amount},な,外食,202505.csv,1")
+        tmp = tempfile.NamedTemporaryFile("w", suffix=".csv", encoding="utf-8", delete=False)
+        with tmp:
+            tmp.write("\n".join(lines) + "\n")
+        self.path = tmp.name
+        self.addCleanup(os.unlink, self.path)
+
+    def _stream(self, progress=None):
+        scan = scan_past_csv(self.path)
+        return stream_past_csv(self.path, scan, {}, {}, chunk_size=self.CHUNK, note=lambda s: None, progress=progress)
+
+    def test_resume_after_interruption(self):
+        def stop_after_two_chunks(result):
+            if result.chunks == 2:
+                raise _Interrupted
+
+        with self.assertRaises(_Interrupted):
+            self._stream(progress=stop_after_two_chunks)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.last_line, checkpoint.row_count), (7, 6))
+        self.assertEqual(Transaction.objects.count(), 6)
+
+        result = self._stream()
+        self.assertEqual((result.resumed_from, result.created, result.duplicates), (7, 10, 0))
+        self.assertFalse(ImportCheckpoint.objects.exists())
+        self.assertEqual(ImportBatch.objects.get().row_count, 10)
+
+        # 落ちずに1回で入れたときと同じ row_fingerprint（「何件目か」を先頭から数え直している）
+        counter = FingerprintCounter()
+        expected = {counter(t.date, t.shop, t.amount) for t in Transaction.objects.order_by("id")}
+        self.assertEqual(set(Transaction.objects.values_list("row_fingerprint", flat=True)), expected)
+        self.assertEqual(Transaction.objects.filter(shop="サンプル食堂").count(), 2)
+
+
+class MonthlyTotalDeltaTests(TestCase):
+    """取込・一括変更・admin の編集/削除で差分を足した MonthlyTotal が、明細からの作り直しと一致する"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("owner", password="pw")
+        self.client.force_login(self.user)
+        self.cat = Category.objects.create(name="外食")
+        self.mem = Member.objects.create(name="な")
+        lines = [f"2025-04-{i % 28 + 1:02d},SHOP{i % 7},{100 + i}" for i in range(40)]
+        import_uploaded_csv(_csv_file(lines, "202505.csv"), "202505.csv")
+        self.model_admin = admin.site._registry[Transaction]
+        self.request = RequestFactory().post("/admin/")
+        self.request.user = self.user
+
+    def assertMatchesRebuild(self):
+        self.assertEqual(rebuild_monthly_totals(dry_run=True).mismatched, 0)
+
+    def _bulk(self, action, ids, **extra):
+        data = {"bulk_action": action, "selected_ids": ",".join(map(str, ids)), **extra}
+        self.client.post(reverse("transactions:list") + "?edit=1", data)
+
+    def test_import(self):
+        self.assertTrue(MonthlyTotal.objects.exists())
+        self.assertMatchesRebuild()
+
+    def test_bulk_edits_and_confirm(self):
+        ids = list(Transaction.objects.order_by("id").values_list("id", flat=True))
+        self._bulk("category", ids[:25], category_id=self.cat.id)
+        self._bulk("member", ids[10:30], member_id=self.mem.id)
+        self._bulk("confirm", ids)
+        self.assertEqual(Transaction.objects.filter(is_closed=True).count(), 15)
+        self.assertMatchesRebuild()
+
+    def test_admin_edit_add_and_delete(self):
+        t = Transaction.objects.order_by("id").first()
+        t.amount = 99999
+        t.category = self.cat
+        t.billing_month = date(2025, 6, 1)  # 別の月に動かす
+        self.model_admin.save_model(self.request, t, None, True)
+        self.assertMatchesRebuild()
+
+        new = Transaction(
+            date=date(2025, 4, 30), shop="SHOPX", amount=500, billing_month=date(2025, 5, 1),
+            import_file=t.import_file, row_fingerprint="admin-new",
+        )
+        self.model_admin.save_model(self.request, new, None, False)
+        self.assertMatchesRebuild()
+
+        self.model_admin.delete_model(self.request, new)
+        self.model_admin.delete_queryset(self.request, Transaction.objects.filter(shop="SHOP3"))
+        self.assertMatchesRebuild()
+
+
+class MonthClosedGuardTests(TestCase):
+    """締めた月の明細は、一覧の一括操作・admin・再分類のどこから触っても変わらない（MonthClosedError）"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser("owner", password="pw")
+        self.client.force_login(self.user)
+        self.month = date(2025, 5, 1)
+        self.cat = Category.objects.create(name="外食")
+        self.mem = Member.objects.create(name="な")
+        lines = [f"2025-04-{i + 1:02d},SHOP{i},{100 + i}" for i in range(5)]
+        import_uploaded_csv(_csv_file(lines, "202505.csv"), "202505.csv")
+        self.ids = list(Transaction.objects.order_by("id").values_list("id", flat=True))
+        self.client.post(reverse("transactions:list") + "?edit=1", {
+            "bulk_action": "category", "selected_ids": ",".join(map(str, self.ids)), "category_id": self.cat.id,
+        })
+        self.client.post(reverse("transactions:list") + "?edit=1", {
+            "bulk_action": "member", "selected_ids": ",".join(map(str, self.ids)), "member_id": self.mem.id,
+        })
+        self.client.post(reverse("transactions:list") + "?edit=1", {
+            "bulk_action": "confirm", "selected_ids": ",".join(map(str, self.ids)),
+        })
+        close_month(self.month)
+        self.other = Category.objects.create(name="娯楽")
+
+    def test_bulk_action_is_rejected(self):
+        res = self.client.post(reverse("transactions:list") + "?edit=1", {
+            "bulk_action": "category", "selected_ids": ",".join(map(str, self.ids)), "category_id": self.other.id,
+        })
+        self.assertIn("締め済みの月は変更できない", " ".join(str(m) for m in get_messages(res.wsgi_request)))
+        self.assertFalse(Transaction.objects.filter(category=self.other).exists())
+
+    def test_admin_form_and_delete_are_rejected(self):
+        t = Transaction.objects.get(pk=self.ids[0])
+        data = {k: "" if v is None else v for k, v in model_to_dict(t).items()}
+        form = TransactionAdminForm(data={**data, "amount": 1}, instance=t)
+        self.assertFalse(form.is_valid())
+        self.assertIn("締め済みの月は変更できない", str(form.non_field_errors()))
+
+        # 一覧の「削除」アクションは行ごとの削除権限（has_delete_permission）で止まる
+        self.client.post(reverse("admin:transactions_transaction_changelist"), {
+            "action": "delete_selected", "_selected_action": self.ids, "post": "yes",
+        })
+        self.assertEqual(Transaction.objects.count(), len(self.ids))
+
+        # delete_queryset まで来ても MonthClosedError をメッセージにして消さない
+        request = RequestFactory().post("/admin/")
+        request.user = self.user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        admin.site._registry[Transaction].delete_queryset(request, Transaction.objects.filter(pk__in=self.ids))
+        self.assertIn("締め済みの月は変更できない", " ".join(str(m) for m in get_messages(request)))
+        self.assertEqual(Transaction.objects.count(), len(self.ids))
+
+    def test_reclassify_is_rejected(self):
+        # 締めた月に未確定の行が紛れ込んでいても（SQL で直接いじった等）、再分類で数字は動かない
+        Transaction.objects.filter(pk=self.ids[0]).update(is_closed=False, category=None)
+        ClassificationRule.objects.create(kind=ClassificationRule.Kind.CATEGORY, keyword="SHOP0", target="娯楽")
+        with self.assertRaises(MonthClosedError):
+            reclassify_open_transactions()
+        self.assertIsNone(Transaction.objects.get(pk=self.ids[0]).category_id)
+        self.assertTrue(MonthSnapshot.objects.filter(month=self.month).exists())
+
+
+class KeysetPageTests(TestCase):
+    """keyset ページングは同じ日付の行がページの境目をまたいでも、抜けも重複もなく (-date, -id) 順に全部返す"""
+
+    def setUp(self):
+        month = date(2025, 5, 1)
+        f = ImportFile.objects.create(name="202505.csv", billing_month=month)
+        # 1日に7件ずつ × 5日。ページは3件なので、ほとんどの境目が同じ日付の中に来る
+        Transaction.objects.bulk_create([
+            Transaction(
+                date=date(2025, 4, 1 + i // 7), shop=f"SHOP{i}", amount=100 + i, import_file=f,
+                billing_month=month, row_fingerprint=f"page-{i}",
+            )
+            for i in range(35)
+        ])
+        self.qs = Transaction.objects.filter(import_file=f)
+
+    def test_pages_cover_every_row_once(self):
+        expected = list(self.qs.order_by("-date", "-id").values_list("id", flat=True))
+        got, cursor, pages = [], None, 0
+        while True:
+            page = row_page(self.qs, cursor, page_size=3)
+            self.assertEqual(page.is_first, cursor is None)
+            got += [t.id for t in page.rows]
+            pages += 1
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(got, expected)
+        self.assertEqual(pages, 12)
+
+    def test_exact_multiple_has_no_empty_last_page(self):
+        page = row_page(self.qs, None, page_size=35)
+        self.assertEqual((len(page.rows), page.next_cursor), (35, None))
+
+    def test_malformed_cursor_is_first_page(self):
+        first = [t.id for t in row_page(self.qs, None, page_size=3).rows]
+        for raw in ("garbage", "2025-13-01.5", "2025-04-01.x", "2025-04-01", ".5", ""):
+            with self.subTest(raw):
+                self.assertIsNone(decode_cursor(raw))
+                page = row_page(self.qs, raw, page_size=3)
+                self.assertTrue(page.is_first)
+                self.assertEqual([t.id for t in page.rows], first)
+
+    def test_rows_view_accepts_malformed_cursor(self):
+        self.client.force_login(get_user_model().objects.create_user("owner", password="pw"))
+        res = self.client.get(reverse("transactions:rows"), {"cursor": "2025-99-99.abc"})
+        self.assertEqual(res.status_code, 200)
+        # 先頭ページとして返す（PAGE_SIZE 未満なので全部。続きの行は無い）
+        self.assertContains(res, "SHOP34")
+        self.assertContains(res, "SHOP0<")
+        self.assertNotContains(res, 'class="rows-more"')
+
+
+class FieldFilterTests(TestCase):
+    """検索窓のフィールド指定（field_q）：範囲・読めない値・フリーワードとの組み合わせ"""
+
+    def setUp(self):
+        month = date(2025, 5, 1)
+        self.file = ImportFile.objects.create(name="202505.csv", billing_month=month)
+        cat = Category.objects.create(name="外食")
+        mem = Member.objects.create(name="ゆ")
+        for i, (d, shop, amount) in enumerate((
+            (date(2025, 3, 31), "ALPHA MART", 500),
+            (date(2025, 4, 1), "ALPHA MART", 1000),
+            (date(2025, 4, 15), "BETA STORE", 3000),
+            (date(2025, 4, 30), "ALPHA CAFE", 5000),
+            (date(2025, 5, 1), "GAMMA", 5001),
+        )):
+            Transaction.objects.create(
+                date=d, shop=shop, amount=amount, import_file=self.file, billing_month=month,
+                category=cat if i % 2 else None, member=mem if i < 3 else None, is_closed=i == 1,
+                memo="ALPHAの帰り" if shop == "GAMMA" else "", row_fingerprint=f"field-{i}",
+            )
+
+    def _amounts(self, q_raw):
+        qs = _rows_queryset(self.file, edit_mode=False, show_all=False, q_raw=q_raw)
+        return sorted(qs.values_list("amount", flat=True))
+
+    def test_ranges(self):
+        cases = {
+            "amount:1000..5000": [1000, 3000, 5000],
+            "amount:..1000": [500, 1000],
+            "amount:5000..": [5000, 5001],
+            "amount>=3000": [3000, 5000, 5001],
+            "amount<1,000": [500],
+            "amount:3000円": [3000],
+            "date:2025-04": [1000, 3000, 5000],
+            "date:2025/04/15": [3000],
+            "date:2025-04..2025-05": [1000, 3000, 5000, 5001],
+            "date:..2025-03": [500],
+            "date:2025-04-30..": [5000, 5001],
+        }
+        for q_raw, expected in cases.items():
+            with self.subTest(q_raw):
+                self.assertEqual(self._amounts(q_raw), expected)
+
+    def test_bad_values_are_not_field_filters(self):
+        for token in (
+            "amount:abc", "amount:..", "amount:1..x", "amount:", "date:2025-13", "date:2025-02-30",
+            "date>=2025-04", "date:x..2025-04", "cat>外食", "is:maybe", "foo:bar", "shop:",
+        ):
+            with self.subTest(token):
+                self.assertIsNone(field_q(token))
+
+    def test_mixed_tokens(self):
+        cases = {
+            "shop:alpha": [500, 1000, 5000],  # メモの ALPHA はヒットしない
+            "alpha": [500, 1000, 5000, 5001],  # フリーワードはメモも見る
+            "shop:ALPHA amount>=1000": [1000, 5000],
+            "shop:ALPHA -amount:500": [1000, 5000],
+            "cat:未 date:2025-04": [3000],
+            "member:未": [5000, 5001],
+            "is:closed": [1000],
+            "is:unassigned -shop:GAMMA": [500, 3000, 5000],
+            "ALPHA -is:open": [1000],
+            "amount:abc": [],  # 読めない値はフリーワード扱い（どこにも無い）
+        }
+        for q_raw, expected in cases.items():
+            with self.subTest(q_raw):
+                self.assertEqual(self._amounts(q_raw), expected)
+
+
+class RowsCacheTests(TestCase):
+    """一覧の行キャッシュは DATA_VERSION が進むまで使い回し、進んだら（コミット後の書き込みで）作り直す"""
+
+    def setUp(self):
+        # キャッシュはプロセスのグローバル。テストごとにDBのバージョンが巻き戻るので、前のテストの分を捨てる
+        with rows_cache_service._lock:
+            rows_cache_service._cache.clear()
+            rows_cache_service._cache_version = None
+
+    def test_hit_until_version_bump(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            return f"html{len(calls)}"
+
+        self.assertEqual(rows_cache_service.cached_rows_html("k", build), "html1")
+        self.assertEqual(rows_cache_service.cached_rows_html("k", build), "html1")
+        self.assertEqual(rows_cache_service.cached_rows_html("other", build), "html2")
+        bump_version(DATA_VERSION)
+        self.assertEqual(rows_cache_service.cached_rows_html("k", build), "html3")
+        self.assertEqual(len(calls), 3)
+
+    def test_result_built_across_a_bump_is_not_stored(self):
+        def build_and_bump():
+            bump_version(DATA_VERSION)
+            return "stale"
+
+        self.assertEqual(rows_cache_service.cached_rows_html("k", build_and_bump), "stale")
+        self.assertEqual(rows_cache_service.cached_rows_html("k", lambda: "fresh"), "fresh")
+
+    def test_bulk_edit_invalidates_rows_view(self):
+        self.client.force_login(get_user_model().objects.create_user("owner", password="pw"))
+        cat = Category.objects.create(name="外食テスト")
+        import_uploaded_csv(_csv_file(["2025-04-01,ALPHA MART,500"], "202505.csv"), "202505.csv")
+        url = reverse("transactions:rows")
+        self.assertNotContains(self.client.get(url, {"q": "ALPHA"}), "外食テスト")
+
+        t = Transaction.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("transactions:list") + "?edit=1", {
+                "bulk_action": "category", "selected_ids": str(t.id), "category_id": cat.id,
+            })
+        self.assertContains(self.client.get(url, {"q": "ALPHA"}), "外食テスト")
+
+
+class RowsEtagTests(TestCase):
+    """行APIは DATA_VERSION と条件から ETag を作り、変わっていなければ 304 を返す"""
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_user("owner", password="pw"))
+        import_uploaded_csv(_csv_file(["2025-04-01,ALPHA MART,500"], "202505.csv"), "202505.csv")
+        self.url = reverse("transactions:rows")
+
+    def test_same_etag_gives_304(self):
+        res = self.client.get(self.url, {"q": "ALPHA"})
+        self.assertEqual(res.status_code, 200)
+        etag = res["ETag"]
+        self.assertIn("private", res["Cache-Control"])
+
+        res = self.client.get(self.url, {"q": "ALPHA"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.content, b"")
+
+    def test_conditions_change_etag(self):
+        etag = self.client.get(self.url, {"q": "ALPHA"})["ETag"]
+        self.assertNotEqual(self.client.get(self.url, {"q": "BETA"})["ETag"], etag)
+        self.assertNotEqual(self.client.get(self.url, {"q": "ALPHA", "all": "1"})["ETag"], etag)
+        res = self.client.get(self.url, {"q": "BETA"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+
+    def test_data_change_gives_new_etag(self):
+        etag = self.client.get(self.url, {"q": "ALPHA"})["ETag"]
+        bump_version(DATA_VERSION)
+
+        res = self.client.get(self.url, {"q": "ALPHA"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
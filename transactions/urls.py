@@ -7,5 +7,6 @@ app_name = "transactions"
 urlpatterns = [
     path("", views.transaction_list, name="list"),
     path("rows/", views.transaction_rows, name="rows"),
+    path("imports/<int:job_id>/progress/", views.import_progress, name="import_progress"),
 ]
 
@@ -1,22 +1,31 @@
 # transactions/views.py
-import csv
-import io
 import re
 import shlex
-from datetime import datetime, date
+from datetime import date, timedelta
 
 from django.contrib import messages
 from django.shortcuts import redirect, render
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_http_methods
 
 from .forms import CSVUploadForm
-from .models import Transaction,Category,Member
-from .rules import guess_category, guess_member, is_derm_clinic
+from .models import Transaction,Category,Member,ImportJob
+from .services.csv_import_service import parse_date as _parse_date
+from .services.import_file_service import latest_import_file
+from .services.import_job_service import enqueue_upload, job_progress
+from .services.monthly_total_service import MonthClosedError, track_monthly_totals
+from .services.row_page_service import row_page
+from .services.rows_cache_service import cached_rows_html
+from .services.search_service import field_q, name_q, text_q
+from .services.shop_assignment_service import learn_shop_assignments
+from .services.version_service import data_etag
 from django.db.models import Q,Sum
+from django.utils import timezone
 
 from django.contrib.auth.decorators import login_required
 
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
 
 from account.utils.guest_utils import is_guest, mask_shop_name
@@ -27,6 +36,8 @@ def _tokenize_query(q: str):
     - スペース区切りでAND（半角・全角対応）
     - "-xxx" は除外
     - "xxx yyy" はフレーズ（shlexが対応）
+    - "field:値" はフィールド指定（shop: / cat: / member: / amount>= / amount:1000..5000 /
+      date:2025-04..2025-09 / is:open など。-付きで除外もできる。中身は search_service.field_q）
     """
     q = (q or "").strip()
     if not q:
@@ -49,28 +60,18 @@ def _tokenize_query(q: str):
             positives.append(p)
     return positives, negatives
 
-def _parse_date(s: str) -> date:
-    s = (s or "").strip()
-    # 例: 2025-11-30 / 2025/11/30 どっちでもOKにする
-    for fmt in ("%Y-%m-%d", "%Y/%m/%d"):
-        try:
-            return datetime.strptime(s, fmt).date()
-        except ValueError:
-            pass
-    raise ValueError(f"日付形式が不正: {s}")
-
 def _build_cond_for_token(token: str, latest_source: str | None):
     token = (token or "").strip()
     if not token:
         return Q()
 
-    cond = (
-        Q(shop__icontains=token)
-        | Q(memo__icontains=token)
-        | Q(source_file__icontains=token)
-        | Q(category__name__icontains=token)
-        | Q(member__name__icontains=token)
-    )
+    # フィールド指定なら、その条件1つだけ（OR で広げない → インデックスで引ける）
+    cond = field_q(token)
+    if cond is not None:
+        return cond
+
+    # 店名・メモは search_text のインデックス、カテゴリ/メンバー/ファイル名はマスタ側で絞る（search_service）
+    cond = text_q(token) | name_q(token)
 
     # IDっぽい
     if token.isdigit():
@@ -119,26 +120,38 @@ def _build_cond_for_token(token: str, latest_source: str | None):
     return cond
 
 
-def _parse_amount(s: str) -> int:
-    s = (s or "").strip()
-    s = s.replace(",", "").replace("円", "")
-    return int(s)
-
-
 def _first_day_of_month(d: date) -> date:
     return d.replace(day=1)
 
-def _decode_csv_bytes(b: bytes) -> str:
-    """
-    CSVの文字コードが UTF-8 / UTF-8(BOM付き) / CP932(Shift_JIS系) どれでも読めるようにする
-    """
-    for enc in ("utf-8-sig", "utf-8", "cp932", "shift_jis"):
-        try:
-            return b.decode(enc)
-        except UnicodeDecodeError:
-            continue
-    # 最後の手段：読めない文字は落として読み進める（ログ用途）
-    return b.decode("cp932", errors="replace")
+
+def _rows_queryset(latest_file, *, edit_mode: bool, show_all: bool, q_raw: str):
+    """一覧・行APIの共通の絞り込み（最新ファイル → 編集モードなら未割当だけ → 検索語）"""
+    if not latest_file:
+        return Transaction.objects.none()
+
+    qs = Transaction.objects.select_related("category", "member").filter(import_file=latest_file)
+
+    # 編集モードONなら、未割当てだけ（カテゴリ or メンバーがNULL）
+    if edit_mode and not show_all:
+        qs = qs.filter(Q(category__isnull=True) | Q(member__isnull=True))
+
+    pos, neg = _tokenize_query(q_raw)
+
+    # AND（posを全部満たす）
+    for t in pos:
+        qs = qs.filter(_build_cond_for_token(t, latest_file.name))
+
+    # NOT（negを除外）
+    for t in neg:
+        qs = qs.exclude(_build_cond_for_token(t, latest_file.name))
+
+    return qs
+
+
+def _mask_shops(rows, guest: bool) -> None:
+    # ===== guest用 店名マスク（表示する1ページ分だけ）=====
+    for t in rows:
+        t.display_shop = mask_shop_name(t.shop) if guest else t.shop
 
 
 @require_http_methods(["GET", "POST"])
@@ -150,26 +163,27 @@ def transaction_list(request):
         edit_mode = False
     show_all = request.GET.get("all") == "1"  # ★追加：最新ファイルを全行表示したい時
 
-    latest_source = (
-        Transaction.objects
-        .exclude(source_file="")
-        .values_list("source_file", flat=True)
-        .distinct()
-    )
-
-    # YYYYMM を数値化して最大を取る
-    latest_source = max(
-        latest_source,
-        key=lambda s: int(s[:6]) if s[:6].isdigit() else -1,
-        default=None,
-    )
+    # 最新ファイル（ImportFile をインデックスで1行だけ引く）
+    latest_file = latest_import_file()
+    latest_source = latest_file.name if latest_file else None
 
 
     # 一括更新（POST）
     if request.method == "POST" and request.POST.get("bulk_action"):
         action = request.POST.get("bulk_action")  # "category" or "member"
-        selected_ids = request.POST.get("selected_ids", "")
-        ids = [int(x) for x in selected_ids.split(",") if x.strip().isdigit()]
+        if request.POST.get("all_matching") == "1":
+            # 「検索に一致する行すべて」：画面に読み込んでいない続きのページも含めて、一覧と同じ条件で引き直す
+            ids = list(
+                _rows_queryset(
+                    latest_file,
+                    edit_mode=edit_mode,
+                    show_all=show_all,
+                    q_raw=(request.POST.get("q") or "").strip(),
+                ).values_list("id", flat=True)
+            )
+        else:
+            selected_ids = request.POST.get("selected_ids", "")
+            ids = [int(x) for x in selected_ids.split(",") if x.strip().isdigit()]
 
         if not ids:
           messages.error(request, "チェックされた行がないよ")
@@ -194,31 +208,42 @@ def transaction_list(request):
             return redirect("account:csv_import")
 
         qs = Transaction.objects.filter(id__in=ids)
-        if latest_source:
-            qs = qs.filter(source_file=latest_source)
-
-        if action == "category":
-            category_id = request.POST.get("category_id")
-            if not category_id:
-                messages.error(request, "カテゴリが未選択だよ")
-            else:
-                n = qs.update(category_id=category_id)
-                messages.success(request, f"カテゴリを {n} 件に適用したよ")
-        elif action == "member":
-            member_id = request.POST.get("member_id")
-            if not member_id:
-                messages.error(request, "メンバーが未選択だよ")
-            else:
-                n = qs.update(member_id=member_id)
-                messages.success(request, f"メンバーを {n} 件に適用したよ")
-        elif action == "confirm":
-            qs2 = qs.filter(
-                category__isnull=False,
-                member__isnull=False,
-                is_closed=False,
-            )
-            updated = qs2.update(is_closed=True)
-            messages.success(request, f"確定にしました：{updated}件")
+        if latest_file:
+            qs = qs.filter(import_file=latest_file)
+
+        try:
+            if action == "category":
+                category_id = request.POST.get("category_id")
+                if not category_id:
+                    messages.error(request, "カテゴリが未選択だよ")
+                else:
+                    with track_monthly_totals(ids):
+                        n = qs.update(category_id=category_id)
+                    messages.success(request, f"カテゴリを {n} 件に適用したよ")
+            elif action == "member":
+                member_id = request.POST.get("member_id")
+                if not member_id:
+                    messages.error(request, "メンバーが未選択だよ")
+                else:
+                    with track_monthly_totals(ids):
+                        n = qs.update(member_id=member_id)
+                    messages.success(request, f"メンバーを {n} 件に適用したよ")
+            elif action == "confirm":
+                qs2 = qs.filter(
+                    category__isnull=False,
+                    member__isnull=False,
+                    is_closed=False,
+                )
+                closing_ids = list(qs2.values_list("id", flat=True))
+                with track_monthly_totals(closing_ids):
+                    updated = Transaction.objects.filter(id__in=closing_ids).update(is_closed=True)
+
+                # 確定した店名の割り当てを学習テーブルに反映
+                learn_shop_assignments(Transaction.objects.filter(id__in=closing_ids))
+                messages.success(request, f"確定にしました：{updated}件")
+        except MonthClosedError as e:
+            # 締めた月の明細は変えない（全部ロールバック済み）
+            messages.error(request, str(e))
 
         q_keep = (request.POST.get("q") or "").strip()
 
@@ -241,141 +266,36 @@ def transaction_list(request):
             return redirect("transactions:list")
 
         f = form.cleaned_data["csv_file"]
-        source_file = getattr(f, "name", "")  # 例: 202601.csv
-
-        created = 0
-        skipped = 0
-        errors = 0
-
-        # 先にカテゴリ/メンバーを全件辞書にしておく（DBアクセスを減らす）
-        category_map = {c.name: c for c in Category.objects.all()}
-        member_map = {m.name: m for m in Member.objects.all()}
-
-        # 1) CSVを一旦パースして溜める + 皮膚科の「同日判定」用に日付を集める
-        parsed_rows = []
-        derm_dates = set()
 
+        # ここではファイルを置いてジョブを積むだけ（取込は run_import_worker がやる）
         try:
-            f.seek(0)
-            raw = f.read()
-            text = _decode_csv_bytes(raw)
-            reader = csv.reader(io.StringIO(text))
-
-            for row_index, row in enumerate(reader, start=1):
-                # 1行目はヘッダ想定（不要なら削除OK）
-                if row_index == 1:
-                    continue
-
-                # 空行スキップ
-                if not row or all((c or "").strip() == "" for c in row):
-                    skipped += 1
-                    continue
-
-                # 左から3列だけ使う（足りなければスキップ）
-                if len(row) < 3:
-                    skipped += 1
-                    continue
-
-                date_str = row[0].strip()
-                shop = row[1].strip()
-                amount_str = row[2].strip()
-
-                if not date_str or not shop or not amount_str:
-                    skipped += 1
-                    continue
-
-                try:
-                    d = _parse_date(date_str)
-                    amount = _parse_amount(amount_str)
-
-                    parsed_rows.append((d, shop, amount))
-
-                    # 皮膚科が同日にあるか判定するため、日付を覚える
-                    if is_derm_clinic(shop):
-                        derm_dates.add(d)
-
-                except Exception as e:
-                    errors += 1
-                    print("IMPORT ERROR:", row_index, row, repr(e))
-
+            job = enqueue_upload(f, request.user)
         except Exception as e:
-            messages.error(request, f"CSVの読み込みで落ちた: {e}")
+            messages.error(request, f"CSVの受け付けで落ちた: {e}")
             return redirect("transactions:list")
 
-
-        # 2) ルールでカテゴリ/メンバーを割り当てて一括INSERT
-        to_create = []
-
-        for d, shop, amount in parsed_rows:
-            category_name = guess_category(shop)
-            category_obj = category_map.get(category_name) if category_name else None
-
-            member_name = guess_member(shop, d, derm_dates)
-            member_obj = member_map.get(member_name) if member_name else None
-
-            to_create.append(
-                Transaction(
-                    date=d,
-                    shop=shop,
-                    amount=amount,
-                    memo="",
-                    source_file=source_file,
-                    category=category_obj,
-                    member=member_obj,
-                    is_closed=False,
-                )
-            )
-
-        if to_create:
-            Transaction.objects.bulk_create(to_create, batch_size=1000)
-            created = len(to_create)
-
-
-    
-        messages.success(
-            request,
-            f"CSV取り込み完了！ 追加 {created} / スキップ {skipped} / エラー {errors}"
-        )
+        messages.success(request, f"CSVを受け付けたよ：{job.file_name}（取り込みはバックグラウンドで進みます）")
         return redirect("transactions:list")
 
     # GET
     form = CSVUploadForm()
 
-    qs = (
-        Transaction.objects
-        .select_related("category", "member")
-    )
-
-    if latest_source:
-        qs = qs.filter(source_file=latest_source)
-    else:
-        qs = Transaction.objects.none()
-
-    # 編集モードONなら、未割当てだけ（カテゴリ or メンバーがNULL）
-    if edit_mode and not show_all:
-        qs = qs.filter(Q(category__isnull=True) | Q(member__isnull=True))
-
     q_raw = (request.GET.get("q") or "").strip()
-    pos, neg = _tokenize_query(q_raw)
-
-    # AND（posを全部満たす）
-    for t in pos:
-        qs = qs.filter(_build_cond_for_token(t, latest_source))
-
-    # NOT（negを除外）
-    for t in neg:
-        qs = qs.exclude(_build_cond_for_token(t, latest_source))
+    qs = _rows_queryset(latest_file, edit_mode=edit_mode, show_all=show_all, q_raw=q_raw)
 
-    transactions = qs
-
-    # ===== guest用 店名マスク =====
-    guest = is_guest(request.user)
-    for t in transactions:
-        t.display_shop = mask_shop_name(t.shop) if guest else t.shop
+    # 最初の1ページだけ描く（続きはスクロールで /transactions/rows/?cursor=... を足していく）
+    page = row_page(qs)
+    _mask_shops(page.rows, is_guest(request.user))
 
     categories = Category.objects.all().order_by("id")
     members = Member.objects.all().order_by("id")
 
+    # ===== 取込ジョブ（自分が積んだもののうち、進行中 ＋ 少し前に終わったもの）=====
+    import_jobs = ImportJob.objects.filter(created_by=request.user).filter(
+        Q(status__in=[ImportJob.Status.QUEUED, ImportJob.Status.RUNNING])
+        | Q(finished_at__gte=timezone.now() - timedelta(minutes=10))
+    )[:5]
+
     # ===== 簡易サマリ（最新ファイル×確定済みだけ）=====
     summary = {
         "n_total": 0,
@@ -393,9 +313,9 @@ def transaction_list(request):
         "transfer_y": 0,
     }
 
-    if latest_source:
+    if latest_file:
         base_qs = Transaction.objects.filter(
-            source_file=latest_source,
+            import_file=latest_file,
             is_closed=True,
         )
 
@@ -439,7 +359,9 @@ def transaction_list(request):
         request,
         "transactions/transaction_list.html",
         {
-            "transactions": transactions,
+            "transactions": page.rows,
+            "next_cursor": page.next_cursor,
+            "is_first_page": True,
             "upload_form": form,
             "edit_mode": edit_mode,
             "show_all": show_all,
@@ -447,60 +369,58 @@ def transaction_list(request):
             "categories": categories,
             "members": members,
             "summary": summary,
+            "import_jobs": import_jobs,
         },
     )
 
-@login_required
-def transaction_rows(request):
-    # ここは transaction_list の GET 部分と同じ条件で qs を作るだけ
-    edit_mode = request.GET.get("edit") == "1"
-    if is_guest(request.user):
-        edit_mode = False
+def _rows_params(request) -> tuple[str, bool, bool, bool, str]:
+    """行APIの描画結果を決める条件：(検索語, 編集モード, 全件表示, guest, カーソル)"""
+    guest = is_guest(request.user)
+    edit_mode = request.GET.get("edit") == "1" and not guest
     show_all = request.GET.get("all") == "1"
-
-    latest_source = (
-        Transaction.objects
-        .exclude(source_file="")
-        .values_list("source_file", flat=True)
-        .distinct()
-    )
-
-    latest_source = max(
-        latest_source,
-        key=lambda s: int(s[:6]) if s[:6].isdigit() else -1,
-        default=None,
-    )
+    q_raw = (request.GET.get("q") or "").strip()
+    cursor = request.GET.get("cursor") or ""
+    return q_raw, edit_mode, show_all, guest, cursor
 
 
-    qs = Transaction.objects.select_related("category", "member")
-    if latest_source:
-        qs = qs.filter(source_file=latest_source)
-    else:
-        qs = Transaction.objects.none()
+def _rows_etag(request) -> str:
+    # データのバージョン + 条件。変わっていなければ 304（検索も描画もしない）
+    return data_etag("rows", *_rows_params(request))
 
-    if edit_mode and not show_all:
-        qs = qs.filter(Q(category__isnull=True) | Q(member__isnull=True))
 
-    q_raw = (request.GET.get("q") or "").strip()
-    pos, neg = _tokenize_query(q_raw)
-
-    for t in pos:
-        qs = qs.filter(_build_cond_for_token(t, latest_source))
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_rows_etag)
+def transaction_rows(request):
+    # ここは transaction_list の GET 部分と同じ条件で qs を作る（cursor があればその続きのページ）
+    q_raw, edit_mode, show_all, guest, cursor = _rows_params(request)
+
+    def build() -> str:
+        # 最新ファイル（ImportFile をインデックスで1行だけ引く）
+        latest_file = latest_import_file()
+        qs = _rows_queryset(latest_file, edit_mode=edit_mode, show_all=show_all, q_raw=q_raw)
+
+        page = row_page(qs, cursor)
+        _mask_shops(page.rows, guest)
+
+        return render_to_string(
+            "transactions/_transaction_rows.html",
+            {
+                "transactions": page.rows,
+                "next_cursor": page.next_cursor,
+                "is_first_page": page.is_first,
+                "edit_mode": edit_mode,
+            },
+            request=request
+        )
 
-    for t in neg:
-        qs = qs.exclude(_build_cond_for_token(t, latest_source))
+    # 同じ条件なら、データが変わっていない限り前回の描画結果をそのまま返す（rows_cache_service）
+    html = cached_rows_html(_rows_params(request), build)
+    return HttpResponse(html)
 
-    # ===== guest用 店名マスク =====
-    guest = is_guest(request.user)
-    for t in qs:
-        t.display_shop = mask_shop_name(t.shop) if guest else t.shop
 
-    html = render_to_string(
-        "transactions/_transaction_rows.html",
-        {
-            "transactions": qs,
-            "edit_mode": edit_mode,
-        },
-        request=request
-    )
-    return HttpResponse(html)
+@login_required
+def import_progress(request, job_id: int):
+    # 一覧画面のJSがポーリングする進捗API（他のユーザーが積んだジョブは 404）
+    job = get_object_or_404(ImportJob, pk=job_id, created_by=request.user)
+    return JsonResponse(job_progress(job))